@@ -1,31 +1,28 @@
 from fastapi import APIRouter, Request, Depends, BackgroundTasks, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from sqlalchemy.orm import Session
-import os
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import datetime
 from pydantic import BaseModel # <-- THÊM IMPORT
 from math import sin, cos, sqrt, atan2, radians # <-- THÊM IMPORT
 
 from ..db.session import get_db
 from ..db.models import User, AttendanceRecord, ServiceRecord, Branch, Department, AttendanceLog
-from ..core.security import get_csrf_token, require_checked_in_user, validate_csrf
+from ..core.security import get_csrf_token, require_checked_in_user, validate_csrf, mark_checked_in, get_active_branch, get_user_context
 from ..core.utils import get_current_work_shift, VN_TZ, format_datetime_display
 # SỬA DÒNG DƯỚI ĐỂ IMPORT TỌA ĐỘ
-from ..core.config import logger, ROLE_MAP, BRANCHES, BRANCH_COORDINATES
+from ..core.config import logger, ROLE_MAP, BRANCHES
+from ..services.branch_locator_service import branch_locator
+from ..core.pubsub import publish, qr_checkin_channel
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import cast, Date, select, or_, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import joinedload
 
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
 
 # === BẮT ĐẦU CODE THÊM MỚI ===
 
@@ -67,13 +64,7 @@ def attendance_ui(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse("/login", status_code=303)
     
     # ... (Logic lấy active_branch giữ nguyên) ...
-    active_branch = request.session.get("active_branch")
-    if not active_branch:
-        user_from_db = db.query(User).filter(User.id == user_data.get("id")).first()
-        if user_from_db and user_from_db.last_active_branch:
-            active_branch = user_from_db.last_active_branch
-        else:
-            active_branch = user_data.get("branch", "")
+    active_branch = get_active_branch(request, db, user_data) or ""
     
     csrf_token = get_csrf_token(request)
 
@@ -105,10 +96,8 @@ async def detect_branch(
     user_data = request.session.get("user") or request.session.get("pending_user")
     user_in_db = None
     if user_data:
-        # TỐI ƯU: Load sẵn main_branch để dùng
-        user_in_db = db.query(User).options(
-            joinedload(User.main_branch)
-        ).filter(User.employee_code == user_data["code"]).first()
+        # TỐI ƯU: Dùng chung context của request (đã load sẵn main_branch)
+        user_in_db = get_user_context(request, db, user_data).user
 
     # ===============================
     # 1. Role đặc biệt → bỏ qua GPS
@@ -143,13 +132,9 @@ async def detect_branch(
             status_code=400,
         )
 
-    # Tìm chi nhánh trong bán kính 200m
-    nearby_branches = []
-    # SỬA: Dùng biến BRANCH_COORDINATES đã import từ config.py
-    for branch, coords in BRANCH_COORDINATES.items():
-        dist = haversine(lat, lng, coords[0], coords[1])
-        if dist <= 0.2:  # trong 200m
-            nearby_branches.append((branch, dist))
+    # Tìm chi nhánh trong bán kính điểm danh (mặc định 200m, có thể cấu hình riêng từng chi nhánh)
+    # TỐI ƯU: Tra cứu vector hóa trên tọa độ chi nhánh đã nạp sẵn từ DB, kết quả đã sắp xếp gần nhất trước
+    nearby_branches = branch_locator.nearby(lat, lng)
 
     if not nearby_branches:
         return JSONResponse(
@@ -160,7 +145,7 @@ async def detect_branch(
     if len(nearby_branches) > 1:
         choices = [
             {"branch": b, "distance_km": round(d, 3)}
-            for b, d in sorted(nearby_branches, key=lambda x: x[1])
+            for b, d in nearby_branches
         ]
         return {"choices": choices}
 
@@ -191,14 +176,14 @@ async def select_branch(
     chosen_branch = payload.branch
     
     # Kiểm tra xem chi nhánh có hợp lệ không
-    if chosen_branch not in BRANCH_COORDINATES:
+    if not branch_locator.has_branch(chosen_branch):
          raise HTTPException(status_code=400, detail="Chi nhánh không hợp lệ.")
 
     # Lưu vào session
     request.session["active_branch"] = chosen_branch
     
     # Lưu vào DB
-    user_in_db = db.query(User).filter(User.employee_code == user_data["code"]).first()
+    user_in_db = get_user_context(request, db, user_data).user
     if user_in_db:
         user_in_db.last_active_branch = chosen_branch
         db.commit()
@@ -387,6 +372,13 @@ def search_employees(
     return JSONResponse(content=employee_list)
 
 
+def _get_attendance_slot(shift_name: str, is_overtime: bool) -> str:
+    """
+    Xác định 'slot' điểm danh trong một ngày làm việc, dùng cho ràng buộc chống trùng.
+    Mỗi ca (ngày/đêm) là một slot; tăng ca được tính là slot riêng để vẫn chấm được thêm.
+    """
+    return f"{shift_name} - TC" if is_overtime else shift_name
+
 # ... (API /checkin_bulk giữ nguyên như file của bạn) ...
 #
 @router.post("/checkin_bulk")
@@ -399,7 +391,7 @@ async def attendance_checkin_bulk(
     if not session_user:
         raise HTTPException(status_code=403, detail="Không có quyền điểm danh.")
     
-    checker = db.query(User).filter(User.employee_code == session_user["code"]).first()
+    checker = get_user_context(request, db, session_user).user
     if not checker:
         raise HTTPException(status_code=403, detail="Không tìm thấy người dùng thực hiện điểm danh.")
 
@@ -425,29 +417,32 @@ async def attendance_checkin_bulk(
         ).filter(User.employee_code.in_(employee_codes)).all()
         employee_map = {emp.employee_code: emp for emp in employees_in_db}
         
-        new_records = []
         now_vn = datetime.now(VN_TZ)
-        
-        # --- LỌC TRÙNG LẶP (DUPLICATE) ---
-        target_user_ids = [employee_map[rec.get("ma_nv")].id for rec in raw_data if rec.get("ma_nv") in employee_map]
-        recent_records = db.query(AttendanceRecord.user_id).filter(
-            AttendanceRecord.user_id.in_(target_user_ids),
-            AttendanceRecord.attendance_datetime >= (now_vn - timedelta(minutes=2))
-        ).all()
-        recently_checked_ids = {r[0] for r in recent_records}
+        work_date, shift_name = get_current_work_shift()
 
-        # Danh sách ID những người thực sự được insert đợt này
-        inserted_user_ids = set()
+        # --- CHUẨN BỊ CÁC DÒNG INSERT ---
+        # SỬA: Bỏ bước kiểm tra "đã chấm trong 2 phút" (có thể bị 2 thiết bị gửi đồng thời vượt qua).
+        # Việc chống trùng giờ do ràng buộc UNIQUE (user_id, work_date, checker_id, shift_slot) đảm nhận.
+        # Khóa (user_id, shift_slot): ca thường và tăng ca ("... - TC") của cùng nhân viên là hai bản ghi riêng
+        rows_by_key = {}
+        skipped = []
 
         for rec in raw_data:
             ma_nv = rec.get("ma_nv")
             employee_snapshot = employee_map.get(ma_nv)
-            if not employee_snapshot: continue
-
-            # Nếu vừa chấm xong -> Bỏ qua
-            if employee_snapshot.id in recently_checked_ids: continue 
-
-            new_records.append(AttendanceRecord(
+            if not employee_snapshot:
+                if ma_nv:
+                    skipped.append({"ma_nv": ma_nv, "reason": "not_found"})
+                continue
+
+            is_overtime = bool(rec.get("la_tang_ca", False))
+            shift_slot = _get_attendance_slot(shift_name, is_overtime)
+            # Trùng nhân viên + ca trong cùng một lần gửi -> Bỏ qua
+            if (employee_snapshot.id, shift_slot) in rows_by_key:
+                skipped.append({"ma_nv": ma_nv, "reason": "duplicate"})
+                continue
+
+            rows_by_key[(employee_snapshot.id, shift_slot)] = dict(
                 user_id=employee_snapshot.id,
                 checker_id=checker.id,
                 branch_id=branch_id_lam,
@@ -457,17 +452,18 @@ async def attendance_checkin_bulk(
                 main_branch_snapshot=employee_snapshot.main_branch.branch_code if employee_snapshot.main_branch else None,
                 attendance_datetime=now_vn,
                 work_units=float(rec.get("so_cong_nv", 1.0)),
-                is_overtime=bool(rec.get("la_tang_ca", False)),
-                notes=rec.get("ghi_chu", "")
-            ))
-            recently_checked_ids.add(employee_snapshot.id)
-            inserted_user_ids.add(employee_snapshot.id)
+                is_overtime=is_overtime,
+                notes=rec.get("ghi_chu", ""),
+                work_date=work_date,
+                shift_slot=shift_slot
+            )
 
         # === [FIX QUAN TRỌNG] TỰ ĐỘNG THÊM VÉ CHO CHECKER (QL01/KTV) NẾU THIẾU ===
         # Nếu đang ở chế độ chờ (pending) VÀ bản thân Checker chưa có trong danh sách vừa tạo
         is_pending = request.session.get("pending_user")
-        if is_pending and (checker.id not in inserted_user_ids) and (checker.id not in recently_checked_ids):
-             self_record = AttendanceRecord(
+        checker_slot = _get_attendance_slot(shift_name, False)
+        if is_pending and not any(user_id == checker.id for user_id, _ in rows_by_key):
+            rows_by_key[(checker.id, checker_slot)] = dict(
                 user_id=checker.id,
                 checker_id=checker.id,
                 branch_id=branch_id_lam,
@@ -478,15 +474,28 @@ async def attendance_checkin_bulk(
                 attendance_datetime=now_vn,
                 work_units=1.0,
                 is_overtime=False,
-                notes="Tự động điểm danh (Checker)"
+                notes="Tự động điểm danh (Checker)",
+                work_date=work_date,
+                shift_slot=checker_slot
             )
-             new_records.append(self_record)
-             inserted_user_ids.add(checker.id) # Đánh dấu đã có vé
 
-        if new_records:
-            db.add_all(new_records)
+        # --- INSERT 1 LẦN DUY NHẤT, TRÙNG THÌ BỎ QUA (ON CONFLICT DO NOTHING) ---
+        inserted_keys = set()
+        if rows_by_key:
+            insert_stmt = pg_insert(AttendanceRecord).values(list(rows_by_key.values()))
+            insert_stmt = insert_stmt.on_conflict_do_nothing().returning(AttendanceRecord.user_id, AttendanceRecord.shift_slot)
+            inserted_keys = {(user_id, shift_slot) for user_id, shift_slot in db.execute(insert_stmt).all()}
             db.commit()
-        
+
+        inserted = []
+        for key, row in rows_by_key.items():
+            if key in inserted_keys:
+                inserted.append(row["employee_code_snapshot"])
+            else:
+                # Đã có bản ghi cùng ngày làm việc / người chấm / ca (kể cả do thiết bị khác vừa gửi)
+                skipped.append({"ma_nv": row["employee_code_snapshot"], "reason": "already_checked_in"})
+        result_summary = {"inserted": len(inserted), "inserted_codes": inserted, "skipped": skipped}
+
         # === [XỬ LÝ TRẠNG THÁI ĐĂNG NHẬP] ===
         if request.session.get("pending_user"):
             token = raw_data[0].get("token")
@@ -509,6 +518,11 @@ async def attendance_checkin_bulk(
             if log and not log.checked_in:
                 log.checked_in = True
                 db.commit() # Lưu vào DB để lần sau đăng nhập lại hệ thống biết là "Đã check-in"
+            if log and log.checked_in:
+                mark_checked_in(request, log.user_id, log.work_date)
+                # Báo ngay cho trang show_qr (máy tính) đang chờ token này
+                if log.token:
+                    publish(qr_checkin_channel(log.token), {"checked_in": True})
             
             # Chuyển Session từ Pending -> User chính thức
             request.session["user"] = session_user
@@ -517,11 +531,11 @@ async def attendance_checkin_bulk(
             
             return {
                 "status": "success", 
-                "inserted": len(new_records), 
+                **result_summary,
                 "redirect_to": str(request.url_for('choose_function'))
             }
 
-        return {"status": "success", "inserted": len(new_records)}
+        return {"status": "success", **result_summary}
 
     except SQLAlchemyError as e:
         db.rollback()
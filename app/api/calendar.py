@@ -1,14 +1,10 @@
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
-import os
 from collections import defaultdict, OrderedDict
 from typing import Optional
 import calendar
 import io
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 
 from datetime import datetime, date, timedelta
 
@@ -20,16 +16,10 @@ from ..core.config import ROLE_MAP
 from sqlalchemy import cast, Date
 from sqlalchemy.orm import joinedload
 
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
-
 
 @router.get("/calendar-view", response_class=HTMLResponse)
 def view_attendance_calendar(
@@ -506,6 +496,10 @@ def export_attendance_calendar_excel(
             day_entry["main_work"] += work_units
 
     # === 4. TẠO FILE EXCEL VỚI OPENPYXL ===
+    # TỐI ƯU: import khi xuất file (hiếm dùng) để không làm chậm khởi động và tốn RAM ở mọi worker
+    import openpyxl
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
 
     wb = openpyxl.Workbook()
     ws = wb.active
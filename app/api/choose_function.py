@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 from sqlalchemy.orm import Session
 
 from ..db.session import get_db
 from ..core.security import require_checked_in_user
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/choose-function", response_class=HTMLResponse)
 async def choose_function(request: Request, db: Session = Depends(get_db)):
@@ -2,8 +2,6 @@ from fastapi import APIRouter, Request, Depends, HTTPException, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import io
-import openpyxl
-from openpyxl.utils import get_column_letter
 from datetime import datetime
 from urllib.parse import quote
 
@@ -11,6 +9,7 @@ from ..db.session import get_db
 from ..db.models import Task
 from ..core.utils import VN_TZ, format_datetime_display
 from ..core.config import logger
+from ..services.task_service import effective_task_status
 
 # Import các hàm query đã được module hóa
 from .tasks import _get_filtered_tasks_query
@@ -18,8 +17,14 @@ from .results import _get_filtered_records_query
 
 router = APIRouter()
 
+def _new_workbook():
+    """TỐI ƯU: openpyxl chỉ được import khi thực sự xuất file, không nạp sẵn ở mọi worker."""
+    import openpyxl
+    return openpyxl.Workbook()
+
 def _auto_adjust_worksheet_columns(worksheet):
     """Helper function to adjust column widths of a worksheet."""
+    from openpyxl.utils import get_column_letter
     for i, column_cells in enumerate(worksheet.columns, 1):
         max_length = 0
         column_letter = get_column_letter(i)
@@ -56,6 +61,7 @@ async def export_tasks_to_excel(
     if not rows_all:
         return Response(status_code=204, content="Không có dữ liệu để xuất.")
 
+    now = datetime.now(VN_TZ)
     data_for_export = [{
         "ID": t.id,
         "Chi Nhánh": t.branch.name if t.branch else '',
@@ -63,7 +69,7 @@ async def export_tasks_to_excel(
         "Mô Tả": t.description,
         "Ngày Tạo": format_datetime_display(t.created_at, with_time=True),
         "Hạn Hoàn Thành": format_datetime_display(t.due_date, with_time=False),
-        "Trạng Thái": t.status,
+        "Trạng Thái": effective_task_status(t.status, t.due_date, now),
         "Người Tạo": t.author.name if t.author else '',
         "Người Thực Hiện": t.assignee.name if t.assignee else '',
         "Ngày Hoàn Thành": format_datetime_display(t.completed_at, with_time=True) if t.completed_at else "",
@@ -71,7 +77,7 @@ async def export_tasks_to_excel(
     } for t in rows_all]
 
     output = io.BytesIO()
-    wb = openpyxl.Workbook()
+    wb = _new_workbook()
     ws = wb.active
     ws.title = "CongViec"
 
@@ -114,7 +120,7 @@ async def export_attendance_to_excel(request: Request, db: Session = Depends(get
         return Response(status_code=204, content="Không có dữ liệu để xuất.")
 
     output = io.BytesIO()
-    wb = openpyxl.Workbook()
+    wb = _new_workbook()
     ws = wb.active
     ws.title = "DiemDanh"
 
@@ -0,0 +1,55 @@
+# app/api/live_feed.py
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from ..db.session import AsyncSessionLocal
+from ..core.security import get_active_branch_async
+from ..core.pubsub import broker
+from ..core.config import logger
+from ..services.live_feed_service import branch_channel, delta_for_role
+
+router = APIRouter()
+
+# Gửi ping định kỳ để giữ kết nối qua proxy và phát hiện client đã ngắt
+LIVE_FEED_KEEPALIVE_SECONDS = 25
+
+
+async def _can_watch_branch(websocket: WebSocket, user_data: dict, branch_code: str) -> bool:
+    """Lễ tân chỉ được theo dõi chi nhánh đang làm việc; các vai trò khác theo dõi mọi chi nhánh."""
+    if user_data.get("role") != "letan":
+        return True
+    active_branch = websocket.session.get("active_branch")
+    if not active_branch:
+        # AsyncSession: không chặn event loop trong handler WebSocket
+        async with AsyncSessionLocal() as db:
+            active_branch = await get_active_branch_async(websocket, db, user_data)
+    return active_branch == branch_code
+
+
+@router.websocket("/ws/branches/{branch_code}")
+async def branch_live_feed(websocket: WebSocket, branch_code: str):
+    """
+    Luồng delta trực tiếp của một chi nhánh cho trang Báo cáo ca và Công việc.
+    Mỗi tin nhắn có dạng {"resource", "action", "ids", "items"}; client tự cập nhật danh sách theo id.
+    Đóng với mã 1008 khi không có quyền (client không kết nối lại).
+    """
+    user_data = websocket.session.get("user")
+    if not user_data:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if not await _can_watch_branch(websocket, user_data, branch_code):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    try:
+        async with broker.subscribe(branch_channel(branch_code)) as subscription:
+            while True:
+                message = await subscription.get(timeout=LIVE_FEED_KEEPALIVE_SECONDS)
+                if message is None:
+                    await websocket.send_json({"type": "ping"})
+                    continue
+                await websocket.send_json(delta_for_role(message, user_data.get("role")))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"[LIVE_FEED] Lỗi WebSocket chi nhánh {branch_code}: {e}", exc_info=True)
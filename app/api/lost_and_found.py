@@ -3,20 +3,21 @@
 
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import math
 
 # Import từ các module đã tái cấu trúc
-from ..db.session import get_db
+from ..db.session import get_db, get_async_db
 from ..db.models import User, LostAndFoundItem, Branch, Department, LostItemStatus
-from ..core.security import get_active_branch
+from ..core.security import get_active_branch, get_active_branch_async
 from ..core.config import logger, STATUS_MAP, BRANCHES
 from ..core.utils import VN_TZ
 
-from ..services.lost_and_found_service import update_disposable_items_status
+from ..services.lost_and_found_service import DISPOSABLE_SWEEP_JOB
+from ..services.job_queue import enqueue
 # --- IMPORT CÁC SCHEMAS ---
 from ..schemas.lost_and_found import (
     LostItemCreate, LostItemUpdate, BatchDeleteLostItemsPayload,
@@ -24,17 +25,12 @@ from ..schemas.lost_and_found import (
 )
 
 # Import các thành phần SQLAlchemy cần thiết
-from sqlalchemy import cast, Date, desc, or_, asc, case, func, tuple_
+from sqlalchemy import cast, Date, desc, or_, asc, case, func, tuple_, select, Select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.encoders import jsonable_encoder
-import os
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
 
 def map_status_to_vietnamese(status_value: Optional[str]) -> str:
     """Helper to map status enum value to Vietnamese string."""
@@ -59,8 +55,7 @@ def _serialize_item(item: LostAndFoundItem) -> dict:
     item_details.status = map_status_to_vietnamese(item.status.value if item.status else None)
     return jsonable_encoder(item_details)
 
-def _get_filtered_lost_items(
-    db: Session,
+def _build_lost_items_query(
     user_data: dict,
     per_page: int,
     search: Optional[str] = None,
@@ -73,21 +68,15 @@ def _get_filtered_lost_items(
     last_id: Optional[int] = None,
     page: Optional[int] = 1, # Giữ lại để tải trang đầu tiên
     active_branch_for_letan: Optional[str] = None
-) -> (List[LostAndFoundItem], int):
+) -> Tuple[Select, Select]:
     """
-    Hàm dịch vụ để lấy danh sách các món đồ thất lạc đã được lọc và phân trang.
-    Hàm này đóng gói tất cả logic truy vấn để tái sử dụng.
+    Xây dựng câu lệnh lấy danh sách đồ thất lạc đã lọc + phân trang và câu lệnh đếm tổng số.
+    SỬA: Chỉ dựng `select()` (không chạy), để dùng chung cho Session sync và AsyncSession.
     """
-    query = db.query(LostAndFoundItem).options(
-        joinedload(LostAndFoundItem.branch),
-        joinedload(LostAndFoundItem.reporter),
-        joinedload(LostAndFoundItem.recorder),
-        joinedload(LostAndFoundItem.disposer),
-        joinedload(LostAndFoundItem.deleter)
-    )
+    query = select(LostAndFoundItem)
 
     if user_data.get("role") not in ["admin", "boss"]:
-        query = query.filter(LostAndFoundItem.status != LostItemStatus.DELETED)
+        query = query.where(LostAndFoundItem.status != LostItemStatus.DELETED)
 
     branch_to_filter = chi_nhanh
     if user_data.get("role") == 'letan' and not chi_nhanh:
@@ -98,16 +87,16 @@ def _get_filtered_lost_items(
 
     if status:
         if status == "DELETED": # Xử lý giá trị đặc biệt từ bộ lọc của admin
-            query = query.filter(LostAndFoundItem.status == LostItemStatus.DELETED)
+            query = query.where(LostAndFoundItem.status == LostItemStatus.DELETED)
         else:
-            query = query.filter(LostAndFoundItem.status == status)
+            query = query.where(LostAndFoundItem.status == status)
 
     if found_date:
         try:
             filter_date = datetime.strptime(found_date, "%Y-%m-%d").date()
             start_of_day = datetime.combine(filter_date, datetime.min.time()).replace(tzinfo=VN_TZ)
             end_of_day = datetime.combine(filter_date, datetime.max.time()).replace(tzinfo=VN_TZ)
-            query = query.filter(LostAndFoundItem.found_datetime.between(start_of_day, end_of_day))
+            query = query.where(LostAndFoundItem.found_datetime.between(start_of_day, end_of_day))
         except ValueError:
             logger.warning(f"Định dạng ngày không hợp lệ cho bộ lọc: {found_date}")
 
@@ -116,7 +105,7 @@ def _get_filtered_lost_items(
         # plainto_tsquery sẽ tự động chuyển đổi chuỗi tìm kiếm thành các từ khóa và nối chúng bằng toán tử AND (&).
         search_term = search.strip()
         if search_term:
-            query = query.filter(LostAndFoundItem.fts_vector.op("@@")(func.plainto_tsquery('simple', search_term)))
+            query = query.where(LostAndFoundItem.fts_vector.op("@@")(func.plainto_tsquery('simple', search_term)))
 
     if reported_by:
         search_term = reported_by.strip()
@@ -140,8 +129,7 @@ def _get_filtered_lost_items(
     id_order_expression = desc(LostAndFoundItem.id)
 
     # --- SỬA: Bỏ COUNT(*), thay bằng logic Keyset Pagination ---
-    count_q = query.with_entities(func.count(LostAndFoundItem.id)).order_by(None)
-    total_records = db.execute(count_q).scalar_one()
+    count_q = query.with_only_columns(func.count(LostAndFoundItem.id), maintain_column_froms=True).order_by(None)
 
     # Áp dụng sắp xếp
     query = query.order_by(status_order, order_expression, id_order_expression)
@@ -155,7 +143,7 @@ def _get_filtered_lost_items(
             # Xây dựng điều kiện WHERE phức tạp cho Keyset Pagination
             # Điều này tương đương với: WHERE (found_datetime, id) < (last_found_datetime, last_id)
             # nhưng xử lý được các hướng sắp xếp khác nhau (DESC, DESC)
-            query = query.filter(
+            query = query.where(
                 tuple_(LostAndFoundItem.found_datetime, LostAndFoundItem.id) < (cursor_dt, last_id)
             )
         except (ValueError, TypeError):
@@ -165,9 +153,33 @@ def _get_filtered_lost_items(
         # Chỉ dùng offset cho các trang sau trang 1 nếu không có cursor (trường hợp fallback)
         query = query.offset((page - 1) * per_page)
 
-    items = query.limit(per_page).all()
+    query = query.options(
+        joinedload(LostAndFoundItem.branch),
+        joinedload(LostAndFoundItem.reporter),
+        joinedload(LostAndFoundItem.recorder),
+        joinedload(LostAndFoundItem.disposer),
+        joinedload(LostAndFoundItem.deleter)
+    ).limit(per_page)
+    return query, count_q
+
+def _get_filtered_lost_items(db: Session, **filters) -> Tuple[List[LostAndFoundItem], int]:
+    """
+    Hàm dịch vụ để lấy danh sách các món đồ thất lạc đã được lọc và phân trang (Session sync).
+    Tham số lọc: xem _build_lost_items_query.
+    """
+    query, count_q = _build_lost_items_query(**filters)
+    total_records = db.execute(count_q).scalar_one()
+    items = db.execute(query).scalars().all()
+    return items, total_records
+
+async def _get_filtered_lost_items_async(db: AsyncSession, **filters) -> Tuple[List[LostAndFoundItem], int]:
+    """Như _get_filtered_lost_items nhưng chạy trên AsyncSession, không chặn event loop."""
+    query, count_q = _build_lost_items_query(**filters)
+    total_records = (await db.execute(count_q)).scalar_one()
+    items = (await db.execute(query)).scalars().all()
     return items, total_records
 
+
 # ----------------------------------------------------------------------
 # ENDPOINT TẢI TRANG (GIỮ NGUYÊN)
 # ----------------------------------------------------------------------
@@ -187,12 +199,14 @@ async def lost_and_found_page(
     per_page = int(request.cookies.get('lostAndFoundPerPage', 9))
 
     if user_data.get("role") in ["admin", "boss", "quanly", "letan"]:
+        # Quét trạng thái "Có thể thanh lý" chạy sau trong hàng đợi việc, trang không phải chờ câu UPDATE.
+        # dedupe_key: nhiều lượt xem trang chỉ tạo một việc đang chờ.
         try:
-            update_disposable_items_status(db=db)
+            enqueue(db, DISPOSABLE_SWEEP_JOB, dedupe_key=DISPOSABLE_SWEEP_JOB)
             db.commit() 
         except Exception as e:
             db.rollback() 
-            logger.error(f"Lỗi khi cập nhật trạng thái đồ thất lạc: {e}", exc_info=True)
+            logger.error(f"Lỗi khi xếp lịch cập nhật trạng thái đồ thất lạc: {e}", exc_info=True)
 
     all_branches_obj = db.query(Branch).filter(func.lower(Branch.branch_code).notin_(['admin', 'boss'])).all()
 
@@ -212,11 +226,6 @@ async def lost_and_found_page(
     if user_data.get("role") == 'letan':
         active_branch = get_active_branch(request, db, user_data)
 
-    status_display_map = {
-        s.value: map_status_to_vietnamese(s.value) 
-        for s in LostItemStatus if s != LostItemStatus.DELETED
-    }
-    
     # --- SỬA: SỬ DỤNG HÀM DỊCH VỤ ĐỂ LẤY DỮ LIỆU BAN ĐẦU ---
     branch_to_filter = chi_nhanh
     if user_data.get("role") == 'letan' and not chi_nhanh:
@@ -243,7 +252,6 @@ async def lost_and_found_page(
         "user": user_data,
         "statuses": [s for s in LostItemStatus if s != LostItemStatus.DELETED],
         "initial_branch_filter": active_branch,
-        "status_display_map": status_display_map, 
         "branches": display_branches, 
         "display_branches": display_branches,
         "branch_filter": chi_nhanh,
@@ -380,7 +388,7 @@ async def get_dashboard_stats(
 @router.get("/api", response_model=LostItemsResponse)
 async def api_lost_and_found_items( 
     request: Request, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db), # SỬA: AsyncSession, không chặn event loop
     page: int = 1, # THÊM: Nhận tham số page
     per_page: int = 20,
     search: Optional[str] = None,
@@ -399,9 +407,9 @@ async def api_lost_and_found_items(
     # --- SỬA: SỬ DỤNG HÀM DỊCH VỤ ĐỂ LẤY DỮ LIỆU ---
     active_branch_for_letan = None
     if user_data.get("role") == 'letan' and not chi_nhanh:
-        active_branch_for_letan = get_active_branch(request, db, user_data)
+        active_branch_for_letan = await get_active_branch_async(request, db, user_data)
 
-    items, total_records = _get_filtered_lost_items(
+    items, total_records = await _get_filtered_lost_items_async(
         db=db,
         user_data=user_data,
         per_page=per_page,
@@ -1,25 +1,22 @@
 from fastapi import APIRouter, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session, joinedload, contains_eager
-from sqlalchemy import and_
-import os
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select
 import uuid
+import json
+import asyncio
 
-from ..db.session import get_db
+from ..db.session import get_db, get_async_db, AsyncSessionLocal
 from ..db.models import User, AttendanceLog
-from ..core.security import get_csrf_token
+from ..core.security import get_csrf_token, mark_checked_in
+from ..core.pubsub import broker, publish, qr_checkin_channel
 from ..core.utils import get_lan_ip, get_current_work_shift, _get_log_shift_for_user
 
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
-
 
 @router.get("/checkin")
 def attendance_checkin(request: Request, token: str, db: Session = Depends(get_db)):
@@ -110,23 +107,30 @@ async def checkin_success(request: Request, db: Session = Depends(get_db)):
 
     log.checked_in = True
     db.commit()
+    # Báo ngay cho trang show_qr đang chờ token này
+    publish(qr_checkin_channel(token), {"checked_in": True})
 
     # Cập nhật session chính thức
     request.session["user"] = session_user
     request.session["after_checkin"] = "choose_function"
     request.session.pop("pending_user", None)
+    mark_checked_in(request, log.user_id, log.work_date)
 
     return JSONResponse({"success": True, "redirect_to": str(request.url_for('choose_function'))})
 
 @router.get("/checkin_status")
-async def checkin_status(request: Request, token: str, db: Session = Depends(get_db)):
+async def checkin_status(request: Request, token: str, db: AsyncSession = Depends(get_async_db)):
     """
     API được máy tính (trang show_qr) gọi để kiểm tra xem điện thoại đã điểm danh thành công chưa.
+    SỬA: Dùng AsyncSession; department được load sẵn vì AsyncSession không lazy-load được.
     """
-    # ... (code query) ...
-    log = db.query(AttendanceLog).outerjoin(
-        User, and_(AttendanceLog.user_id == User.id, User.is_active == True)
-    ).options(contains_eager(AttendanceLog.user)).filter(AttendanceLog.token == token).first()
+    log = (await db.execute(
+        select(AttendanceLog).outerjoin(
+            User, and_(AttendanceLog.user_id == User.id, User.is_active == True)
+        ).options(
+            contains_eager(AttendanceLog.user).joinedload(User.department)
+        ).where(AttendanceLog.token == token)
+    )).scalars().first()
 
     if log and log.checked_in and log.user:
         # Đăng nhập cho user ở session của máy tính
@@ -145,10 +149,52 @@ async def checkin_status(request: Request, token: str, db: Session = Depends(get
 
         request.session.pop("pending_user", None)
         request.session.pop("qr_token", None)
+        mark_checked_in(request, log.user_id, log.work_date)
         return JSONResponse(content={"checked_in": True, "redirect_to": str(request.url_for('choose_function'))})
 
     return JSONResponse(content={"checked_in": False})
 
+# Thời gian tối đa của một kết nối SSE; trình duyệt (EventSource) sẽ tự kết nối lại
+CHECKIN_EVENTS_MAX_SECONDS = 300
+CHECKIN_EVENTS_KEEPALIVE_SECONDS = 20
+
+@router.get("/checkin_events")
+async def checkin_events(request: Request, token: str):
+    """
+    Server-Sent Events cho trang show_qr: giữ kết nối mở và báo ngay khi token được check-in.
+    Chỉ query DB 1 lần lúc kết nối (phòng trường hợp check-in xảy ra trước khi đăng ký),
+    sau đó chờ sự kiện từ pub/sub, không query khi rảnh.
+    Khi nhận sự kiện, trang sẽ gọi /checkin_status một lần để cập nhật session và chuyển trang.
+    """
+    async def event_stream():
+        async with broker.subscribe(qr_checkin_channel(token)) as subscription:
+            async with AsyncSessionLocal() as db:
+                already_checked_in = (await db.execute(
+                    select(AttendanceLog.checked_in).where(AttendanceLog.token == token)
+                )).scalar()
+            if already_checked_in:
+                yield f"event: checkin\ndata: {json.dumps({'checked_in': True})}\n\n"
+                return
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + CHECKIN_EVENTS_MAX_SECONDS
+            while loop.time() < deadline:
+                if await request.is_disconnected():
+                    return
+                message = await subscription.get(timeout=CHECKIN_EVENTS_KEEPALIVE_SECONDS)
+                if message is None:
+                    # Giữ kết nối qua proxy
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: checkin\ndata: {json.dumps(message)}\n\n"
+                if message.get("checked_in"):
+                    return
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @router.get("/show_qr", response_class=HTMLResponse)
 async def show_qr(request: Request, db: Session = Depends(get_db)):
     """
@@ -175,6 +221,7 @@ async def show_qr(request: Request, db: Session = Depends(get_db)):
             # Nếu đã check-in, cập nhật session và chuyển hướng
             request.session["user"] = user_session
             request.session.pop("pending_user", None)
+            mark_checked_in(request, user_id, work_date)
             return RedirectResponse("/choose-function", status_code=303)
         else:
             # Nếu log đã tồn tại nhưng chưa check-in, dùng lại token cũ
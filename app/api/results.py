@@ -1,30 +1,25 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import cast, Date, select, literal_column, union_all, desc, asc, or_, and_, func, Integer, Float, case
+from sqlalchemy import cast, Date, select, literal_column, union_all, desc, asc, or_, and_, func, Integer, Float, case, tuple_, false
 from sqlalchemy.orm import aliased
-import os
 from typing import Optional, Tuple, List, Dict
 import math
 from datetime import datetime
 
-from ..db.session import get_db
+from ..db.session import get_db, get_async_db
 from ..db.models import AttendanceRecord, ServiceRecord, User, Branch
 from ..core.security import require_checked_in_user
 from ..core.config import ROLE_MAP, BRANCHES, logger
 from fastapi.encoders import jsonable_encoder
-from ..core.utils import parse_form_datetime, format_datetime_display
+from ..core.utils import parse_form_datetime, format_datetime_display, encode_cursor, decode_cursor
 
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
 
 def _get_filtered_records_query(db: Session, query_params: dict, user_session: dict) -> Tuple[select, List]:
     """
@@ -135,8 +130,106 @@ def _get_filtered_records_query(db: Session, query_params: dict, user_session: d
 
     return final_query, selected_columns
 
+RESULTS_SORT_MAP = {
+    'thoi_gian': 'ThoiGian', 'nguoi_thuc_hien': 'MaNguoiThucHien', 'ma_nv': 'MaNV',
+    'ten_nv': 'TenNV', 'chuc_vu': 'ChucVu', 'chi_nhanh_lam': 'ChiNhanhLam',
+    'la_tang_ca': 'TangCa', 'so_cong': 'SoCong', 'dich_vu': 'DichVu',
+    'so_phong': 'SoPhong', 'so_luong': 'SoLuong', 'type': 'type'
+}
+
+# Kiểu Python hợp lệ của giá trị "v" trong cursor theo cột sắp xếp (mặc định: chuỗi); None = nhóm NULL
+_RESULTS_CURSOR_VALUE_TYPES = {
+    'ThoiGian': (datetime,),
+    'TangCa': (bool,),
+    'SoCong': (int, float),
+    'SoLuong': (int,),
+}
+
+def _is_valid_results_cursor(cursor: dict, sort_by: str) -> bool:
+    """Cursor có giá trị đúng kiểu với cột sắp xếp và khóa phụ (type, id); kiểu khác sẽ lỗi khi so sánh trong SQL."""
+    value = cursor.get("v")
+    if "v" not in cursor or not isinstance(cursor.get("t"), str):
+        return False
+    if not isinstance(cursor.get("i"), int) or isinstance(cursor.get("i"), bool):
+        return False
+    if value is None:
+        return True
+    # bool là lớp con của int: chỉ chấp nhận bool cho cột boolean
+    if isinstance(value, bool) != (sort_by == 'TangCa'):
+        return False
+    return isinstance(value, _RESULTS_CURSOR_VALUE_TYPES.get(sort_by, (str,)))
+
+def _apply_results_keyset(query, data_subquery, sort_column, sort_order: str, cursor: dict):
+    """
+    Áp dụng điều kiện Keyset Pagination cho truy vấn kết quả đã gộp (UNION).
+    Thứ tự sắp xếp luôn là (cột sắp xếp NULLS LAST, type, id) cùng chiều,
+    vì id của AttendanceRecord và ServiceRecord có thể trùng nhau nên cần thêm `type` làm khóa phụ.
+    Cursor phải đã qua _is_valid_results_cursor.
+    """
+    last_value = cursor.get("v")
+    tiebreaker = tuple_(data_subquery.c.type, data_subquery.c.id)
+    last_tiebreaker = (cursor.get("t"), cursor.get("i"))
+    after_tiebreaker = tiebreaker < last_tiebreaker if sort_order == 'desc' else tiebreaker > last_tiebreaker
+
+    # SQLAlchemy không dựng được `<`/`>` với None/True/False -> xử lý các trường hợp này trước
+    if last_value is None:
+        # Cursor đang nằm trong nhóm NULL (luôn ở cuối), chỉ còn so sánh khóa phụ
+        return query.where(and_(sort_column.is_(None), after_tiebreaker))
+
+    if isinstance(last_value, bool):
+        # Postgres xếp false < true: giảm dần thì sau true là false, tăng dần thì sau false là true
+        if sort_order == 'desc':
+            after_value = sort_column.is_(False) if last_value else false()
+        else:
+            after_value = false() if last_value else sort_column.is_(True)
+        same_value = sort_column.is_(last_value)
+    else:
+        after_value = sort_column < last_value if sort_order == 'desc' else sort_column > last_value
+        same_value = sort_column == last_value
+
+    return query.where(or_(
+        after_value,
+        sort_column.is_(None),
+        and_(same_value, after_tiebreaker)
+    ))
+
+def _identity(value):
+    return value
+
+def _format_results_datetime(value):
+    return format_datetime_display(value, with_time=True) if value else ""
+
+# Ánh xạ (key trả về cho frontend, cột trong truy vấn UNION, formatter)
+RESULTS_OUTPUT_COLUMNS = [
+    ('id', 'id', _identity),
+    ('type', 'type', _identity),
+    ('thoi_gian', 'ThoiGian', _format_results_datetime),
+    ('ten_nguoi_thuc_hien', 'TenNguoiThucHien', _identity),
+    ('ma_nguoi_thuc_hien', 'MaNguoiThucHien', _identity),
+    ('ma_nv', 'MaNV', _identity),
+    ('ten_nv', 'TenNV', _identity),
+    ('chuc_vu', 'ChucVu', _identity),
+    ('chi_nhanh_chinh', 'ChiNhanhChinh', _identity),
+    ('chi_nhanh_lam', 'ChiNhanhLam', _identity),
+    ('so_cong', 'SoCong', _identity),
+    ('tang_ca', 'TangCa', _identity),
+    ('ghi_chu', 'GhiChu', _identity),
+    ('dich_vu', 'DichVu', _identity),
+    ('so_phong', 'SoPhong', _identity),
+    ('so_luong', 'SoLuong', _identity),
+]
+RESULTS_OUTPUT_KEYS = [key for key, _, _ in RESULTS_OUTPUT_COLUMNS]
+
+def _get_results_column_getters(data_subquery) -> List[tuple]:
+    """
+    Tính sẵn (vị trí cột trong tuple kết quả, formatter) cho từng key trả về,
+    để mỗi dòng chỉ cần truy cập theo chỉ số thay vì theo tên.
+    """
+    column_index = {col.name: idx for idx, col in enumerate(data_subquery.c)}
+    return [(column_index[source], fmt) for _, source, fmt in RESULTS_OUTPUT_COLUMNS]
+
 @router.get("/api/results-by-checker")
-async def api_get_attendance_results(request: Request, db: Session = Depends(get_db)):
+async def api_get_attendance_results(request: Request, db: AsyncSession = Depends(get_async_db)):
     user_session = request.session.get("user")
     if not user_session:
         raise HTTPException(status_code=403, detail="Bạn không có quyền truy cập chức năng này.")
@@ -144,15 +237,18 @@ async def api_get_attendance_results(request: Request, db: Session = Depends(get
     query_params = request.query_params
     page = int(query_params.get("page", 1))
     per_page = int(query_params.get("per_page", 100))
-    sort_by_map = {
-        'thoi_gian': 'ThoiGian', 'nguoi_thuc_hien': 'MaNguoiThucHien', 'ma_nv': 'MaNV',
-        'ten_nv': 'TenNV', 'chuc_vu': 'ChucVu', 'chi_nhanh_lam': 'ChiNhanhLam',
-        'la_tang_ca': 'TangCa', 'so_cong': 'SoCong', 'dich_vu': 'DichVu',
-        'so_phong': 'SoPhong', 'so_luong': 'SoLuong', 'type': 'type'
-    }
     sort_by_key = query_params.get("sort_by", 'thoi_gian')
-    sort_by = sort_by_map.get(sort_by_key, 'ThoiGian')
-    sort_order = query_params.get("sort_order", 'desc')
+    sort_by = RESULTS_SORT_MAP.get(sort_by_key, 'ThoiGian')
+    sort_order = 'desc' if query_params.get("sort_order", 'desc') == 'desc' else 'asc'
+    # --- Keyset Pagination: cursor trỏ tới dòng cuối của trang trước ---
+    cursor = decode_cursor(query_params.get("cursor"))
+    if cursor is not None and (cursor.get("s") != sort_by or cursor.get("o") != sort_order):
+        # Cursor được tạo cho một cột/chiều sắp xếp khác -> bỏ qua, dùng OFFSET
+        cursor = None
+    if cursor is not None and not _is_valid_results_cursor(cursor, sort_by):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ.")
+    # Cho phép bỏ qua truy vấn thống kê ở các trang tiếp theo (frontend giữ lại số liệu cũ)
+    include_stats = query_params.get("include_stats", "1") not in ("0", "false")
 
     # --- TỐI ƯU HÓA HIỆU SUẤT ---
     # Tách truy vấn lấy dữ liệu và truy vấn thống kê thành 2 truy vấn riêng biệt.
@@ -162,66 +258,81 @@ async def api_get_attendance_results(request: Request, db: Session = Depends(get
     base_filtered_query, _ = _get_filtered_records_query(db, query_params, user_session)
     
     # 2. Tạo truy vấn thống kê (không sắp xếp, không phân trang)
-    stats_subquery = base_filtered_query.subquery('stats_sq')
-    stats_query = select(
-        func.count().label("total_records"),
-        func.sum(case((stats_subquery.c.type == 'Điểm danh', stats_subquery.c.SoCong), else_=0)).label("total_work_units"),
-        func.count(case((stats_subquery.c.TangCa == True, 1), else_=None)).label("total_overtime"),
-        func.sum(case((stats_subquery.c.type == 'Dịch vụ', stats_subquery.c.SoLuong), else_=0)).label("total_services"),
-        func.count(case((and_(stats_subquery.c.type == 'Điểm danh', stats_subquery.c.SoCong == 0), 1), else_=None)).label("total_absences")
-    )
-    # Thực thi truy vấn thống kê
-    stats_result = db.execute(stats_query).first()
+    stats_result = None
+    if include_stats:
+        stats_subquery = base_filtered_query.subquery('stats_sq')
+        stats_query = select(
+            func.count().label("total_records"),
+            func.sum(case((stats_subquery.c.type == 'Điểm danh', stats_subquery.c.SoCong), else_=0)).label("total_work_units"),
+            func.count(case((stats_subquery.c.TangCa == True, 1), else_=None)).label("total_overtime"),
+            func.sum(case((stats_subquery.c.type == 'Dịch vụ', stats_subquery.c.SoLuong), else_=0)).label("total_services"),
+            func.count(case((and_(stats_subquery.c.type == 'Điểm danh', stats_subquery.c.SoCong == 0), 1), else_=None)).label("total_absences")
+        )
+        # Thực thi truy vấn thống kê
+        stats_result = (await db.execute(stats_query)).first()
 
     # 3. Tạo và thực thi truy vấn lấy dữ liệu đã phân trang
     data_subquery = base_filtered_query.subquery('data_sq')
     sort_column = getattr(data_subquery.c, sort_by, data_subquery.c.ThoiGian)
     sort_direction = desc if sort_order == 'desc' else asc
-    paginated_query = select(data_subquery).order_by(sort_direction(sort_column)).offset((page - 1) * per_page).limit(per_page)
-    records = db.execute(paginated_query).all()
+    paginated_query = select(data_subquery).order_by(
+        sort_direction(sort_column).nullslast(),
+        sort_direction(data_subquery.c.type),
+        sort_direction(data_subquery.c.id)
+    )
+    if cursor is not None:
+        paginated_query = _apply_results_keyset(paginated_query, data_subquery, sort_column, sort_order, cursor)
+    elif page > 1:
+        paginated_query = paginated_query.offset((page - 1) * per_page)
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    records = (await db.execute(paginated_query.limit(per_page + 1))).all()
+    has_more = len(records) > per_page
+    records = records[:per_page]
+
+    next_cursor = None
+    if has_more and records:
+        last = records[-1]._mapping
+        next_cursor = encode_cursor({"s": sort_by, "o": sort_order, "v": last[sort_by], "t": last["type"], "i": last["id"]})
 
     # 4. Xử lý kết quả
-    total_records = stats_result.total_records if stats_result else 0
-    total_pages = math.ceil(total_records / per_page) if per_page > 0 else 1
+    total_records = (stats_result.total_records if stats_result else 0) if include_stats else None
+    total_pages = (math.ceil(total_records / per_page) if per_page > 0 else 1) if include_stats else None
 
     # Format kết quả trả về
-    combined_results = [dict(rec._mapping) for rec in records]
-    for rec in combined_results:
-        # Đổi tên key để phù hợp với frontend
-        rec['id'] = rec.pop('id', None)
-        rec['type'] = rec.pop('type', None)
-        rec['thoi_gian'] = format_datetime_display(rec.pop('ThoiGian'), with_time=True) if rec.get('ThoiGian') else ""
-        rec['ten_nguoi_thuc_hien'] = rec.pop('TenNguoiThucHien', None)
-        rec['ma_nguoi_thuc_hien'] = rec.pop('MaNguoiThucHien', None)
-        rec['ma_nv'] = rec.pop('MaNV', None)
-        rec['ten_nv'] = rec.pop('TenNV', None)
-        rec['chuc_vu'] = rec.pop('ChucVu', None)
-        rec['chi_nhanh_chinh'] = rec.pop('ChiNhanhChinh', None)
-        rec['chi_nhanh_lam'] = rec.pop('ChiNhanhLam', None)
-        rec['so_cong'] = rec.pop('SoCong', None)
-        rec['tang_ca'] = rec.pop('TangCa', None)
-        rec['ghi_chu'] = rec.pop('GhiChu', None)
-        rec['dich_vu'] = rec.pop('DichVu', None)
-        rec['so_phong'] = rec.pop('SoPhong', None)
-        rec['so_luong'] = rec.pop('SoLuong', None)
+    # TỐI ƯU: Định dạng trực tiếp từ tuple của dòng với formatter đã tính sẵn theo vị trí cột,
+    # thay vì dict(rec._mapping) rồi pop/đổi tên 16 key cho từng dòng.
+    column_getters = _get_results_column_getters(data_subquery)
+    rows = [[fmt(rec[idx]) for idx, fmt in column_getters] for rec in records]
+    response_format = query_params.get("format", "rows")
+    if response_format == "columnar":
+        # Định dạng dạng cột: tên cột gửi 1 lần, mỗi dòng chỉ là mảng giá trị
+        records_payload = {"columns": RESULTS_OUTPUT_KEYS, "rows": rows}
+    else:
+        records_payload = [dict(zip(RESULTS_OUTPUT_KEYS, row)) for row in rows]
 
-    return JSONResponse(content={
-        "records": combined_results,
-        "currentPage": page,
-        "totalPages": total_pages,
-        "totalRecords": total_records,
+    dashboard_stats = None
+    if include_stats:
         # --- TỐI ƯU HÓA: Lấy dashboard_stats từ truy vấn thống kê riêng biệt ---
-        "dashboard_stats": {
+        dashboard_stats = {
             "total_records": total_records,
             "total_work_units": float(stats_result.total_work_units or 0) if stats_result else 0,
             "total_overtime": stats_result.total_overtime if stats_result else 0,
             "total_services": int(stats_result.total_services or 0) if stats_result else 0,
             "total_absences": stats_result.total_absences if stats_result else 0,
         }
+
+    return JSONResponse(content={
+        "records": records_payload,
+        "currentPage": page,
+        "totalPages": total_pages,
+        "totalRecords": total_records,
+        "nextCursor": next_cursor,
+        "hasMore": has_more,
+        "dashboard_stats": dashboard_stats
     })
 
 @router.get("/api/today-checkins")
-async def get_today_checkins(request: Request, db: Session = Depends(get_db)):
+async def get_today_checkins(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     API mới để lấy danh sách nhân viên đã được điểm danh bởi người dùng hiện tại
     trong ngày làm việc hôm nay.
@@ -273,7 +384,7 @@ async def get_today_checkins(request: Request, db: Session = Depends(get_db)):
     # Gộp, sắp xếp và thực thi
     all_records_q = union_all(att_q, svc_q)
     final_query = select(all_records_q.c).order_by(desc(all_records_q.c.datetime))
-    records = db.execute(final_query).all()
+    records = (await db.execute(final_query)).all()
 
     # Chuyển đổi kết quả thành list of dicts
     results = [dict(rec._mapping) for rec in records]
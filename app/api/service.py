@@ -1,27 +1,21 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from sqlalchemy.orm import Session
-import os
 from datetime import datetime
 
 from ..db.session import get_db
 from ..db.models import User, ServiceRecord, Branch, Department, AttendanceRecord
-from ..core.security import get_csrf_token
+from ..core.security import get_csrf_token, get_active_branch, get_user_context
 from ..core.utils import get_current_work_shift, VN_TZ
 from ..core.config import logger
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy import cast, Date
 from sqlalchemy.orm import joinedload
 
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
 
 @router.get("", response_class=HTMLResponse)
 def attendance_service_ui(request: Request, db: Session = Depends(get_db)):
@@ -35,18 +29,8 @@ def attendance_service_ui(request: Request, db: Session = Depends(get_db)):
 
     # === BƯỚC 1: TÌM CHI NHÁNH LÀM VIỆC HIỆN TẠI (ĐÃ DI CHUYỂN LÊN TRÊN) ===
     # Ưu tiên hàng đầu: Chi nhánh đã chọn chủ động trong session (do GPS/chọn tay)
-    active_branch_code = request.session.get("active_branch") #
-
-    if not active_branch_code:
-        # 2. Nếu không có, query DB để lấy `last_active_branch`
-        user_from_db = db.query(User).filter(User.id == user_data.get("id")).first() #
-        
-        if user_from_db and user_from_db.last_active_branch: #
-            # Đây là nơi B10 của bạn sẽ được đọc
-            active_branch_code = user_from_db.last_active_branch #
-        else:
-            # 3. Nếu vẫn không có, dùng chi nhánh chính (mặc định) từ session
-            active_branch_code = user_data.get("branch", "") #
+    # Sau đó là last_active_branch trong DB, cuối cùng là chi nhánh chính (dùng chung context của request)
+    active_branch_code = get_active_branch(request, db, user_data) or ""
     
     # Lấy đối tượng Branch từ DB để lấy ID
     active_branch_obj = db.query(Branch).filter(Branch.branch_code == active_branch_code).first()
@@ -110,7 +94,7 @@ async def service_checkin_bulk(request: Request, db: Session = Depends(get_db)):
     if not session_user:
         raise HTTPException(status_code=403, detail="Không có quyền điểm danh.")
 
-    checker = db.query(User).filter(User.employee_code == session_user["code"]).first()
+    checker = get_user_context(request, db, session_user).user
     if not checker:
         raise HTTPException(status_code=403, detail="Không tìm thấy người dùng thực hiện điểm danh.")
 
@@ -3,9 +3,9 @@
 
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import math
 import random
@@ -13,12 +13,15 @@ from pydantic import BaseModel
 import string # THÊM: Để tạo mã giao dịch
 
 # Import từ các module đã tái cấu trúc
-from ..db.session import get_db
+from ..db.session import get_db, get_async_db
 # SỬA: Import model mới (Giả định)
 from ..db.models import User, ShiftReportTransaction, Branch, Department, ShiftReportStatus, TransactionType, ShiftCloseLog, User
-from ..core.security import get_active_branch
-from ..core.config import logger, BRANCHES, SHIFT_TRANSACTION_TYPES # THÊM: Import cấu hình mới
+from ..core.security import get_active_branch, get_active_branch_async
+from ..core.config import logger, BRANCHES, SHIFT_TRANSACTION_TYPES, SHIFT_STATUS_MAP # THÊM: Import cấu hình mới
 from ..core.utils import VN_TZ
+from ..services.live_feed_service import publish_branch_delta
+from ..services.job_queue import enqueue
+from ..services.shift_report_service import DETACH_CLOSE_LOG_TRANSACTIONS_JOB
 
 # --- IMPORT CÁC SCHEMAS MỚI (Giả định) ---
 from ..schemas.shift_report import ( # SỬA: Schema mới
@@ -26,27 +29,15 @@ from ..schemas.shift_report import ( # SỬA: Schema mới
     ShiftTransactionsResponse, ShiftTransactionDetails
 )
 
-from sqlalchemy.dialects.postgresql import JSONB # Import JSONB để cast và dùng toán tử JSONB
 # Import các thành phần SQLAlchemy cần thiết
-from sqlalchemy import cast, Date, desc, or_, asc, case, func, tuple_, extract
+from sqlalchemy import cast, Date, desc, or_, asc, case, func, tuple_, extract, select, Select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.encoders import jsonable_encoder
-import os
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
-
-# --- SỬA: Map trạng thái và loại giao dịch mới ---
-SHIFT_STATUS_MAP = {
-    "PENDING": "Chờ xử lý",
-    "CLOSED": "Đã kết ca",
-    "DELETED": "Đã xoá"
-}
 
+# --- SỬA: Map trạng thái và loại giao dịch mới (SHIFT_STATUS_MAP nằm trong config, dùng chung với filter template) ---
 def map_status_to_vietnamese(status_value: Optional[str]) -> str:
     """Helper để map status enum value to Vietnamese string."""
     if not status_value:
@@ -59,6 +50,15 @@ def map_type_to_vietnamese(type_value: Optional[str]) -> str:
         return ""
     return SHIFT_TRANSACTION_TYPES.get(type_value, type_value) # SỬA: Dùng biến config mới
 
+# --- THÊM: Phát delta cho các client đang xem cùng chi nhánh ---
+def _publish_transaction_delta(action: str, serialized_items: List[dict], soft_deleted: bool = False):
+    """Nhóm các giao dịch đã serialize theo chi nhánh và phát delta lên kênh của từng chi nhánh."""
+    items_by_branch = {}
+    for item in serialized_items:
+        items_by_branch.setdefault(item.get("chi_nhanh"), []).append(item)
+    for branch_code, items in items_by_branch.items():
+        publish_branch_delta(branch_code, "shift_report", action, [item["id"] for item in items], items, soft_deleted=soft_deleted)
+
 # --- THÊM: Helper tạo mã giao dịch ---
 def generate_transaction_code(db: Session, branch_code: str) -> str:
     """Tạo mã giao dịch duy nhất theo format [BranchCode]-[5-Digits]"""
@@ -100,8 +100,7 @@ def _serialize_transaction(transaction: ShiftReportTransaction) -> dict:
     return jsonable_encoder(item_details)
 
 # --- SỬA: Hàm filter chính ---
-def _get_filtered_transactions(
-    db: Session,
+def _build_transactions_query(
     user_data: dict,
     per_page: int,
     search: Optional[str] = None,
@@ -117,20 +116,16 @@ def _get_filtered_transactions(
     sort_by: Optional[str] = 'created_datetime', # THÊM
     sort_order: Optional[str] = 'desc', # THÊM
     active_branch_for_letan: Optional[str] = None
-) -> (List[ShiftReportTransaction], int):
+) -> Tuple[Select, Select]:
     """
-    Hàm dịch vụ để lấy danh sách các giao dịch đã được lọc và phân trang.
+    Xây dựng câu lệnh lấy danh sách giao dịch đã lọc + phân trang và câu lệnh đếm tổng số.
+    SỬA: Chỉ dựng `select()` (không chạy), để dùng chung cho Session sync và AsyncSession.
     """
     # SỬA: Query model mới
-    query = db.query(ShiftReportTransaction).options(
-        joinedload(ShiftReportTransaction.branch),
-        joinedload(ShiftReportTransaction.recorder),
-        joinedload(ShiftReportTransaction.closer), # SỬA
-        joinedload(ShiftReportTransaction.deleter)
-    )
+    query = select(ShiftReportTransaction)
 
     if user_data.get("role") not in ["admin", "boss"]:
-        query = query.filter(ShiftReportTransaction.status != ShiftReportStatus.DELETED)
+        query = query.where(ShiftReportTransaction.status != ShiftReportStatus.DELETED)
 
     branch_to_filter = chi_nhanh
     if user_data.get("role") == 'letan' and not chi_nhanh:
@@ -141,13 +136,13 @@ def _get_filtered_transactions(
 
     if status:
         if status == "DELETED":
-            query = query.filter(ShiftReportTransaction.status == ShiftReportStatus.DELETED)
+            query = query.where(ShiftReportTransaction.status == ShiftReportStatus.DELETED)
         else:
-            query = query.filter(ShiftReportTransaction.status == status)
+            query = query.where(ShiftReportTransaction.status == status)
             
     # THÊM: Filter theo loại giao dịch
     if transaction_type:
-        query = query.filter(ShiftReportTransaction.transaction_type == transaction_type)
+        query = query.where(ShiftReportTransaction.transaction_type == transaction_type)
 
     # SỬA: Filter theo ngày tạo
     if created_date:
@@ -155,7 +150,7 @@ def _get_filtered_transactions(
             filter_date = datetime.strptime(created_date, "%Y-%m-%d").date()
             start_of_day = datetime.combine(filter_date, datetime.min.time()).replace(tzinfo=VN_TZ)
             end_of_day = datetime.combine(filter_date, datetime.max.time()).replace(tzinfo=VN_TZ)
-            query = query.filter(ShiftReportTransaction.created_datetime.between(start_of_day, end_of_day))
+            query = query.where(ShiftReportTransaction.created_datetime.between(start_of_day, end_of_day))
         except ValueError:
             logger.warning(f"Định dạng ngày không hợp lệ cho bộ lọc: {created_date}")
 
@@ -177,7 +172,7 @@ def _get_filtered_transactions(
                 # Nếu là số, thêm điều kiện tìm kiếm theo cột amount
                 filter_conditions.append(ShiftReportTransaction.amount == int(numeric_search_term))
 
-            query = query.filter(or_(*filter_conditions))
+            query = query.where(or_(*filter_conditions))
 
     # SỬA: Filter theo người ghi nhận
     if recorded_by:
@@ -190,8 +185,7 @@ def _get_filtered_transactions(
         )
 
     # Count
-    count_q = query.with_entities(func.count(ShiftReportTransaction.id)).order_by(None)
-    total_records = db.execute(count_q).scalar_one()
+    count_q = query.with_only_columns(func.count(ShiftReportTransaction.id), maintain_column_froms=True).order_by(None)
 
     # --- THÊM: Logic sắp xếp động ---
     sort_direction = desc if sort_order == 'desc' else asc
@@ -225,7 +219,7 @@ def _get_filtered_transactions(
             cursor_dt = datetime.fromisoformat(last_created_datetime)
             
             # SỬA: Dùng created_datetime
-            query = query.filter(
+            query = query.where(
                 tuple_(ShiftReportTransaction.created_datetime, ShiftReportTransaction.id) < (cursor_dt, last_id)
             )
         except (ValueError, TypeError):
@@ -234,7 +228,29 @@ def _get_filtered_transactions(
     elif page > 1:
         query = query.offset((page - 1) * per_page)
 
-    items = query.limit(per_page).all()
+    query = query.options(
+        joinedload(ShiftReportTransaction.branch),
+        joinedload(ShiftReportTransaction.recorder),
+        joinedload(ShiftReportTransaction.closer), # SỬA
+        joinedload(ShiftReportTransaction.deleter)
+    ).limit(per_page)
+    return query, count_q
+
+def _get_filtered_transactions(db: Session, **filters) -> Tuple[List[ShiftReportTransaction], int]:
+    """
+    Hàm dịch vụ để lấy danh sách các giao dịch đã được lọc và phân trang (Session sync).
+    Tham số lọc: xem _build_transactions_query.
+    """
+    query, count_q = _build_transactions_query(**filters)
+    total_records = db.execute(count_q).scalar_one()
+    items = db.execute(query).scalars().all()
+    return items, total_records
+
+async def _get_filtered_transactions_async(db: AsyncSession, **filters) -> Tuple[List[ShiftReportTransaction], int]:
+    """Như _get_filtered_transactions nhưng chạy trên AsyncSession, không chặn event loop."""
+    query, count_q = _build_transactions_query(**filters)
+    total_records = (await db.execute(count_q)).scalar_one()
+    items = (await db.execute(query)).scalars().all()
     return items, total_records
 
 # ----------------------------------------------------------------------
@@ -275,36 +291,17 @@ async def shift_report_page(
     active_branch = "" # Sẽ lưu chi nhánh hoạt động của Lễ tân
     
     if user_data.get("role") == 'letan':
-        # 1. Ưu tiên hàng đầu: Chi nhánh đã chọn chủ động (GPS/chọn tay)
-        session_branch = request.session.get("active_branch")
-        if session_branch:
-            active_branch = session_branch
-        else:
-            # 2. Nếu không có, query DB để lấy `last_active_branch`
-            user_from_db = db.query(User).filter(User.id == user_data.get("id")).first()
-            if user_from_db and user_from_db.last_active_branch:
-                active_branch = user_from_db.last_active_branch # <-- Đây là B10
-            else:
-                # 3. Nếu vẫn không có, dùng chi nhánh chính (mặc định)
-                active_branch = user_data.get("branch", "")
+        # Session -> last_active_branch trong DB -> chi nhánh chính (dùng chung context của request)
+        active_branch = get_active_branch(request, db, user_data) or ""
     
     # === KẾT THÚC SỬA LỖI ===
 
-    # SỬA: Map trạng thái mới
-    status_display_map = {
-        s.value: map_status_to_vietnamese(s.value) 
-        for s in ShiftReportStatus if s != ShiftReportStatus.DELETED
-    }
-    
     # SỬA: Sắp xếp lại loại giao dịch theo thứ tự mong muốn
     desired_order = ["BRANCH_ACCOUNT", "COMPANY_ACCOUNT", "OTA", "UNC", "CARD", "CASH_EXPENSE"]
     sorted_transaction_types = sorted(
         [t for t in TransactionType], 
         key=lambda t: desired_order.index(t.value) if t.value in desired_order else len(desired_order)
     )
-    type_display_map = {
-        key: value for key, value in SHIFT_TRANSACTION_TYPES.items()
-    }
     
     # --- SỬA: SỬ DỤNG HÀM DỊCH VỤ ĐỂ LẤY DỮ LIỆU BAN ĐẦU ---
     branch_to_filter = chi_nhanh
@@ -335,8 +332,6 @@ async def shift_report_page(
         "user": user_data,
         "statuses": [s for s in ShiftReportStatus if s != ShiftReportStatus.DELETED],
         "transaction_types": sorted_transaction_types,
-        "status_display_map": status_display_map, 
-        "type_display_map": type_display_map, 
         "initial_branch_filter": active_branch, # <-- Đảm bảo B10 được chọn
         "branches": display_branches, 
         "display_branches": display_branches,
@@ -363,7 +358,7 @@ async def shift_report_page(
 @router.get("/api", response_model=ShiftTransactionsResponse) # SỬA
 async def api_shift_report_transactions( # SỬA
     request: Request, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db), # SỬA: AsyncSession, không chặn event loop
     page: int = 1, # THÊM: Nhận tham số page
     per_page: int = 20,
     search: Optional[str] = None,
@@ -383,10 +378,10 @@ async def api_shift_report_transactions( # SỬA
 
     active_branch_for_letan = None
     if user_data.get("role") == 'letan' and not chi_nhanh:
-        active_branch_for_letan = get_active_branch(request, db, user_data)
+        active_branch_for_letan = await get_active_branch_async(request, db, user_data)
 
-    # SỬA: Gọi hàm filter mới
-    items, total_records = _get_filtered_transactions(
+    # SỬA: Gọi hàm filter mới (bản async)
+    items, total_records = await _get_filtered_transactions_async(
         db=db,
         user_data=user_data,
         per_page=per_page,
@@ -454,18 +449,8 @@ async def add_shift_transaction( # SỬA
         # Nếu form (đã sửa ở HTML) gửi "B10", chi_nhanh_code sẽ là "B10".
         # Nếu form không gửi (lỗi), chúng ta phải tự tìm "B10".
         if not chi_nhanh_code:
-            # 1. Ưu tiên session 'active_branch' (do GPS/chọn tay)
-            active_branch_session = request.session.get("active_branch")
-            if active_branch_session:
-                chi_nhanh_code = active_branch_session
-            else:
-                # 2. Lấy last_active_branch từ DB
-                user_from_db = db.query(User).filter(User.id == user_data.get("id")).first()
-                if user_from_db and user_from_db.last_active_branch:
-                    chi_nhanh_code = user_from_db.last_active_branch # Đây là "B10"
-                else:
-                    # 3. Fallback về chi nhánh chính (logic cũ)
-                    chi_nhanh_code = user_data.get("branch", "")
+            # Session -> last_active_branch trong DB -> chi nhánh chính
+            chi_nhanh_code = get_active_branch(request, db, user_data) or ""
     
     # Admin/Boss/Quản lý phải gửi chi nhánh từ form
     elif not chi_nhanh_code:
@@ -505,7 +490,9 @@ async def add_shift_transaction( # SỬA
     db.commit()
     # SỬA: Refresh quan hệ
     db.refresh(new_transaction, ["branch", "recorder"]) 
-    return {"status": "success", "message": "Đã thêm giao dịch thành công.", "item": _serialize_transaction(new_transaction)}
+    serialized_item = _serialize_transaction(new_transaction)
+    _publish_transaction_delta("created", [serialized_item])
+    return {"status": "success", "message": "Đã thêm giao dịch thành công.", "item": serialized_item}
 
 # ----------------------------------------------------------------------
 # ENDPOINT CHỈNH SỬA (SỬA)
@@ -561,6 +548,8 @@ async def edit_shift_transaction_details( # SỬA
         raise HTTPException(status_code=400, detail="Chi nhánh không hợp lệ.")
     # ---
 
+    previous_branch_code = item.branch.branch_code if item.branch else None
+
     # SỬA: Cập nhật các trường mới
     item.transaction_type = transaction_type
     try:
@@ -577,7 +566,12 @@ async def edit_shift_transaction_details( # SỬA
     db.commit()
     # SỬA: Refresh quan hệ
     db.refresh(item, ["branch", "recorder", "closer", "deleter"])
-    return {"status": "success", "message": "Đã cập nhật giao dịch thành công.", "item": _serialize_transaction(item)}
+    serialized_item = _serialize_transaction(item)
+    if previous_branch_code != branch.branch_code:
+        # Giao dịch chuyển sang chi nhánh khác: gỡ khỏi danh sách của chi nhánh cũ
+        publish_branch_delta(previous_branch_code, "shift_report", "deleted", [item.id])
+    _publish_transaction_delta("updated", [serialized_item])
+    return {"status": "success", "message": "Đã cập nhật giao dịch thành công.", "item": serialized_item}
 
 # ----------------------------------------------------------------------
 # ENDPOINT CẬP NHẬT TRẠNG THÁI (SỬA)
@@ -618,7 +612,9 @@ async def update_shift_transaction_status( # SỬA
     db.commit()
     # SỬA: Refresh TẤT CẢ các quan hệ
     db.refresh(item, ["branch", "recorder", "closer", "deleter"])
-    return {"status": "success", "message": "Đã cập nhật trạng thái.", "item": _serialize_transaction(item)}
+    serialized_item = _serialize_transaction(item)
+    _publish_transaction_delta("closed" if action == "close" else "updated", [serialized_item])
+    return {"status": "success", "message": "Đã cập nhật trạng thái.", "item": serialized_item}
 
 # ----------------------------------------------------------------------
 # ENDPOINT XÓA (SỬA: Chỉ đổi tên model/status)
@@ -644,55 +640,15 @@ async def delete_shift_transaction( # SỬA
 
     if user_role in ["admin", "boss"] and hard_delete:
         item_id_to_delete = item.id
+        branch_code_of_item = item.branch.branch_code if item.branch else None
         
-        # 1. Tìm tất cả các bản ghi ShiftCloseLog có chứa ID của giao dịch này
-        logs_to_update = db.query(ShiftCloseLog).filter(
-            ShiftCloseLog.closed_transaction_ids.isnot(None), # Đảm bảo cột không phải NULL
-            ShiftCloseLog.closed_transaction_ids.cast(JSONB).op("?")(str(item_id_to_delete))
-        ).all()
-
-        for log_entry in logs_to_update:
-            # 2. Xóa ID của giao dịch khỏi danh sách
-            current_ids = log_entry.closed_transaction_ids
-            if not isinstance(current_ids, list):
-                logger.warning(f"closed_transaction_ids cho log {log_entry.id} không phải là list: {current_ids}")
-                continue
-
-            # Lọc bỏ ID của giao dịch đã xóa
-            try:
-                current_ids = [tx_id for tx_id in current_ids if tx_id != item_id_to_delete]
-            except TypeError: # Xử lý trường hợp các phần tử có thể là string nếu JSON không chặt chẽ
-                current_ids = [tx_id for tx_id in current_ids if str(tx_id) != str(item_id_to_delete)]
-
-            log_entry.closed_transaction_ids = current_ids
-
-            if not current_ids:
-                # Nếu không còn giao dịch nào, xóa bản ghi log
-                db.delete(log_entry)
-                logger.info(f"ShiftCloseLog {log_entry.id} đã bị xóa do không còn giao dịch nào.")
-            else:
-                # 3. Tính toán lại doanh thu dựa trên các giao dịch còn lại
-                remaining_transactions = db.query(ShiftReportTransaction).filter(
-                    ShiftReportTransaction.id.in_(current_ids)
-                ).all()
-
-                closed_online_revenue = 0
-                closed_branch_revenue = 0
-                
-                for tx in remaining_transactions:
-                    if tx.transaction_type in [TransactionType.OTA, TransactionType.UNC, TransactionType.CARD, TransactionType.COMPANY_ACCOUNT]:
-                        closed_online_revenue += tx.amount
-                    elif tx.transaction_type == TransactionType.CASH_EXPENSE:
-                        closed_online_revenue -= tx.amount
-                    elif tx.transaction_type == TransactionType.BRANCH_ACCOUNT:
-                        closed_branch_revenue += tx.amount
-                
-                log_entry.closed_online_revenue = closed_online_revenue
-                log_entry.closed_branch_revenue = closed_branch_revenue
-                logger.info(f"ShiftCloseLog {log_entry.id} đã tính toán lại doanh thu sau khi xóa giao dịch {item_id_to_delete}.")
+        # Gỡ giao dịch khỏi các log kết ca và tính lại doanh thu: chạy sau trong hàng đợi việc,
+        # việc được ghi cùng transaction với lệnh xóa nên không bị mất
+        enqueue(db, DETACH_CLOSE_LOG_TRANSACTIONS_JOB, {"transaction_ids": [item_id_to_delete]})
 
         db.delete(item)
         db.commit()
+        publish_branch_delta(branch_code_of_item, "shift_report", "deleted", [item_id_to_delete])
         return JSONResponse({
             "status": "success", 
             "message": "Đã xóa vĩnh viễn giao dịch.",
@@ -706,10 +662,12 @@ async def delete_shift_transaction( # SỬA
         item.deleted_datetime = now
         db.commit()
         db.refresh(item, ["branch", "recorder", "closer", "deleter"]) # SỬA
+        serialized_item = _serialize_transaction(item)
+        _publish_transaction_delta("updated", [serialized_item], soft_deleted=True)
         return JSONResponse({
             "status": "success", 
             "message": "Đã xóa giao dịch thành công.",
-            "item": _serialize_transaction(item), # SỬA
+            "item": serialized_item, # SỬA
             "hard_delete": False
         })
 
@@ -746,6 +704,12 @@ async def batch_delete_shift_transactions( # SỬA
                 })
 
             ids_to_process = [t.id for t in transactions_to_delete]
+            # Ghi nhớ chi nhánh trước khi xóa để phát delta sau khi commit
+            branch_code_by_id = dict(
+                db.query(ShiftReportTransaction.id, Branch.branch_code).join(
+                    Branch, ShiftReportTransaction.branch_id == Branch.id
+                ).filter(ShiftReportTransaction.id.in_(ids_to_process)).all()
+            )
 
             deleted_ids = []
             for item_id_to_delete in ids_to_process:
@@ -754,51 +718,17 @@ async def batch_delete_shift_transactions( # SỬA
                     logger.warning(f"Giao dịch {item_id_to_delete} không tìm thấy để xóa hàng loạt.")
                     continue
 
-                # 1. Tìm tất cả các bản ghi ShiftCloseLog có chứa ID của giao dịch này
-                logs_to_update = db.query(ShiftCloseLog).filter(
-                    ShiftCloseLog.closed_transaction_ids.isnot(None),
-                    ShiftCloseLog.closed_transaction_ids.cast(JSONB).op("?")(str(item_id_to_delete))
-                ).all()
-
-                for log_entry in logs_to_update:
-                    # 2. Xóa ID của giao dịch khỏi danh sách
-                    current_ids = log_entry.closed_transaction_ids
-                    if not isinstance(current_ids, list):
-                        logger.warning(f"closed_transaction_ids cho log {log_entry.id} không phải là list: {current_ids}")
-                        continue
-
-                    try:
-                        current_ids = [tx_id for tx_id in current_ids if tx_id != item_id_to_delete]
-                    except TypeError:
-                        current_ids = [tx_id for tx_id in current_ids if str(tx_id) != str(item_id_to_delete)]
-
-                    log_entry.closed_transaction_ids = current_ids
-
-                    if not current_ids:
-                        db.delete(log_entry)
-                        logger.info(f"ShiftCloseLog {log_entry.id} đã bị xóa do không còn giao dịch nào.")
-                    else:
-                        # 3. Tính toán lại doanh thu dựa trên các giao dịch còn lại
-                        remaining_transactions = db.query(ShiftReportTransaction).filter(
-                            ShiftReportTransaction.id.in_(current_ids)
-                        ).all()
-
-                        closed_online_revenue = 0
-                        closed_branch_revenue = 0
-                        for tx in remaining_transactions:
-                            if tx.transaction_type in [TransactionType.OTA, TransactionType.UNC, TransactionType.CARD, TransactionType.COMPANY_ACCOUNT]:
-                                closed_online_revenue += tx.amount
-                            elif tx.transaction_type == TransactionType.CASH_EXPENSE:
-                                closed_online_revenue -= tx.amount
-                            elif tx.transaction_type == TransactionType.BRANCH_ACCOUNT:
-                                closed_branch_revenue += tx.amount
-                        log_entry.closed_online_revenue = closed_online_revenue
-                        log_entry.closed_branch_revenue = closed_branch_revenue
-                        logger.info(f"ShiftCloseLog {log_entry.id} revenues recalculated after transaction {item_id_to_delete} removal.")
-                
                 db.delete(item)
                 deleted_ids.append(item_id_to_delete)
+            if deleted_ids:
+                enqueue(db, DETACH_CLOSE_LOG_TRANSACTIONS_JOB, {"transaction_ids": deleted_ids})
             db.commit()
+
+            deleted_ids_by_branch = {}
+            for deleted_id in deleted_ids:
+                deleted_ids_by_branch.setdefault(branch_code_by_id.get(deleted_id), []).append(deleted_id)
+            for branch_code, branch_deleted_ids in deleted_ids_by_branch.items():
+                publish_branch_delta(branch_code, "shift_report", "deleted", branch_deleted_ids)
             return JSONResponse({
                 "status": "success", 
                 "message": f"Đã xóa vĩnh viễn {len(deleted_ids)} mục.",
@@ -839,6 +769,7 @@ async def batch_delete_shift_transactions( # SỬA
             ).filter(ShiftReportTransaction.id.in_(ids_to_process)).all()
             
             serialized_items = [_serialize_transaction(item) for item in updated_items] # SỬA
+            _publish_transaction_delta("updated", serialized_items, soft_deleted=True)
 
             return JSONResponse({
                 "status": "success", 
@@ -957,7 +888,9 @@ async def batch_close_transactions(
 
         # 4. Trả về kết quả thành công
         # Frontend (hàm executeBatchClose) đã xử lý 'success' đúng
-        return {"status": "success", "message": f"Đã kết ca thành công {num_updated} giao dịch.", "items": [_serialize_transaction(item) for item in updated_items], "log_id": new_log_id}
+        serialized_items = [_serialize_transaction(item) for item in updated_items]
+        _publish_transaction_delta("closed", serialized_items)
+        return {"status": "success", "message": f"Đã kết ca thành công {num_updated} giao dịch.", "items": serialized_items, "log_id": new_log_id}
 
     except Exception as e:
         db.rollback()
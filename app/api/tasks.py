@@ -1,24 +1,26 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session, aliased, joinedload
+from ..core.templating import templates
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
 from typing import Optional, List
 
 # Import từ các module đã tái cấu trúc
 from ..db.session import get_db
 from ..db.models import User, Task, Branch, Department
-from ..core.security import get_active_branch
-from ..core.utils import format_datetime_display, VN_TZ, clean_query_string, parse_datetime_input
-from ..services.task_service import get_task_stats
+from ..core.security import get_active_branch, get_user_context
+from ..core.utils import format_datetime_display, VN_TZ, clean_query_string, parse_datetime_input, encode_cursor, decode_cursor
+from ..services.task_service import (
+    get_task_stats, get_cached_task_read, invalidate_task_read_cache,
+    effective_task_status, overdue_condition, pending_condition,
+)
+from ..services.live_feed_service import publish_branch_delta
 from ..core.config import logger
-from ..schemas.task import Task as TaskSchema
 
 # Import các thành phần SQLAlchemy cần thiết
 from datetime import datetime, timedelta
-import secrets, json
-from sqlalchemy import case, or_, func
+import secrets, json, hashlib
+from sqlalchemy import or_, func, select, tuple_
 from urllib.parse import urlencode
-import os
 
 from ..core.config import DEPARTMENTS
 from fastapi import Query
@@ -27,16 +29,10 @@ from fastapi.encoders import jsonable_encoder
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
-# os.path.dirname(__file__) -> app/api
-# os.path.join(..., "..") -> app/
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-
-# Tạo đường dẫn tuyệt đối đến thư mục templates
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
 
 def task_to_dict(t: Task) -> dict:
     """Hàm helper để chuyển đổi một đối tượng Task SQLAlchemy thành dict."""
+    status = effective_task_status(t.status, t.due_date)
     return {
         "id": t.id,
         "id_task": t.id_task,
@@ -47,14 +43,23 @@ def task_to_dict(t: Task) -> dict:
         "ngay_tao": format_datetime_display(t.created_at, with_time=True),
         "han_hoan_thanh": format_datetime_display(t.due_date, with_time=True),
         "han_hoan_thanh_raw": t.due_date.isoformat() if t.due_date else None,
-        "trang_thai": t.status,
+        "trang_thai": status,
         "nguoi_tao": f"{t.author.name} ({t.author.employee_code})" if t.author else "N/A",
         "ghi_chu": t.notes or "",
         "nguoi_thuc_hien": t.assignee.name if t.assignee else "",
         "ngay_hoan_thanh": format_datetime_display(t.completed_at, with_time=True) if t.completed_at else "",
-        "is_overdue": t.status == "Quá hạn",
+        "is_overdue": status == "Quá hạn",
     }
 
+def _publish_task_delta(action: str, tasks: List[Task], soft_deleted: bool = False):
+    """Phát delta công việc lên kênh của từng chi nhánh liên quan."""
+    items_by_branch = {}
+    for t in tasks:
+        item = task_to_dict(t)
+        items_by_branch.setdefault(item["chi_nhanh"], []).append(item)
+    for branch_code, items in items_by_branch.items():
+        publish_branch_delta(branch_code, "tasks", action, [item["id"] for item in items], items, soft_deleted=soft_deleted)
+
 @router.get("/tasks", response_class=HTMLResponse)
 def home(
     request: Request,
@@ -74,47 +79,63 @@ def home(
         return RedirectResponse("/login", status_code=303)
 
     # Lấy thông tin user từ session theo cấu trúc mới
-    user_employee_code = user_data["code"]
     user_role = user_data["role"]
     user_name = user_data["name"]
 
-    user_from_db = db.query(User).filter(User.employee_code == user_employee_code).first()
-
-    # Logic xác định chi nhánh hoạt động (giữ nguyên)
-    active_branch = (
-        request.session.get("active_branch")
-        or (user_from_db.last_active_branch if user_from_db else None)
-        or user_data.get("branch")
-    )
+    # Logic xác định chi nhánh hoạt động: session -> last_active_branch trong DB -> chi nhánh chính
+    # (dùng chung context của request, chỉ query User khi session chưa có chi nhánh)
+    active_branch = get_active_branch(request, db, user_data)
 
     # Logic xác định chi nhánh để lọc query (giữ nguyên)
     branch_to_filter = chi_nhanh
     if user_role == 'letan' and not chi_nhanh:
         branch_to_filter = active_branch
 
-    # Query công việc bằng hàm helper mới
-    tasks_query = _get_filtered_tasks_query(
-        db, user_data, branch_to_filter, search, trang_thai, han_hoan_thanh,bo_phan
+    # === TỐI ƯU: Lọc một lần trong CTE chỉ chứa các cột cần thiết (không join/load quan hệ) ===
+    # Thống kê + tổng số lấy trong 1 truy vấn tổng hợp (có cache theo bộ lọc),
+    # trang hiện tại lấy theo id, quan hệ được nạp bằng selectinload.
+    filtered_tasks = _apply_task_filters(
+        select(Task.id, Task.status, Task.status_rank, Task.due_date, Task.completed_at),
+        user_data, branch_to_filter, search, trang_thai, han_hoan_thanh, bo_phan
+    ).cte("filtered_tasks")
+
+    start_of_week = today.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=today.weekday())
+    stats_cache_key = (
+        "task-stats", user_role in ["quanly", "admin", "boss"], branch_to_filter, search, trang_thai, han_hoan_thanh, bo_phan,
+        start_of_week.date(), today.month,
+    )
+    thong_ke = get_cached_task_read(
+        db, stats_cache_key, lambda: _compute_task_stats(db, filtered_tasks, start_of_week, today)
     )
 
-    total_tasks = tasks_query.count()
+    total_tasks = thong_ke["tong_cong_viec"]
     total_pages = max(1, (total_tasks + per_page - 1) // per_page)
 
-    # Sắp xếp (cập nhật tên cột)
-    order = {"Quá hạn": 0, "Đang chờ": 1, "Hoàn thành": 2, "Đã xoá": 3}
-    rows = (
-        tasks_query.order_by(
-            case(order, value=Task.status, else_=99),
-            Task.due_date.nullslast(),
-        )
+    # Sắp xếp theo trạng thái rồi hạn hoàn thành (thêm id để thứ tự giữa các trang ổn định).
+    # status_rank là cột lưu sẵn (xem TASK_STATUS_RANK_SQL) -> khớp index, không phải sort toàn bộ.
+    page_ids = (
+        select(filtered_tasks.c.id)
+        .order_by(filtered_tasks.c.status_rank, filtered_tasks.c.due_date, filtered_tasks.c.id)
         .offset((page - 1) * per_page)
         .limit(per_page)
-        .all()
     )
+    rows = db.scalars(
+        select(Task)
+        .options(
+            selectinload(Task.branch),
+            selectinload(Task.author),
+            selectinload(Task.assignee),
+            selectinload(Task.deleter),
+        )
+        .where(Task.id.in_(page_ids.scalar_subquery()))
+        .order_by(Task.status_rank, Task.due_date, Task.id)
+    ).all()
 
     # Chuẩn bị dữ liệu để hiển thị (lấy từ relationship)
     tasks = []
     for t in rows:
+        # Trạng thái tính theo due_date tại thời điểm đọc (công việc vừa tới hạn có thể chưa được lật trong DB)
+        status = effective_task_status(t.status, t.due_date, today)
         tasks.append({
             "id": t.id,
             "id_task": t.id_task, # Thêm ID công việc
@@ -125,45 +146,25 @@ def home(
             "ngay_tao": format_datetime_display(t.created_at, with_time=True), # Giữ nguyên ngày tạo có giờ
             "han_hoan_thanh": format_datetime_display(t.due_date, with_time=True), # Sửa: Hạn hoàn thành có giờ
             "han_hoan_thanh_raw": t.due_date.isoformat() if t.due_date else None,
-            "trang_thai": t.status,
+            "trang_thai": status,
             "nguoi_tao": f"{t.author.name} ({t.author.employee_code})" if t.author else "N/A", # Sửa: Thêm mã nhân viên
             "ghi_chu": t.notes or "",
             "nguoi_thuc_hien": t.assignee.name if t.assignee else "",
             "ngay_hoan_thanh": format_datetime_display(t.completed_at, with_time=True) if t.completed_at else "",
             "nguoi_xoa": t.deleter.name if t.deleter else "",
             "ngay_xoa": format_datetime_display(t.deleted_at, with_time=True) if t.deleted_at else "",
-            "is_overdue": t.status == "Quá hạn",
+            "is_overdue": status == "Quá hạn",
         })
 
-    # === TỐI ƯU HÓA: Lấy tất cả thống kê trong một truy vấn duy nhất ===
-    start_of_week = today.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=today.weekday())
-    
-    stats_result = tasks_query.with_entities(
-        func.count(Task.id).label("total_tasks"),
-        func.count(case((Task.status == "Hoàn thành", Task.id))).label("hoan_thanh"),
-        func.count(case(((Task.status == "Hoàn thành") & (Task.completed_at >= start_of_week), Task.id))).label("hoan_thanh_tuan"),
-        func.count(case(((Task.status == "Hoàn thành") & (func.extract("month", Task.completed_at) == today.month), Task.id))).label("hoan_thanh_thang"),
-        func.count(case((Task.status == "Đang chờ", Task.id))).label("dang_cho"),
-        func.count(case((Task.status == "Quá hạn", Task.id))).label("qua_han")
-    ).first()
-
-    thong_ke = {
-        "tong_cong_viec": stats_result.total_tasks if stats_result else 0,
-        "hoan_thanh": stats_result.hoan_thanh if stats_result else 0,
-        "hoan_thanh_tuan": stats_result.hoan_thanh_tuan if stats_result else 0,
-        "hoan_thanh_thang": stats_result.hoan_thanh_thang if stats_result else 0,
-        "dang_cho": stats_result.dang_cho if stats_result else 0,
-        "qua_han": stats_result.qua_han if stats_result else 0,
-    }
-
-    # Lấy danh sách chi nhánh từ DB và sắp xếp theo yêu cầu (B1, B2, B3...)
-    all_branches_obj = db.query(Branch).filter(func.lower(Branch.branch_code).notin_(['admin', 'boss'])).all()
+    # Lấy danh sách mã chi nhánh từ DB (chỉ 1 cột) và sắp xếp theo yêu cầu (B1, B2, B3...)
+    all_branch_codes = db.scalars(
+        select(Branch.branch_code).where(func.lower(Branch.branch_code).notin_(['admin', 'boss']))
+    ).all()
 
     # Logic sắp xếp chi nhánh tùy chỉnh
     b_branches = []
     other_branches = []
-    for b in all_branches_obj:
-        branch_code = b.branch_code
+    for branch_code in all_branch_codes:
         if branch_code.startswith('B') and branch_code[1:].isdigit():
             b_branches.append(branch_code)
         else:
@@ -212,6 +213,30 @@ def home(
     response.headers["Expires"] = "0"
     return response
 
+def _compute_task_stats(db: Session, filtered_tasks, start_of_week: datetime, now: datetime) -> dict:
+    """
+    Tổng số và thống kê trạng thái trong một truy vấn tổng hợp trên CTE đã lọc.
+    "Đang chờ"/"Quá hạn" tính theo due_date tại thời điểm `now`.
+    """
+    month = now.month
+    completed = filtered_tasks.c.status == "Hoàn thành"
+    stats_result = db.execute(select(
+        func.count().label("total_tasks"),
+        func.count().filter(completed).label("hoan_thanh"),
+        func.count().filter(completed & (filtered_tasks.c.completed_at >= start_of_week)).label("hoan_thanh_tuan"),
+        func.count().filter(completed & (func.extract("month", filtered_tasks.c.completed_at) == month)).label("hoan_thanh_thang"),
+        func.count().filter(pending_condition(filtered_tasks.c.status, filtered_tasks.c.due_date, now)).label("dang_cho"),
+        func.count().filter(overdue_condition(filtered_tasks.c.status, filtered_tasks.c.due_date, now)).label("qua_han"),
+    )).one()
+    return {
+        "tong_cong_viec": stats_result.total_tasks,
+        "hoan_thanh": stats_result.hoan_thanh,
+        "hoan_thanh_tuan": stats_result.hoan_thanh_tuan,
+        "hoan_thanh_thang": stats_result.hoan_thanh_thang,
+        "dang_cho": stats_result.dang_cho,
+        "qua_han": stats_result.qua_han,
+    }
+
 def _get_filtered_tasks_query(
     db: Session,
     user_data: dict,
@@ -224,9 +249,6 @@ def _get_filtered_tasks_query(
     """
     Hàm helper phiên bản mới, query công việc dựa trên kiến trúc database chuẩn hóa.
     """
-    Author = aliased(User, name="author")
-    Assignee = aliased(User, name="assignee")
-
     # Bắt đầu query với options để load sẵn các relationship cần thiết
     tasks_query = db.query(Task).options(
         joinedload(Task.branch),
@@ -234,11 +256,28 @@ def _get_filtered_tasks_query(
         joinedload(Task.assignee),
         joinedload(Task.deleter) # Thêm joinedload cho người xóa
     )
+    return _apply_task_filters(tasks_query, user_data, chi_nhanh, search, trang_thai, han_hoan_thanh, bo_phan)
 
-    # Chỉ join với các bảng cần thiết để lọc
-    tasks_query = tasks_query.join(Task.branch)
-    tasks_query = tasks_query.outerjoin(Author, Task.author)
-    tasks_query = tasks_query.outerjoin(Assignee, Task.assignee)
+def _apply_task_filters(
+    tasks_query,
+    user_data: dict,
+    chi_nhanh: str = "",
+    search: str = "",
+    trang_thai: str = "",
+    han_hoan_thanh: str = "",
+    bo_phan: str = ""
+):
+    """
+    Áp dụng bộ lọc danh sách công việc lên một query có bảng Task (ORM Query hoặc select()).
+    Chỉ outer join người tạo/người thực hiện khi có từ khóa tìm kiếm.
+    """
+    # Join chi nhánh để lọc theo mã/tên chi nhánh
+    tasks_query = tasks_query.join(Branch, Task.branch_id == Branch.id)
+    if search:
+        Author = aliased(User, name="author")
+        Assignee = aliased(User, name="assignee")
+        tasks_query = tasks_query.outerjoin(Author, Task.author_id == Author.id)
+        tasks_query = tasks_query.outerjoin(Assignee, Task.assignee_id == Assignee.id)
 
 
     # Lọc theo trạng thái (loại bỏ "Đã xoá" cho vai trò không phải quản lý)
@@ -246,9 +285,12 @@ def _get_filtered_tasks_query(
     if role not in ["quanly", "admin", "boss"]:
         tasks_query = tasks_query.filter(Task.status != "Đã xoá")
 
-    # Lọc theo chi nhánh (dựa trên branch_code)
+    # Lọc theo chi nhánh (dựa trên branch_code).
+    # TỐI ƯU: So sánh trực tiếp Task.branch_id với id tra một lần (InitPlan) để dùng được
+    # index (branch_id, status_rank, due_date, id) cho cả lọc lẫn sắp xếp.
     if chi_nhanh:
-        tasks_query = tasks_query.filter(Branch.branch_code == chi_nhanh)
+        branch_id = select(Branch.id).where(Branch.branch_code == chi_nhanh).scalar_subquery()
+        tasks_query = tasks_query.filter(Task.branch_id == branch_id)
 
     # Lọc theo từ khóa tìm kiếm
     if search:
@@ -267,7 +309,12 @@ def _get_filtered_tasks_query(
         )
 
     # Lọc theo trạng thái cụ thể
-    if trang_thai:
+    # ("Quá hạn"/"Đang chờ" tính theo due_date tại thời điểm đọc)
+    if trang_thai == "Quá hạn":
+        tasks_query = tasks_query.filter(overdue_condition(Task.status, Task.due_date, datetime.now(VN_TZ)))
+    elif trang_thai == "Đang chờ":
+        tasks_query = tasks_query.filter(pending_condition(Task.status, Task.due_date, datetime.now(VN_TZ)))
+    elif trang_thai:
         tasks_query = tasks_query.filter(Task.status == trang_thai)
 
     if bo_phan:
@@ -305,7 +352,7 @@ def add_task(
 
     # Lấy id của chi nhánh và người tạo
     branch = db.query(Branch).filter(Branch.branch_code == chi_nhanh).first()
-    author = db.query(User).filter(User.id == user_session["id"]).first()
+    author = get_user_context(request, db, user_session).user
 
     if not branch or not author:
         raise HTTPException(status_code=400, detail="Chi nhánh hoặc người tạo không hợp lệ.")
@@ -339,7 +386,9 @@ def add_task(
     )
     db.add(new_task)
     db.commit()
+    invalidate_task_read_cache()
     db.refresh(new_task) # Lấy dữ liệu mới nhất từ DB, bao gồm cả relationships
+    _publish_task_delta("created", [new_task])
 
     if request.query_params.get("json") == "1":
         return JSONResponse({"success": True, "task": task_to_dict(new_task)})
@@ -368,6 +417,8 @@ async def complete_task(task_id: int, request: Request, db: Session = Depends(ge
     task.completed_at = datetime.now(VN_TZ) # <-- SỬA: Sử dụng múi giờ Việt Nam
 
     db.commit()
+    invalidate_task_read_cache()
+    _publish_task_delta("updated", [task])
 
     if request.query_params.get("json") == "1":
         return JSONResponse({"success": True, "task_id": task_id})
@@ -390,7 +441,9 @@ async def delete_task(task_id: int, request: Request, db: Session = Depends(get_
         raise HTTPException(status_code=404, detail="Không tìm thấy công việc")
 
     # Kiểm tra vai trò từ session
-    if user_session.get("role") in ["quanly", "admin", "boss"]:
+    hard_delete = user_session.get("role") in ["quanly", "admin", "boss"]
+    branch_code = task.branch.branch_code if task.branch else None
+    if hard_delete:
         db.delete(task)
     else:
         # Cập nhật trạng thái, người xóa và thời gian xóa
@@ -400,6 +453,11 @@ async def delete_task(task_id: int, request: Request, db: Session = Depends(get_
         task.deleted_at = datetime.now(VN_TZ)
     
     db.commit()
+    invalidate_task_read_cache()
+    if hard_delete:
+        publish_branch_delta(branch_code, "tasks", "deleted", [task_id])
+    else:
+        _publish_task_delta("updated", [task], soft_deleted=True)
 
     if request.query_params.get("json") == "1":
         return JSONResponse({"success": True, "task_id": task_id})
@@ -430,7 +488,9 @@ async def soft_delete_task(task_id: int, request: Request, db: Session = Depends
     task.deleted_at = datetime.now(VN_TZ)
     
     db.commit()
+    invalidate_task_read_cache()
     db.refresh(task) # Refresh để lấy thông tin người xóa (deleter)
+    _publish_task_delta("updated", [task], soft_deleted=True)
 
     # Trả về JSON với thông tin task đã được cập nhật
     return JSONResponse({
@@ -460,8 +520,20 @@ async def batch_delete_permanent_tasks(
         if not task_ids:
             return JSONResponse({"success": False, "detail": "Không có công việc nào được chọn."}, status_code=400)
 
+        # Ghi nhớ chi nhánh trước khi xóa để phát delta sau khi commit
+        branch_rows = db.query(Task.id, Branch.branch_code).join(
+            Branch, Task.branch_id == Branch.id
+        ).filter(Task.id.in_(task_ids)).all()
+
         deleted_count = db.query(Task).filter(Task.id.in_(task_ids)).delete(synchronize_session=False)
         db.commit()
+        invalidate_task_read_cache()
+
+        deleted_ids_by_branch = {}
+        for deleted_id, branch_code in branch_rows:
+            deleted_ids_by_branch.setdefault(branch_code, []).append(deleted_id)
+        for branch_code, deleted_ids in deleted_ids_by_branch.items():
+            publish_branch_delta(branch_code, "tasks", "deleted", deleted_ids)
         return JSONResponse({"success": True, "deleted_count": deleted_count})
     except Exception as e:
         db.rollback()
@@ -498,6 +570,7 @@ async def batch_delete_soft_tasks(
         }, synchronize_session=False)
 
         db.commit()
+        invalidate_task_read_cache()
 
         # Lấy lại các công việc vừa được cập nhật để trả về cho frontend
         updated_tasks = db.query(Task).options(
@@ -506,6 +579,7 @@ async def batch_delete_soft_tasks(
             joinedload(Task.assignee),
             joinedload(Task.deleter)
         ).filter(Task.id.in_(task_ids)).all()
+        _publish_task_delta("updated", updated_tasks, soft_deleted=True)
 
         return JSONResponse({"success": True, "updated_count": updated_count, "tasks": [task_to_dict(t) for t in updated_tasks]})
     except Exception as e:
@@ -513,6 +587,81 @@ async def batch_delete_soft_tasks(
         logger.error(f"Lỗi khi xóa mềm công việc hàng loạt: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
 
+def _apply_task_keyset(tasks_query, cursor: dict):
+    """
+    Áp dụng điều kiện Keyset Pagination theo thứ tự (status_rank, due_date, id).
+    Trong cùng một status_rank, due_date hoặc luôn có hoặc luôn NULL, nên so sánh bộ là đủ:
+    - Cursor có hạn: (status_rank, due_date, id) > (r, d, i) -- các nhóm sau (kể cả nhóm NULL) đều lớn hơn ở phần tử đầu.
+    - Cursor trong nhóm NULL: chỉ còn so sánh (status_rank, id).
+    """
+    last_rank, last_due, last_id = cursor["r"], cursor["d"], cursor["i"]
+    if last_due is None:
+        return tasks_query.where(tuple_(Task.status_rank, Task.id) > (last_rank, last_id))
+    return tasks_query.where(tuple_(Task.status_rank, Task.due_date, Task.id) > (last_rank, last_due, last_id))
+
+@router.get("/api/tasks/page", response_class=JSONResponse)
+def get_tasks_page(
+    request: Request,
+    chi_nhanh: str = "",
+    search: str = "",
+    trang_thai: str = "",
+    han_hoan_thanh: str = "",
+    bo_phan: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Danh sách công việc dạng cuộn vô hạn (cùng bộ lọc và thứ tự với trang /tasks).
+    Dùng Keyset Pagination: mỗi trang chỉ đọc `limit` dòng tiếp theo trên index,
+    thời gian không tăng theo độ sâu như OFFSET. Trả về `nextCursor` để lấy trang kế tiếp.
+    """
+    user_data = request.session.get("user")
+    if not user_data:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    branch_to_filter = chi_nhanh
+    if user_data.get("role") == 'letan' and not chi_nhanh:
+        branch_to_filter = get_active_branch(request, db, user_data)
+
+    position = decode_cursor(cursor)
+    if cursor and (
+        position is None
+        or not isinstance(position.get("r"), int)
+        or not isinstance(position.get("i"), int)
+        or "d" not in position
+        # d phải là None (nhóm không có hạn) hoặc datetime; kiểu khác sẽ lỗi khi so sánh trong Postgres
+        or not (position["d"] is None or isinstance(position["d"], datetime))
+    ):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ.")
+
+    tasks_query = _apply_task_filters(
+        select(Task).options(
+            selectinload(Task.branch),
+            selectinload(Task.author),
+            selectinload(Task.assignee),
+        ),
+        user_data, branch_to_filter, search, trang_thai, han_hoan_thanh, bo_phan
+    ).order_by(Task.status_rank, Task.due_date, Task.id)
+    if position is not None:
+        tasks_query = _apply_task_keyset(tasks_query, position)
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    rows = db.scalars(tasks_query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor({"r": last.status_rank, "d": last.due_date, "i": last.id})
+
+    return JSONResponse(content={
+        "tasks": [task_to_dict(t) for t in rows],
+        "nextCursor": next_cursor,
+        "hasMore": has_more,
+    })
+
 @router.get("/api/tasks/calendar-events")
 def get_calendar_tasks(
     request: Request,
@@ -520,59 +669,85 @@ def get_calendar_tasks(
     end: date,
     db: Session = Depends(get_db)
 ):
+    """
+    Sự kiện cho FullCalendar: chỉ các cột cần để vẽ lịch (chi tiết lấy riêng qua /api/tasks/{id} khi click).
+    Kết quả đã tuần tự hóa được cache theo (vai trò, chi nhánh, khoảng ngày) cùng với ETag (hash của thân JSON);
+    cache được kiểm tra với thế hệ dữ liệu công việc trong DB ở mỗi request, nên sau khi công việc đổi ở worker
+    khác sẽ không trả bản cũ hay 304 cho ETag cũ. If-None-Match khớp -> 304 chỉ tốn một truy vấn đọc sequence.
+    """
     user_data = request.session.get("user")
     if not user_data:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
     # Lấy chi nhánh hoạt động để lọc (quan trọng cho lễ tân)
-    active_branch = get_active_branch(request, db, user_data)
+    is_manager = user_data.get("role") in ["quanly", "admin", "boss"]
     branch_to_filter = ""
     if user_data.get("role") == 'letan':
-        branch_to_filter = active_branch
+        branch_to_filter = get_active_branch(request, db, user_data)
 
-    # Dùng lại hàm filter nhưng chỉ lấy các task trong khoảng thời gian
-    tasks_query = _get_filtered_tasks_query(db, user_data, chi_nhanh=branch_to_filter)
+    cache_key = ("calendar-events", is_manager, branch_to_filter, start, end)
+    body, etag = get_cached_task_read(
+        db, cache_key, lambda: _build_calendar_events(db, is_manager, branch_to_filter, start, end)
+    )
 
-    # Thêm điều kiện lọc theo ngày
-    tasks_in_range = tasks_query.filter(
-        Task.due_date >= start,
-        Task.due_date < end
-    ).all()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _build_calendar_events(db: Session, is_manager: bool, branch_code: str, start: date, end: date):
+    """Truy vấn gọn theo index (branch_id, due_date), trả về (thân JSON, ETag)."""
+    events_query = select(
+        Task.id, Task.id_task, Task.description, Task.room_number, Task.due_date, Task.status
+    ).where(Task.due_date >= start, Task.due_date < end)
+    if not is_manager:
+        events_query = events_query.where(Task.status != "Đã xoá")
+    if branch_code:
+        branch_id = select(Branch.id).where(Branch.branch_code == branch_code).scalar_subquery()
+        events_query = events_query.where(Task.branch_id == branch_id)
+
+    # Chuyển đổi sang định dạng mà FullCalendar mong đợi (thuộc tính lạ được đưa vào extendedProps)
+    now = datetime.now(VN_TZ)
+    events = [
+        {
+            "id": row.id,
+            "title": row.description,
+            "start": row.due_date.isoformat(),
+            "id_task": row.id_task,
+            "phong": row.room_number,
+            "trang_thai": effective_task_status(row.status, row.due_date, now),
+        }
+        for row in db.execute(events_query.order_by(Task.due_date, Task.id))
+    ]
+    body = json.dumps(events, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    return body, etag
+
+@router.get("/api/tasks/{task_id:int}", response_class=JSONResponse)
+def get_task_detail(task_id: int, request: Request, db: Session = Depends(get_db)):
+    """Chi tiết một công việc (panel chi tiết khi click sự kiện trên lịch)."""
+    user_data = request.session.get("user")
+    if not user_data:
+        raise HTTPException(status_code=403, detail="Unauthorized")
 
-    # Chuyển đổi sang định dạng mà FullCalendar mong đợi
-    events = []
-    for task in tasks_in_range:
-        events.append({
-            "id": task.id,
-            "title": task.description,
-            "start": task.due_date.isoformat(),
-            "id_task": task.id_task, # Thêm ID công việc vào đây
-            "extendedProps": {
-                # SỬA LỖI: Thay vì dùng TaskSchema, tạo một dictionary đầy đủ thông tin đã được định dạng
-                # để khớp với cấu trúc mà hàm showTaskDetail() mong đợi.
-                "phong": task.room_number,
-                "trang_thai": task.status,
-                "task_data": {
-                    "id": task.id,
-                    "id_task": task.id_task,
-                    "chi_nhanh": task.branch.branch_code if task.branch else "N/A",
-                    "phong": task.room_number,
-                    "mo_ta": task.description,
-                    "department": task.department or "Chưa gán",
-                    "ngay_tao": format_datetime_display(task.created_at, with_time=True),
-                    "han_hoan_thanh": format_datetime_display(task.due_date, with_time=True),
-                    "han_hoan_thanh_raw": task.due_date.isoformat() if task.due_date else None,
-                    "trang_thai": task.status,
-                    "nguoi_tao": f"{task.author.name} ({task.author.employee_code})" if task.author else "N/A",
-                    "ghi_chu": task.notes or "",
-                    "nguoi_thuc_hien": task.assignee.name if task.assignee else "",
-                    "ngay_hoan_thanh": format_datetime_display(task.completed_at, with_time=True) if task.completed_at else "",
-                    "nguoi_xoa": task.deleter.name if task.deleter else "",
-                    "ngay_xoa": format_datetime_display(task.deleted_at, with_time=True) if task.deleted_at else "",
-                }
-            }
-        })
-    return JSONResponse(content=events)
+    task = db.scalars(
+        select(Task)
+        .options(
+            selectinload(Task.branch),
+            selectinload(Task.author),
+            selectinload(Task.assignee),
+            selectinload(Task.deleter),
+        )
+        .where(Task.id == task_id)
+    ).first()
+    if not task or (task.status == "Đã xoá" and user_data.get("role") not in ["quanly", "admin", "boss"]):
+        raise HTTPException(status_code=404, detail="Không tìm thấy công việc")
+
+    return JSONResponse({
+        **task_to_dict(task),
+        "nguoi_xoa": task.deleter.name if task.deleter else "",
+        "ngay_xoa": format_datetime_display(task.deleted_at, with_time=True) if task.deleted_at else "",
+    })
 
 @router.post("/edit/{task_id}")
 async def edit_submit(
@@ -608,6 +783,8 @@ async def edit_submit(
 
     now = datetime.now(VN_TZ)
 
+    previous_branch_code = task.branch.branch_code if task.branch else None
+
     # Cập nhật các cột mới
     task.branch_id = branch.id
     task.room_number = vi_tri
@@ -623,7 +800,12 @@ async def edit_submit(
         task.status = "Đang chờ" # Nếu không có hạn, mặc định là đang chờ
 
     db.commit()
+    invalidate_task_read_cache()
     db.refresh(task)
+    if previous_branch_code != branch.branch_code:
+        # Công việc chuyển sang chi nhánh khác: gỡ khỏi danh sách của chi nhánh cũ
+        publish_branch_delta(previous_branch_code, "tasks", "deleted", [task.id])
+    _publish_task_delta("updated", [task])
 
     if request.query_params.get("json") == "1":
         return JSONResponse({"success": True, "task": task_to_dict(task)})
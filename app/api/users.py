@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Request, Form, HTTPException, Depends
 from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
+from ..core.templating import templates
 from sqlalchemy.orm import Session, joinedload
-import os
 from urllib.parse import urlencode
 import secrets
 
 from ..db.session import get_db, SessionLocal
 from ..db.models import User, Department, Branch, AttendanceLog
 from ..core.utils import get_current_work_shift, _get_log_shift_for_user
+from ..core.security import mark_checked_in
 from ..schemas.user import VerifyPasswordPayload # THÊM: Import schema mới
 from ..core.config import logger # Import logger từ core
 from ..services.user_service import sync_employees_from_source 
@@ -17,10 +17,6 @@ from sqlalchemy import or_
 
 router = APIRouter()
 
-# Xác định đường dẫn tuyệt đối đến thư mục app
-APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-# Tạo đường dẫn tuyệt đối đến thư mục templates bên trong app
-templates = Jinja2Templates(directory=os.path.join(APP_ROOT, "templates"))
 
 # router/api/users.py
 
@@ -89,6 +85,7 @@ def login_submit(
     if log and log.checked_in:
         request.session["user"] = session_data
         request.session.pop("pending_user", None)
+        mark_checked_in(request, user.id, work_date)
         return RedirectResponse("/choose-function", status_code=303)
     
     # === CẢI TIẾN: Lấy và lưu chi nhánh hoạt động cuối cùng vào session ===
@@ -1,14 +1,18 @@
 import os
 from datetime import datetime, date
-from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import FileResponse, Response, JSONResponse
+from typing import Optional
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, Response, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from ..db.session import get_db
 from ..core.utils import VN_TZ
 from ..core.config import logger
-from ..services.missing_attendance_service import run_daily_absence_check
+from ..core.metrics import render_metrics
+from ..services.missing_attendance_service import ABSENCE_BACKFILL_JOB
+from ..services.job_runner import job_status
+from ..services.job_queue import enqueue, refresh_queue_metrics
 
 router = APIRouter(tags=["Utilities"])
 
@@ -19,17 +23,32 @@ async def ping():
     """
     return {"status": "ok", "timestamp": datetime.now(VN_TZ).isoformat()}
 
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Số liệu vận hành (connection pool, hàng đợi việc, ...) ở định dạng text của Prometheus.
+    """
+    refresh_queue_metrics()
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 class AbsenceCheckRequest(BaseModel):
     check_date: date
+    # THÊM: Ngày kết thúc (tùy chọn) để chạy bù cho cả khoảng [check_date, end_date]
+    end_date: Optional[date] = None
+
+# Giới hạn số ngày cho mỗi lần chạy bù
+MAX_ABSENCE_BACKFILL_DAYS = 366
 
 @router.post("/api/attendance/run-absence-check")
-async def trigger_absence_check(
+def trigger_absence_check(
     request: Request,
     payload: AbsenceCheckRequest,
     db: Session = Depends(get_db)
 ):
     """
     Endpoint để admin/boss có thể kích hoạt lại tác vụ kiểm tra vắng mặt cho một ngày cụ thể.
+    Việc chạy bù được đưa vào hàng đợi (trả 202 ngay); worker chạy nó nối tiếp với lần chạy theo lịch
+    (cùng advisory lock) nên hai lần tính lại không xóa/chèn chồng lên nhau.
     """
     user_session = request.session.get("user")
     if not user_session or user_session.get("role") not in ["admin", "boss"]:
@@ -38,15 +57,46 @@ async def trigger_absence_check(
     target_date = payload.check_date
     if not target_date:
         raise HTTPException(status_code=400, detail="Vui lòng cung cấp ngày cần kiểm tra.")
+    end_date = payload.end_date or target_date
+    if end_date < target_date:
+        raise HTTPException(status_code=400, detail="Ngày kết thúc phải sau ngày bắt đầu.")
+    if (end_date - target_date).days >= MAX_ABSENCE_BACKFILL_DAYS:
+        raise HTTPException(status_code=400, detail=f"Chỉ được chạy tối đa {MAX_ABSENCE_BACKFILL_DAYS} ngày mỗi lần.")
+
+    period_str = target_date.strftime('%d/%m/%Y')
+    if end_date != target_date:
+        period_str += f" - {end_date.strftime('%d/%m/%Y')}"
 
     try:
-        run_daily_absence_check(target_date=target_date)
-        logger.info(f"Admin '{user_session.get('code')}' đã kích hoạt kiểm tra vắng mặt cho ngày {target_date}.")
-        return JSONResponse(content={"status": "success", "message": f"Đã gửi yêu cầu chạy kiểm tra vắng mặt cho ngày {target_date.strftime('%d/%m/%Y')}."})
+        enqueue(
+            db, ABSENCE_BACKFILL_JOB,
+            {"check_date": target_date.isoformat(), "end_date": end_date.isoformat()},
+            max_attempts=3,
+        )
+        db.commit()
+        logger.info(f"Admin '{user_session.get('code')}' đã kích hoạt kiểm tra vắng mặt cho ngày {period_str}.")
+        return JSONResponse(status_code=202, content={"status": "success", "message": f"Đã gửi yêu cầu chạy kiểm tra vắng mặt cho ngày {period_str}."})
     except Exception as e:
+        db.rollback()
         logger.error(f"Lỗi khi admin kích hoạt kiểm tra vắng mặt: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Đã xảy ra lỗi khi xử lý yêu cầu: {str(e)}")
 
+@router.get("/api/admin/jobs")
+def list_background_jobs(
+    request: Request,
+    job: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Lease hiện tại và lịch sử chạy của các tác vụ nền (kiểm tra vắng mặt, quét công việc quá hạn, ...)
+    trên toàn cụm worker. Chỉ admin/boss.
+    """
+    user_session = request.session.get("user")
+    if not user_session or user_session.get("role") not in ["admin", "boss"]:
+        raise HTTPException(status_code=403, detail="Bạn không có quyền truy cập.")
+    return job_status(db, job_name=job, limit=limit)
+
 @router.get("/favicon.ico", include_in_schema=False)
 def favicon():
     """Trả về file favicon.ico hoặc một ảnh PNG mặc định."""
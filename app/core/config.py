@@ -13,6 +13,68 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "a_very_secret_key_please_change_me_in_env_file"
     DATABASE_URL: PostgresDsn
     LOG_LEVEL: str = "INFO"
+    # Bán kính mặc định (mét) cho phép điểm danh quanh chi nhánh, dùng khi chi nhánh chưa cấu hình riêng
+    BRANCH_CHECKIN_RADIUS_M: int = 200
+    # Pub/sub cho SSE/WebSocket: "memory" (1 worker) hoặc "postgres" (nhiều worker, dùng LISTEN/NOTIFY)
+    PUBSUB_BACKEND: str = "memory"
+
+    # --- CONNECTION POOL ---
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30 # Số giây chờ tối đa khi pool đã hết kết nối
+    DB_POOL_RECYCLE: int = 300 # Đóng và mở lại kết nối cũ hơn số giây này
+    # Ping kiểm tra mỗi lần lấy kết nối (thêm 1 round trip). Có thể tắt khi DB_POOL_RECYCLE
+    # ngắn hơn idle timeout của server/proxy.
+    DB_POOL_PRE_PING: bool = True
+    # Đi qua PgBouncer ở chế độ transaction: tắt prepared statement phía server của psycopg
+    # và đặt statement_timeout bằng SET LOCAL trong từng transaction (PgBouncer không nhận tham số "options").
+    DB_PGBOUNCER: bool = False
+
+    # --- DEBUG SQL ---
+    # Đếm câu SQL của từng request, thêm header X-DB-Queries/Server-Timing và cảnh báo N+1 trong log
+    DEBUG_SQL_QUERIES: bool = False
+    # Một dạng câu lệnh lặp lại từ số lần này trở lên trong cùng request bị coi là nghi ngờ N+1
+    N_PLUS_ONE_THRESHOLD: int = 5
+
+    # --- CACHE ---
+    # Cache kết quả đọc công việc (thống kê trang /tasks, sự kiện lịch) theo từng bộ lọc (giây, 0 = tắt).
+    # Hết hiệu lực ngay khi công việc thay đổi ở bất kỳ worker nào (sequence task_read_generation trong DB).
+    TASK_STATS_CACHE_SECONDS: int = 30
+
+    # --- KHỞI ĐỘNG ---
+    # Tạo bảng, nâng cấp schema, reset sequence, đồng bộ nhân viên chạy một lần lúc deploy: `python manage.py bootstrap`.
+    # Bật để worker tự chạy bootstrap khi khởi động (dev một process); có advisory lock nên chỉ một worker chạy.
+    RUN_BOOTSTRAP_ON_STARTUP: bool = False
+
+    # --- TÁC VỤ NỀN & HÀNG ĐỢI VIỆC ---
+    # Worker web tự chạy scheduler và xử lý hàng đợi background_jobs trong luồng nền.
+    # Tắt khi đã chạy riêng `python manage.py worker` (tiến trình riêng cho tác vụ nền).
+    RUN_BACKGROUND_WORKERS_IN_WEB: bool = True
+    # Số giây nghỉ giữa hai lần lấy việc khi hàng đợi trống
+    JOB_QUEUE_POLL_SECONDS: float = 2.0
+    # Việc ở trạng thái "running" quá số giây này (worker chết giữa chừng) được đưa lại hàng đợi
+    JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS: int = 600
+
+    # --- TEMPLATE (Jinja2) ---
+    # Tự nạp lại template khi file .html thay đổi (kiểm tra mtime mỗi lần render). Chỉ bật khi dev.
+    TEMPLATE_AUTO_RELOAD: bool = False
+    # Thư mục lưu bytecode đã biên dịch của template, dùng chung giữa các worker và các lần khởi động.
+    # Để trống = thư mục tạm của hệ thống.
+    TEMPLATE_CACHE_DIR: str = ""
+
+    # --- STATEMENT TIMEOUT (ms) ---
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    # Timeout cho tác vụ nền (scheduler, hàng đợi việc, task_due_queue) thay cho mặc định của kết nối; 0 = không giới hạn
+    DB_JOB_STATEMENT_TIMEOUT_MS: int = 0
+    # Timeout riêng theo tiền tố đường dẫn (khớp tiền tố dài nhất); 0 = không giới hạn
+    DB_ROUTE_STATEMENT_TIMEOUTS_MS: Dict[str, int] = {
+        "/ping": 2000,
+        "/metrics": 2000,
+        "/attendance/checkin_status": 5000,
+        "/attendance/calendar-export-excel": 120000,
+        "/api/tasks/export-excel": 120000,
+        "/api/attendance/export-excel": 120000,
+    }
 
     @field_validator("DATABASE_URL", mode='before')
     def build_db_connection(cls, v: Optional[str]) -> str:
@@ -102,4 +164,11 @@ SHIFT_TRANSACTION_TYPES = {
     "UNC": "UNC",
     "CARD": "Quẹt thẻ",
     "CASH_EXPENSE": "Chi tiền quầy",
-}
\ No newline at end of file
+}
+
+# Map để dịch trạng thái Giao Ca sang tiếng Việt
+SHIFT_STATUS_MAP = {
+    "PENDING": "Chờ xử lý",
+    "CLOSED": "Đã kết ca",
+    "DELETED": "Đã xoá",
+}
@@ -0,0 +1,249 @@
+# app/core/metrics.py
+"""
+Xuất số liệu vận hành ở định dạng text của Prometheus (endpoint /metrics).
+
+Registry tối giản trong process (không cần thêm thư viện): Counter, Gauge, Histogram có nhãn.
+Mỗi lần ghi chỉ là một phép cộng dưới lock; việc định dạng text chỉ diễn ra khi /metrics được gọi.
+Lưu ý: mỗi worker có số liệu riêng, Prometheus cần scrape từng worker (hoặc chạy 1 worker).
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from ..db.session import engine, async_engine, sync_pool_stats, async_pool_stats
+
+LabelValues = Tuple[str, ...]
+
+# Bucket mặc định (giây) cho độ trễ request
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, labels: LabelValues = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in items]
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, labels: LabelValues = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: LabelValues = (), value: float = 0):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: LabelValues, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [số quan sát theo từng bucket (không cộng dồn) + bucket +Inf, tổng, số lượng]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items()]
+        lines = self._header()
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+# --- HTTP ---
+HTTP_REQUESTS = Counter("http_requests_total", "Số request HTTP theo route và mã trạng thái.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Độ trễ request HTTP (giây).", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Số request HTTP đang xử lý.")
+
+# --- DATABASE ---
+DB_QUERIES = Counter("db_queries_total", "Số câu SQL đã chạy, theo route (\"-\" = ngoài request).", ("route",))
+DB_TIME = Counter("db_query_seconds_total", "Tổng thời gian chạy SQL (giây), theo route.", ("route",))
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Số câu SQL trong một request.", ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+
+# --- SCHEDULER ---
+JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Thời gian chạy tác vụ nền (giây).", ("job",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0),
+)
+JOB_RUNS = Counter("scheduler_job_runs_total", "Số lần chạy tác vụ nền theo kết quả.", ("job", "status"))
+
+# --- HÀNG ĐỢI VIỆC (background_jobs) ---
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Số việc trong hàng đợi theo trạng thái (queued gồm cả việc chờ thử lại).", ("status",))
+JOB_QUEUE_OLDEST_AGE = Gauge("job_queue_oldest_ready_age_seconds", "Tuổi (giây) của việc đã tới hạn chạy lâu nhất mà chưa được lấy.")
+JOB_QUEUE_PROCESSED = Counter("job_queue_jobs_total", "Số lần xử lý việc theo loại và kết quả (done/retry/failed).", ("kind", "status"))
+JOB_QUEUE_DURATION = Histogram(
+    "job_queue_job_duration_seconds", "Thời gian xử lý một việc trong hàng đợi (giây).", ("kind",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0),
+)
+
+# --- KHỞI ĐỘNG ---
+STARTUP_DURATION = Gauge("app_startup_seconds", "Thời gian khởi động worker (giây) theo từng bước, \"total\" = tổng.", ("phase",))
+
+
+# --- ĐẾM SQL THEO REQUEST ---
+class RequestDbStats:
+    """
+    Số câu SQL và thời gian DB của request hiện tại (gắn qua ContextVar).
+    tracker (tùy chọn): đối tượng có record(statement, elapsed) nhận thêm từng câu SQL của request
+    (vd. QueryTracker của query_inspector khi DEBUG_SQL_QUERIES=true).
+    """
+    __slots__ = ("queries", "seconds", "tracker")
+
+    def __init__(self, tracker=None):
+        self.queries = 0
+        self.seconds = 0.0
+        self.tracker = tracker
+
+
+current_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("current_db_stats", default=None)
+# Các đối tượng nhận MỌI câu SQL của process, trong và ngoài request (vd. track_queries trong test/benchmark)
+statement_observers: List = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    stats = current_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+        if stats.tracker is not None:
+            stats.tracker.record(statement, elapsed)
+    else:
+        # Ngoài request (scheduler, startup): ghi thẳng vào counter
+        DB_QUERIES.inc(("-",))
+        DB_TIME.inc(("-",), elapsed)
+    for observer in list(statement_observers):
+        observer.record(statement, elapsed)
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def record_request_db_stats(route: str, stats: RequestDbStats):
+    DB_QUERIES_PER_REQUEST.observe((route,), stats.queries)
+    if stats.queries:
+        DB_QUERIES.inc((route,), stats.queries)
+        DB_TIME.inc((route,), stats.seconds)
+
+
+# --- TÁC VỤ NỀN ---
+def timed_job(job_name: str):
+    """Decorator ghi thời gian chạy và kết quả (success/error) của một tác vụ nền."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = func(*args, **kwargs)
+                status = "success"
+                return result
+            finally:
+                JOB_DURATION.observe((job_name,), time.perf_counter() - start)
+                JOB_RUNS.inc((job_name, status))
+        return wrapper
+    return decorator
+
+
+# --- CONNECTION POOL ---
+# (tên thống kê trong PoolStats.snapshot(), tên metric, loại, mô tả)
+_POOL_METRICS = (
+    ("checkouts", "db_pool_checkouts_total", "counter", "Số lần lấy kết nối từ pool."),
+    ("waits", "db_pool_checkout_waits_total", "counter", "Số lần lấy kết nối phải chờ (pool hết kết nối rảnh hoặc mở kết nối mới)."),
+    ("wait_seconds", "db_pool_checkout_wait_seconds_total", "counter", "Tổng thời gian chờ lấy kết nối (giây)."),
+    ("timeouts", "db_pool_checkout_timeouts_total", "counter", "Số lần hết thời gian chờ kết nối (DB_POOL_TIMEOUT)."),
+    ("size", "db_pool_size", "gauge", "Số kết nối cố định của pool (DB_POOL_SIZE)."),
+    ("checked_out", "db_pool_checked_out", "gauge", "Số kết nối đang được sử dụng."),
+    ("overflow", "db_pool_overflow", "gauge", "Số kết nối vượt pool_size đang mở (tối đa DB_MAX_OVERFLOW)."),
+)
+
+
+def render_pool_metrics() -> List[str]:
+    snapshots = [(stats.name, stats.snapshot()) for stats in (sync_pool_stats, async_pool_stats)]
+    lines = []
+    for key, metric_name, metric_type, help_text in _POOL_METRICS:
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        for pool_name, snapshot in snapshots:
+            lines.append(f'{metric_name}{{pool="{pool_name}"}} {snapshot[key]}')
+    return lines
+
+
+def render_metrics() -> str:
+    """Toàn bộ nội dung trả về cho /metrics."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(render_pool_metrics())
+    return "\n".join(lines) + "\n"
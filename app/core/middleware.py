@@ -0,0 +1,76 @@
+# app/core/middleware.py
+"""
+Các ASGI middleware thuần (không dùng BaseHTTPMiddleware để tránh tạo thêm task cho mỗi request).
+"""
+import time
+
+from ..db.session import statement_timeout_for_path, statement_timeout_ms
+from .metrics import (
+    HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS,
+    RequestDbStats, current_db_stats, record_request_db_stats,
+)
+
+
+class StatementTimeoutMiddleware:
+    """Đặt statement_timeout của DB theo đường dẫn request (xem DB_ROUTE_STATEMENT_TIMEOUTS_MS)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        # ContextVar được sao chép sang threadpool nên cũng áp dụng cho endpoint/dependency sync
+        token = statement_timeout_ms.set(statement_timeout_for_path(scope.get("path", "")))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            statement_timeout_ms.reset(token)
+
+
+def _route_label(scope) -> str:
+    """Mẫu đường dẫn của route (vd. /shift-report/edit-details/{item_id}) để giới hạn số nhãn."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    if scope.get("path", "").startswith("/static"):
+        return "/static"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Ghi độ trễ, mã trạng thái, số request đang xử lý và số câu SQL/thời gian DB của mỗi request HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        db_stats = RequestDbStats()
+        token = current_db_stats.set(db_stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            current_db_stats.reset(token)
+            route = _route_label(scope)
+            method = scope.get("method", "")
+            HTTP_LATENCY.observe((method, route), time.perf_counter() - start)
+            HTTP_REQUESTS.inc((method, route, str(status_code)))
+            record_request_db_stats(route, db_stats)
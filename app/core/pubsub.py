@@ -0,0 +1,163 @@
+# app/core/pubsub.py
+"""
+Pub/sub nội bộ để đẩy sự kiện tới các client đang chờ (SSE, WebSocket) mà không cần polling DB.
+
+- `broker` là broker trong bộ nhớ của process hiện tại: mỗi subscriber có một asyncio.Queue riêng.
+- Khi chạy nhiều worker (PUBSUB_BACKEND="postgres"), `publish()` gửi sự kiện qua Postgres NOTIFY
+  và mỗi worker chạy `listen_postgres_notifications()` để nhận lại rồi phân phát cho subscriber cục bộ.
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+from .config import logger, settings
+
+# Kênh Postgres dùng chung cho mọi sự kiện của ứng dụng
+PG_NOTIFY_CHANNEL = "binbin_events"
+# Giới hạn payload của NOTIFY là 8000 byte; sự kiện lớn hơn chỉ được phát trong process hiện tại
+PG_NOTIFY_MAX_PAYLOAD = 7900
+
+
+class Subscription:
+    """Một đăng ký nhận sự kiện của một kênh. Dùng với `async with broker.subscribe(...) as sub`."""
+
+    def __init__(self, broker: "Broker", channel: str, max_queue: int = 100):
+        self.broker = broker
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.loop = asyncio.get_running_loop()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Chờ sự kiện tiếp theo; trả về None nếu hết thời gian chờ."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _deliver(self, message: Any):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Client quá chậm: bỏ sự kiện thay vì làm nghẽn người phát
+            logger.warning(f"[PUBSUB] Hàng đợi của kênh '{self.channel}' đã đầy, bỏ qua sự kiện.")
+
+    async def __aenter__(self):
+        self.broker._add(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.broker._remove(self)
+
+
+class Broker(ABC):
+    """
+    Giao diện broker cục bộ: quản lý subscriber theo kênh và phát sự kiện cho chúng.
+    Các module chỉ làm việc qua giao diện này (`subscribe`, `publish_local`) nên có thể thay bằng
+    broker khác (ví dụ Redis) mà không phải sửa endpoint.
+    """
+
+    def subscribe(self, channel: str, max_queue: int = 100) -> Subscription:
+        return Subscription(self, channel, max_queue)
+
+    @abstractmethod
+    def _add(self, subscription: Subscription):
+        ...
+
+    @abstractmethod
+    def _remove(self, subscription: Subscription):
+        ...
+
+    @abstractmethod
+    def subscriber_count(self, channel: str) -> int:
+        ...
+
+    @abstractmethod
+    def publish_local(self, channel: str, message: Any):
+        ...
+
+
+class InMemoryBroker(Broker):
+    """Broker trong bộ nhớ, an toàn khi publish từ thread khác (endpoint sync chạy trong threadpool)."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def _add(self, subscription: Subscription):
+        self._subscribers.setdefault(subscription.channel, set()).add(subscription)
+
+    def _remove(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._subscribers.get(channel, ()))
+
+    def publish_local(self, channel: str, message: Any):
+        """Phát sự kiện cho các subscriber trong process hiện tại."""
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription.loop.call_soon_threadsafe(subscription._deliver, message)
+
+
+broker: Broker = InMemoryBroker()
+
+
+def qr_checkin_channel(token: str) -> str:
+    """Kênh sự kiện trạng thái check-in của một QR token."""
+    return f"qr_checkin:{token}"
+
+
+def publish(channel: str, message: Any):
+    """
+    Phát một sự kiện (dữ liệu phải serialize được bằng JSON).
+    Ở chế độ "postgres", sự kiện đi qua NOTIFY để mọi worker (kể cả worker hiện tại) đều nhận được.
+    """
+    if settings.PUBSUB_BACKEND == "postgres":
+        payload = json.dumps({"channel": channel, "message": message}, ensure_ascii=False, default=str)
+        if len(payload.encode("utf-8")) <= PG_NOTIFY_MAX_PAYLOAD:
+            try:
+                # Import tại đây để tránh vòng import (db.session -> core.config)
+                from ..db.session import engine
+                with engine.begin() as conn:
+                    conn.execute(select(func.pg_notify(PG_NOTIFY_CHANNEL, payload)))
+                return
+            except Exception as e:
+                logger.error(f"[PUBSUB] Lỗi khi gửi NOTIFY, chỉ phát trong process hiện tại: {e}", exc_info=True)
+        else:
+            logger.warning(f"[PUBSUB] Sự kiện của kênh '{channel}' quá lớn cho NOTIFY, chỉ phát trong process hiện tại.")
+    broker.publish_local(channel, message)
+
+
+async def listen_postgres_notifications():
+    """
+    Tác vụ nền của mỗi worker: LISTEN kênh Postgres và chuyển sự kiện sang broker cục bộ.
+    Tự kết nối lại khi mất kết nối.
+    """
+    import psycopg
+
+    dsn = make_url(str(settings.DATABASE_URL)).set(drivername="postgresql").render_as_string(hide_password=False)
+    retry_delay = 1
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {PG_NOTIFY_CHANNEL}")
+                logger.info(f"[PUBSUB] Đang lắng nghe kênh Postgres '{PG_NOTIFY_CHANNEL}'.")
+                retry_delay = 1
+                async for notification in conn.notifies():
+                    try:
+                        event = json.loads(notification.payload)
+                        broker.publish_local(event["channel"], event["message"])
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"[PUBSUB] Bỏ qua sự kiện không hợp lệ: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[PUBSUB] Mất kết nối LISTEN, thử lại sau {retry_delay}s: {e}", exc_info=True)
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
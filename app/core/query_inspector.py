@@ -0,0 +1,138 @@
+# app/core/query_inspector.py
+"""
+Đếm và đo thời gian các câu SQL trong một phạm vi (một request, hoặc một khối `with` trong test),
+đồng thời phát hiện N+1: cùng một "dạng" câu lệnh (bỏ qua tham số) lặp lại nhiều lần.
+
+Không đăng ký listener riêng: các câu SQL được nhận qua hook đếm SQL của metrics
+(RequestDbStats.tracker cho request, statement_observers cho track_queries).
+
+- Chế độ debug (DEBUG_SQL_QUERIES=true): QueryDebugMiddleware gắn tracker cho từng request, thêm header
+  `X-DB-Queries` / `Server-Timing` và ghi log cảnh báo khi nghi ngờ N+1.
+- Trong test/benchmark:
+      with track_queries() as tracker:
+          client.get("/shift-report/api")
+      tracker.assert_max_queries(5)
+"""
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from .config import logger, settings
+from .metrics import RequestDbStats, current_db_stats, statement_observers
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+# Danh sách tham số mở rộng (IN (...)) có độ dài thay đổi -> gộp về một dạng
+_IN_LIST_RE = re.compile(r"\(\s*(?:%\([^)]+\)s|\$\d+|\?)(?:\s*,\s*(?:%\([^)]+\)s|\$\d+|\?))*\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """Chuẩn hóa câu SQL để so sánh: bỏ giá trị literal, gộp khoảng trắng và danh sách IN."""
+    shape = _STRING_RE.sub("?", statement)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(?)", shape)
+    return _WHITESPACE_RE.sub(" ", shape).strip()
+
+
+class QueryTracker:
+    """Ghi nhận các câu SQL trong một phạm vi."""
+
+    def __init__(self, n_plus_one_threshold: Optional[int] = None):
+        self.n_plus_one_threshold = n_plus_one_threshold or settings.N_PLUS_ONE_THRESHOLD
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes: Dict[str, List] = {} # dạng câu lệnh -> [số lần, tổng thời gian]
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed: float):
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.total_seconds += elapsed
+            entry = self.shapes.get(shape)
+            if entry is None:
+                self.shapes[shape] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def repeated_statements(self) -> List[Tuple[str, int, float]]:
+        """Các dạng câu lệnh lặp lại >= ngưỡng (nghi ngờ N+1), nhiều nhất trước."""
+        with self._lock:
+            repeated = [(shape, n, seconds) for shape, (n, seconds) in self.shapes.items() if n >= self.n_plus_one_threshold]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+    def assert_max_queries(self, max_queries: int):
+        """Dùng trong test: kiểm tra ngân sách số câu SQL của một endpoint."""
+        if self.count > max_queries:
+            details = "\n".join(f"  {n}x {shape[:200]}" for shape, (n, _) in sorted(
+                self.shapes.items(), key=lambda item: item[1][0], reverse=True
+            ))
+            raise AssertionError(f"Chạy {self.count} câu SQL, vượt ngân sách {max_queries}:\n{details}")
+
+    def assert_no_n_plus_one(self):
+        repeated = self.repeated_statements()
+        if repeated:
+            details = "\n".join(f"  {n}x {shape[:200]}" for shape, n, _ in repeated)
+            raise AssertionError(f"Nghi ngờ N+1 (lặp >= {self.n_plus_one_threshold} lần):\n{details}")
+
+
+@contextmanager
+def track_queries(n_plus_one_threshold: Optional[int] = None):
+    """Ghi nhận mọi câu SQL của process trong khối `with` (dùng trong test/benchmark, app có thể chạy ở thread khác)."""
+    tracker = QueryTracker(n_plus_one_threshold)
+    statement_observers.append(tracker)
+    try:
+        yield tracker
+    finally:
+        statement_observers.remove(tracker)
+
+
+class QueryDebugMiddleware:
+    """
+    Chỉ bật khi DEBUG_SQL_QUERIES=true. Thêm header số câu SQL/thời gian DB và cảnh báo N+1 vào log.
+    Header phản ánh các câu SQL chạy trước khi gửi response (không gồm phần thân StreamingResponse).
+    Phải nằm bên trong MetricsMiddleware để gắn tracker vào RequestDbStats của request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracker = QueryTracker()
+        db_stats = current_db_stats.get()
+        token = None
+        if db_stats is None:
+            # Không có MetricsMiddleware bọc ngoài -> tự tạo bộ đếm cho request
+            db_stats = RequestDbStats()
+            token = current_db_stats.set(db_stats)
+        db_stats.tracker = tracker
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                db_ms = tracker.total_seconds * 1000
+                headers.append((b"x-db-queries", str(tracker.count).encode()))
+                headers.append((b"server-timing", f'db;dur={db_ms:.1f};desc="{tracker.count} queries"'.encode()))
+                repeated = tracker.repeated_statements()
+                if repeated:
+                    headers.append((b"x-db-n-plus-one", str(len(repeated)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            db_stats.tracker = None
+            if token is not None:
+                current_db_stats.reset(token)
+            for shape, n, seconds in tracker.repeated_statements():
+                logger.warning(
+                    f"[N+1] {scope.get('method')} {scope.get('path')}: {n} lần ({seconds * 1000:.1f} ms) câu lệnh: {shape[:300]}"
+                )
@@ -1,6 +1,9 @@
 from fastapi import Request, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
 from typing import Optional
+from datetime import date
 import secrets
 
 # Import model User để truy vấn
@@ -9,26 +12,125 @@ from ..db.session import SessionLocal
 from .utils import get_current_work_shift
 from .config import logger
 
+class CurrentUserContext:
+    """
+    Thông tin người dùng hiện tại trong phạm vi một request.
+    Bản ghi User (kèm department, main_branch) chỉ được query khi thật sự cần và tối đa 1 lần mỗi request,
+    dù có nhiều hàm/router cùng hỏi chi nhánh hoạt động.
+    """
+
+    def __init__(self, request: Request, db: Session, session_user: Optional[dict]):
+        self.request = request
+        self.db = db
+        self.session_user = session_user or {}
+        self._user: Optional[User] = None
+        self._user_loaded = False
+
+    @property
+    def id(self):
+        return self.session_user.get("id")
+
+    @property
+    def code(self) -> Optional[str]:
+        return self.session_user.get("code")
+
+    @property
+    def role(self) -> Optional[str]:
+        return self.session_user.get("role")
+
+    @property
+    def user(self) -> Optional[User]:
+        """Bản ghi User trong DB (đã load sẵn department và main_branch)."""
+        if not self._user_loaded:
+            self._user_loaded = True
+            if self.id is not None:
+                self._user = self.db.query(User).options(
+                    joinedload(User.department),
+                    joinedload(User.main_branch)
+                ).filter(User.id == self.id).first()
+        return self._user
+
+    @property
+    def last_active_branch(self) -> Optional[str]:
+        return self.user.last_active_branch if self.user else None
+
+    @property
+    def active_branch(self) -> Optional[str]:
+        """
+        Xác định chi nhánh hoạt động của người dùng theo thứ tự ưu tiên:
+        1. Chi nhánh từ session (vừa quét GPS trong phiên này).
+        2. Chi nhánh hoạt động cuối cùng đã lưu trong DB.
+        3. Chi nhánh mặc định của user (fallback).
+        """
+        # 1. Lấy từ session (ưu tiên cao nhất)
+        active_branch = self.request.session.get("active_branch")
+        if active_branch:
+            return active_branch
+
+        # 2. Lấy từ DB, rồi lưu lại vào session (giống lúc đăng nhập) để các request sau không cần query
+        if self.last_active_branch:
+            self.request.session["active_branch"] = self.last_active_branch
+            return self.last_active_branch
+
+        # 3. Lấy từ chi nhánh mặc định trong session
+        return self.session_user.get("branch")
+
+
+def get_user_context(request: Request, db: Session, user_data: Optional[dict] = None) -> CurrentUserContext:
+    """
+    Lấy (hoặc tạo) CurrentUserContext của request hiện tại, lưu trong request.state để dùng chung.
+    """
+    context = getattr(request.state, "user_context", None)
+    if context is None or (user_data is not None and context.id != user_data.get("id")):
+        if user_data is None:
+            user_data = request.session.get("user") or request.session.get("pending_user")
+        context = CurrentUserContext(request, db, user_data)
+        request.state.user_context = context
+    return context
+
+
 # === HÀM MỚI ĐƯỢC CHUYỂN VÀO ===
 def get_active_branch(request: Request, db: Session, user_data: dict) -> Optional[str]:
     """
-    Xác định chi nhánh hoạt động của người dùng theo thứ tự ưu tiên:
-    1. Chi nhánh từ session (vừa quét GPS trong phiên này).
-    2. Chi nhánh hoạt động cuối cùng đã lưu trong DB.
-    3. Chi nhánh mặc định của user (fallback).
+    Xác định chi nhánh hoạt động của người dùng (xem CurrentUserContext.active_branch).
+    """
+    return get_user_context(request, db, user_data).active_branch
+
+async def get_active_branch_async(request: Request, db: AsyncSession, user_data: dict) -> Optional[str]:
+    """
+    Bản async của get_active_branch cho các endpoint dùng AsyncSession (cùng thứ tự ưu tiên).
+    Chỉ query cột last_active_branch khi session chưa có chi nhánh hoạt động.
     """
-    # 1. Lấy từ session (ưu tiên cao nhất)
     active_branch = request.session.get("active_branch")
     if active_branch:
         return active_branch
 
-    # 2. Lấy từ DB
-    user_from_db = db.query(User).filter(User.id == user_data.get("id")).first()
-    if user_from_db and user_from_db.last_active_branch:
-        return user_from_db.last_active_branch
+    user_id = (user_data or {}).get("id")
+    if user_id is not None:
+        last_active_branch = (await db.execute(
+            select(User.last_active_branch).where(User.id == user_id)
+        )).scalar_one_or_none()
+        if last_active_branch:
+            request.session["active_branch"] = last_active_branch
+            return last_active_branch
+
+    return (user_data or {}).get("branch")
 
-    # 3. Lấy từ chi nhánh mặc định trong session
-    return user_data.get("branch")
+# Key trong session lưu (user_id, ngày làm việc) mà người dùng đã được xác nhận check-in
+CHECKED_IN_SESSION_KEY = "checked_in"
+
+def _checked_in_marker(user_id: int, work_date: date) -> dict:
+    return {"user_id": user_id, "work_date": work_date.isoformat()}
+
+def mark_checked_in(request: Request, user_id: int, work_date: Optional[date] = None):
+    """
+    Ghi nhớ trong session (đã ký) rằng user `user_id` đã check-in cho ngày làm việc `work_date`.
+    Trạng thái này không thể đổi lại trong cùng ca, nên require_checked_in_user không cần hỏi lại DB.
+    Khi sang ngày làm việc mới (7h sáng) hoặc session chuyển sang user khác, giá trị không còn khớp và tự hết hiệu lực.
+    """
+    if work_date is None:
+        work_date, _ = get_current_work_shift()
+    request.session[CHECKED_IN_SESSION_KEY] = _checked_in_marker(user_id, work_date)
 
 def require_checked_in_user(request: Request):
     user = request.session.get("user")
@@ -41,6 +143,10 @@ def require_checked_in_user(request: Request):
 
     # Lấy ngày làm việc hiện tại, xử lý cả trường hợp trước 7h sáng
     work_date, _ = get_current_work_shift()
+
+    # TỐI ƯU: Đã xác nhận check-in của đúng user này cho ngày làm việc này -> không cần truy vấn DB
+    if request.session.get(CHECKED_IN_SESSION_KEY) == _checked_in_marker(user["id"], work_date):
+        return True
     
     with SessionLocal() as db:
         try:
@@ -53,7 +159,10 @@ def require_checked_in_user(request: Request):
             ).first()
 
             # Cho phép vào nếu có log đã check-in trong DB hoặc vừa quét QR xong
-            if log or request.session.get("after_checkin") == "choose_function":
+            if log:
+                mark_checked_in(request, user["id"], work_date)
+                return True
+            if request.session.get("after_checkin") == "choose_function":
                 return True
         except Exception as e:
             logger.error(f"Lỗi khi kiểm tra trạng thái đăng nhập trong middleware: {e}", exc_info=True)
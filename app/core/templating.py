@@ -0,0 +1,77 @@
+# app/core/templating.py
+"""
+Môi trường Jinja2 dùng chung cho mọi router: template chỉ được nạp/biên dịch một lần cho cả process
+thay vì mỗi router giữ một Environment và cache riêng.
+
+- Bytecode của template được lưu trên đĩa (FileSystemBytecodeCache): worker mới và các lần khởi động sau
+  không phải biên dịch lại từ mã nguồn .html.
+- auto_reload tắt mặc định (production): không stat file template mỗi lần render.
+- Các filter dùng chung thay cho việc map sẵn nhãn tiếng Việt trong từng router.
+"""
+import os
+import tempfile
+import time
+from typing import Optional
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from .config import settings, logger, ROLE_MAP, STATUS_MAP, SHIFT_STATUS_MAP, SHIFT_TRANSACTION_TYPES
+
+# Xác định đường dẫn tuyệt đối đến thư mục gốc của project 'app'
+APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TEMPLATES_DIR = os.path.join(APP_ROOT, "templates")
+
+
+def _bytecode_cache_dir() -> str:
+    cache_dir = settings.TEMPLATE_CACHE_DIR or os.path.join(tempfile.gettempdir(), "binbin-jinja-cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _map_filter(mapping: dict):
+    """Filter dịch mã (enum value, role code) sang tiếng Việt; không có trong map thì giữ nguyên."""
+    def translate(value: Optional[str]) -> str:
+        if not value:
+            return ""
+        return mapping.get(value, value)
+    return translate
+
+
+def _build_environment() -> Environment:
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(),
+        auto_reload=settings.TEMPLATE_AUTO_RELOAD,
+        bytecode_cache=FileSystemBytecodeCache(_bytecode_cache_dir()),
+        cache_size=-1, # Số template ít -> giữ toàn bộ trong bộ nhớ, không bao giờ bị đẩy ra
+    )
+    env.filters.update({
+        "lost_status": _map_filter(STATUS_MAP),
+        "shift_status": _map_filter(SHIFT_STATUS_MAP),
+        "shift_type": _map_filter(SHIFT_TRANSACTION_TYPES),
+    })
+    # Map vai trò cho JavaScript trong template: {{ ROLE_MAP|tojson }}
+    env.globals["ROLE_MAP"] = ROLE_MAP
+    return env
+
+
+templates = Jinja2Templates(env=_build_environment())
+
+
+def warmup_templates() -> int:
+    """
+    Biên dịch trước toàn bộ template lúc khởi động (đọc bytecode từ cache nếu có),
+    để request đầu tiên của mỗi trang không phải chịu chi phí parse/compile.
+    """
+    env = templates.env
+    started = time.perf_counter()
+    compiled = 0
+    for name in env.list_templates(filter_func=lambda n: n.endswith(".html")):
+        try:
+            env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            logger.error(f"Lỗi khi biên dịch template '{name}': {e}", exc_info=True)
+    logger.info(f"Đã nạp {compiled} template sau {time.perf_counter() - started:.2f}s.")
+    return compiled
@@ -1,8 +1,12 @@
 from datetime import datetime, timedelta
 from pytz import timezone
+from zoneinfo import ZoneInfo
 from typing import Optional
 from urllib.parse import parse_qsl, urlencode
+import os
 import socket
+import base64
+import json
 
 # --- CÁC HẰNG SỐ CỦA ỨNG DỤNG ---
 VN_TZ = timezone("Asia/Ho_Chi_Minh")
@@ -20,6 +24,10 @@ def get_lan_ip() -> str:
         s.close()
     return IP
 
+def worker_id() -> str:
+    """Định danh tiến trình hiện tại: "<hostname>:<pid>" (tính lúc gọi, đúng cả khi worker được fork)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
 def get_current_work_shift():
     """
     Xác định ngày làm việc và ca làm việc hiện tại dựa trên giờ Việt Nam.
@@ -110,4 +118,38 @@ def clean_query_string(query_string: str, keys_to_remove: list = None) -> str:
     query_params = parse_qsl(query_string)
     filtered_params = [(k, v) for k, v in query_params if k not in keys_to_remove]
     
-    return urlencode(filtered_params)
\ No newline at end of file
+    return urlencode(filtered_params)
+
+def encode_cursor(values: dict) -> str:
+    """
+    Mã hóa vị trí của dòng cuối cùng (giá trị cột sắp xếp + khóa phụ) thành chuỗi cursor
+    an toàn cho URL, dùng cho Keyset Pagination.
+    Các giá trị datetime được đánh dấu riêng để giải mã lại đúng kiểu.
+    """
+    payload = {}
+    for key, value in values.items():
+        if isinstance(value, datetime):
+            payload[key] = {"dt": value.isoformat()}
+        else:
+            payload[key] = value
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """
+    Giải mã chuỗi cursor do `encode_cursor` tạo ra.
+    Trả về None nếu cursor rỗng hoặc không hợp lệ (để endpoint fallback về OFFSET).
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        if not isinstance(payload, dict):
+            return None
+        return {
+            key: datetime.fromisoformat(value["dt"]) if isinstance(value, dict) and "dt" in value else value
+            for key, value in payload.items()
+        }
+    except (ValueError, TypeError, KeyError):
+        return None
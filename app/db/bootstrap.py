@@ -0,0 +1,111 @@
+# app/db/bootstrap.py
+"""
+Các bước khởi tạo database chạy MỘT LẦN lúc deploy, không chạy ở mỗi worker:
+
+    python manage.py migrate     # tạo bảng, nâng cấp schema, đồng bộ sequence
+    python manage.py bootstrap   # migrate + đồng bộ nhân viên từ employees.py
+
+Toàn bộ các bước chạy trong một PostgreSQL advisory lock nên nhiều tiến trình gọi cùng lúc
+cũng không làm trùng việc hay tranh khóa bảng.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..core.config import logger
+from ..core.utils import VN_TZ
+from .models import AppState
+from .session import Base, SessionLocal, engine, statement_timeout_ms
+from .utils import apply_schema_upgrades, reset_all_sequences, sync_employees_on_startup
+
+BOOTSTRAP_LOCK_KEY = 734500
+# Khóa trong bảng app_state: thời điểm bootstrap/migrate hoàn tất lần gần nhất
+BOOTSTRAP_STATE_KEY = "bootstrap_completed_at"
+
+
+def _create_tables(db: Session):
+    Base.metadata.create_all(bind=engine)
+
+
+MIGRATE_STEPS: List[Tuple[str, Callable[[Session], None]]] = [
+    ("create_tables", _create_tables),
+    ("schema_upgrades", apply_schema_upgrades),
+    ("reset_sequences", reset_all_sequences),
+]
+BOOTSTRAP_STEPS = MIGRATE_STEPS + [("sync_employees", sync_employees_on_startup)]
+
+
+@contextmanager
+def bootstrap_lock(wait: bool = True) -> Iterator[bool]:
+    """
+    Giữ advisory lock mức session trên một kết nối riêng (AUTOCOMMIT) trong suốt khối lệnh.
+    wait=False: không chờ, trả về False nếu tiến trình khác đang giữ khóa.
+    """
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        params = {"key": BOOTSTRAP_LOCK_KEY}
+        if wait:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), params)
+            acquired = True
+        else:
+            acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(:key)"), params).scalar())
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+
+
+def run_steps(steps: List[Tuple[str, Callable[[Session], None]]], wait: bool = True) -> Optional[Dict[str, float]]:
+    """
+    Chạy lần lượt các bước trong advisory lock, trả về thời gian (giây) của từng bước.
+    Trả về None nếu wait=False và tiến trình khác đang chạy.
+    Một bước lỗi thì dừng ngay và ném lại exception: các bước sau không chạy và bootstrap không được
+    ghi nhận là đã hoàn tất trong app_state.
+    """
+    # Tạo index/cột mới trên bảng lớn có thể vượt DB_STATEMENT_TIMEOUT_MS -> bỏ giới hạn
+    token = statement_timeout_ms.set(0)
+    try:
+        with bootstrap_lock(wait=wait) as acquired:
+            if not acquired:
+                logger.info("[BOOTSTRAP] Tiến trình khác đang khởi tạo database, bỏ qua.")
+                return None
+            timings: Dict[str, float] = {}
+            for name, step in steps:
+                started = time.perf_counter()
+                try:
+                    with SessionLocal() as db:
+                        step(db)
+                except Exception as e:
+                    logger.error(f"[BOOTSTRAP] {name} thất bại, dừng các bước còn lại: {e}", exc_info=True)
+                    raise
+                timings[name] = time.perf_counter() - started
+                logger.info(f"[BOOTSTRAP] {name}: {timings[name]:.2f}s")
+            _mark_completed()
+            return timings
+    finally:
+        statement_timeout_ms.reset(token)
+
+
+def _mark_completed():
+    now = datetime.now(VN_TZ)
+    with SessionLocal() as db:
+        stmt = pg_insert(AppState).values(key=BOOTSTRAP_STATE_KEY, value=now.isoformat(), updated_at=now)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[AppState.key], set_={"value": now.isoformat(), "updated_at": now}
+        ))
+        db.commit()
+
+
+def last_bootstrap_at(db: Session) -> Optional[str]:
+    """Thời điểm bootstrap gần nhất, None nếu chưa từng chạy (hoặc chưa có bảng app_state)."""
+    try:
+        return db.execute(select(AppState.value).where(AppState.key == BOOTSTRAP_STATE_KEY)).scalar()
+    except Exception:
+        db.rollback()
+        return None
@@ -2,7 +2,7 @@
 import enum
 from sqlalchemy import (
     Column, String, Integer, DateTime, Text, Date, Boolean, Float, Time,
-    Enum as SQLAlchemyEnum, ForeignKey, BIGINT, NUMERIC, Index
+    Enum as SQLAlchemyEnum, ForeignKey, BIGINT, NUMERIC, Index, SmallInteger, Computed, text
 )
 from sqlalchemy.dialects.postgresql import JSON
 from datetime import datetime
@@ -15,6 +15,76 @@ from .session import Base
 # BẢNG DỮ LIỆU GỐC (MASTER DATA)
 # ====================================================================
 
+class AppState(Base):
+    """Trạng thái hệ thống dạng khóa-giá trị (vd. hash danh sách nhân viên đã đồng bộ lần gần nhất)."""
+    __tablename__ = "app_state"
+
+    key = Column(String(100), primary_key=True)
+    value = Column(Text)
+    updated_at = Column(DateTime(timezone=True))
+
+class JobLease(Base):
+    """
+    Khóa thuê (lease) của từng tác vụ nền: worker nào giữ lease còn hạn mới được chạy tác vụ đó.
+    Worker đang chạy gia hạn lease định kỳ (heartbeat); worker chết thì lease tự hết hạn.
+    """
+    __tablename__ = "job_leases"
+
+    job_name = Column(String(100), primary_key=True)
+    owner = Column(String(255), nullable=False) # "<hostname>:<pid>" của worker giữ lease
+    locked_at = Column(DateTime(timezone=True), nullable=False)
+    lease_until = Column(DateTime(timezone=True), nullable=False)
+    heartbeat_at = Column(DateTime(timezone=True))
+
+class JobRun(Base):
+    """Lịch sử chạy tác vụ nền (mỗi lần chạy một dòng)."""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True)
+    job_name = Column(String(100), nullable=False)
+    owner = Column(String(255), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+    status = Column(String(20), nullable=False) # running | success | error | abandoned
+    rows_affected = Column(Integer)
+    error = Column(Text)
+
+    __table_args__ = (
+        Index("ix_job_runs_job_started", "job_name", "started_at"),
+    )
+
+class BackgroundJob(Base):
+    """
+    Hàng đợi việc chạy sau request (bền vững, nằm trong PostgreSQL).
+    Endpoint ghi việc vào bảng trong cùng transaction với dữ liệu chính; worker lấy việc bằng
+    SELECT ... FOR UPDATE SKIP LOCKED nên nhiều worker chạy song song không lấy trùng.
+    """
+    __tablename__ = "background_jobs"
+
+    id = Column(BIGINT, primary_key=True)
+    kind = Column(String(100), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="queued") # queued | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    # Việc chỉ được lấy khi run_at <= now() (dùng cho backoff khi thử lại)
+    run_at = Column(DateTime(timezone=True), nullable=False)
+    # Khóa chống trùng: mỗi dedupe_key chỉ có tối đa một việc đang chờ
+    dedupe_key = Column(String(200))
+    locked_by = Column(String(255))
+    locked_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Chỉ index các việc đang chờ -> index nhỏ, lấy việc luôn nhanh dù bảng dài
+        Index("ix_background_jobs_ready", "run_at", "id", postgresql_where=text("status = 'queued'")),
+        Index("uq_background_jobs_dedupe", "dedupe_key", unique=True,
+              postgresql_where=text("status = 'queued' AND dedupe_key IS NOT NULL")),
+        Index("ix_background_jobs_running", "locked_at", postgresql_where=text("status = 'running'")),
+    )
+
 class Branch(Base):
     """Bảng quản lý danh sách các chi nhánh."""
     __tablename__ = "branches"
@@ -25,6 +95,8 @@ class Branch(Base):
     address = Column(Text)
     gps_lat = Column(NUMERIC(12, 9))
     gps_lng = Column(NUMERIC(12, 9))
+    # THÊM: Bán kính điểm danh riêng của chi nhánh (mét). NULL -> dùng settings.BRANCH_CHECKIN_RADIUS_M
+    gps_radius_m = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True))
 
 class Department(Base):
@@ -57,6 +129,8 @@ class User(Base): # type: ignore
     phone_number = Column(String(20))
     email = Column(String(255))
     last_active_branch = Column(String, nullable=True)
+    # THÊM: Hash của bản ghi nguồn (employees.py) đã áp dụng lần gần nhất -> đồng bộ chỉ ghi các dòng thay đổi
+    source_hash = Column(String(64), nullable=True)
 
     # ORM Relationships
     department = relationship("Department")
@@ -115,6 +189,19 @@ class User(Base): # type: ignore
 # BẢNG GIAO DỊCH (TRANSACTIONAL TABLES)
 # ====================================================================
 
+# Thứ tự hiển thị trạng thái trong danh sách công việc
+TASK_STATUS_ORDER = {"Quá hạn": 0, "Đang chờ": 1, "Hoàn thành": 2, "Đã xoá": 3}
+
+# Hạng sắp xếp lưu sẵn = thứ tự trạng thái * 2 (+1 nếu chưa có hạn hoàn thành).
+# Tách task không có hạn thành nhóm riêng nên thứ tự (status_rank, due_date, id) trùng với
+# "trạng thái, due_date NULLS LAST" cũ, và trong mỗi nhóm due_date hoặc luôn có hoặc luôn NULL
+# -> so sánh bộ (row comparison) dùng được trực tiếp cho Keyset Pagination trên index.
+TASK_STATUS_RANK_SQL = (
+    "(CASE status "
+    + " ".join(f"WHEN '{status}' THEN {order}" for status, order in TASK_STATUS_ORDER.items())
+    + " ELSE 99 END) * 2 + (CASE WHEN due_date IS NULL THEN 1 ELSE 0 END)"
+)
+
 class Task(Base):
     __tablename__ = "tasks"
     
@@ -134,6 +221,17 @@ class Task(Base):
     notes = Column(Text)
     created_at = Column(DateTime(timezone=True))
     deleted_at = Column(DateTime(timezone=True))
+    # THÊM: Cột sinh tự động (PostgreSQL STORED generated column) phục vụ sắp xếp/phân trang theo index
+    status_rank = Column(SmallInteger, Computed(TASK_STATUS_RANK_SQL, persisted=True))
+
+    __table_args__ = (
+        # Danh sách công việc theo chi nhánh: WHERE branch_id = ? ORDER BY status_rank, due_date, id
+        Index("ix_tasks_branch_status_rank_due", "branch_id", "status_rank", "due_date", "id"),
+        # Quản lý xem tất cả chi nhánh
+        Index("ix_tasks_status_rank_due", "status_rank", "due_date", "id"),
+        # Lịch công việc: WHERE branch_id = ? AND due_date trong khoảng
+        Index("ix_tasks_branch_due", "branch_id", "due_date"),
+    )
 
     # ORM Relationships
     branch = relationship("Branch")
@@ -172,6 +270,19 @@ class AttendanceRecord(Base):
     is_overtime = Column(Boolean, default=False)
     notes = Column(Text)
 
+    # THÊM: Ngày làm việc + ca (slot) để chống điểm danh trùng bằng ràng buộc UNIQUE.
+    # Bản ghi cũ để NULL nên không bị ràng buộc (PostgreSQL coi các giá trị NULL là khác nhau).
+    work_date = Column(Date, nullable=True)
+    shift_slot = Column(String(20), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "uq_attendance_user_workdate_checker_slot",
+            "user_id", "work_date", "checker_id", "shift_slot",
+            unique=True
+        ),
+    )
+
     user = relationship("User", back_populates="attendance_records_as_subject", foreign_keys=[user_id])
     checker = relationship("User", back_populates="attendance_records_as_checker", foreign_keys=[checker_id])
     branch = relationship("Branch")
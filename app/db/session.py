@@ -1,26 +1,160 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 # === THAY ĐỔI DUY NHẤT Ở ĐÂY ===
 # Import đối tượng `settings` từ file config mới
 from ..core.config import settings
 
+
+# --- THÊM: THỐNG KÊ CONNECTION POOL (xuất ra /metrics) ---
+class PoolStats:
+    """Bộ đếm checkout của một pool: số lần lấy kết nối, số lần phải chờ, tổng thời gian chờ, số lần hết giờ."""
+
+    # Lấy kết nối lâu hơn ngưỡng này được tính là một lần "chờ" (pool hết kết nối rảnh hoặc phải mở kết nối mới)
+    WAIT_THRESHOLD_SECONDS = 0.001
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            if elapsed >= self.WAIT_THRESHOLD_SECONDS:
+                self.waits += 1
+                self.wait_seconds += elapsed
+
+    def snapshot(self) -> Dict[str, float]:
+        pool = self.pool
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+                "timeouts": self.timeouts,
+            }
+        data.update({
+            "size": pool.size() if pool is not None else 0,
+            "checked_out": pool.checkedout() if pool is not None else 0,
+            # overflow() âm khi pool chưa mở đủ pool_size kết nối
+            "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+        })
+        return data
+
+
+def _instrumented_pool_class(base_class, stats: PoolStats):
+    """Tạo lớp pool con đo thời gian lấy kết nối (gồm cả thời gian chờ khi pool đã hết)."""
+    class InstrumentedPool(base_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                stats.record(time.perf_counter() - start, timed_out=True)
+                raise
+            stats.record(time.perf_counter() - start)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{base_class.__name__}"
+    return InstrumentedPool
+
+
+def _engine_options(pool_class, stats: PoolStats) -> dict:
+    """Tham số chung cho engine sync/async lấy từ Settings."""
+    connect_args = {}
+    if settings.DB_PGBOUNCER:
+        # PgBouncer (transaction mode) không giữ prepared statement giữa các transaction
+        connect_args["prepare_threshold"] = None
+    elif settings.DB_STATEMENT_TIMEOUT_MS:
+        # Timeout mặc định gắn vào kết nối lúc mở, không tốn thêm round trip cho mỗi transaction
+        connect_args["options"] = f"-c statement_timeout={int(settings.DB_STATEMENT_TIMEOUT_MS)}"
+    return dict(
+        poolclass=_instrumented_pool_class(pool_class, stats),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        connect_args=connect_args,
+        echo=False,
+    )
+
+
+sync_pool_stats = PoolStats("sync")
+async_pool_stats = PoolStats("async")
+
 # Tạo engine kết nối đến database từ URL trong đối tượng settings
 engine = create_engine(
     str(settings.DATABASE_URL), # <-- Chuyển đổi sang string
-    pool_pre_ping=True,
-    pool_recycle=300,
-    pool_size=5,
-    max_overflow=10,
-    echo=False
+    **_engine_options(QueuePool, sync_pool_stats)
 )
+sync_pool_stats.pool = engine.pool
 
 # --- CÁC PHẦN CÒN LẠI GIỮ NGUYÊN VÌ ĐÃ RẤT TỐT ---
 
 # Tạo một lớp Session để quản lý các phiên làm việc với DB
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- THÊM: ENGINE ASYNC (psycopg 3) CHO CÁC ENDPOINT ĐỌC NHIỀU ---
+# Cùng database nhưng dùng driver async của psycopg 3, để query không chặn event loop.
+# Pool riêng với engine sync ở trên.
+async_engine = create_async_engine(
+    make_url(str(settings.DATABASE_URL)).set(drivername="postgresql+psycopg"),
+    **_engine_options(AsyncAdaptedQueuePool, async_pool_stats)
+)
+async_pool_stats.pool = async_engine.pool
+
+
+# --- THÊM: STATEMENT TIMEOUT THEO ROUTE ---
+# Middleware đặt giá trị này theo đường dẫn của request (tác vụ nền đặt DB_JOB_STATEMENT_TIMEOUT_MS);
+# mỗi transaction mở trong phạm vi đó sẽ chạy `SET LOCAL statement_timeout` nếu khác với mặc định của kết nối.
+statement_timeout_ms: ContextVar[Optional[int]] = ContextVar("statement_timeout_ms", default=None)
+
+
+def statement_timeout_for_path(path: str) -> int:
+    """Timeout (ms) cho một đường dẫn: khớp tiền tố dài nhất trong DB_ROUTE_STATEMENT_TIMEOUTS_MS."""
+    best_prefix = ""
+    timeout_ms = settings.DB_STATEMENT_TIMEOUT_MS
+    for prefix, value in settings.DB_ROUTE_STATEMENT_TIMEOUTS_MS.items():
+        if path.startswith(prefix) and len(prefix) > len(best_prefix):
+            best_prefix, timeout_ms = prefix, value
+    return timeout_ms
+
+
+def _apply_statement_timeout(conn):
+    timeout_ms = statement_timeout_ms.get()
+    if timeout_ms is None:
+        # Ngoài request và tác vụ nền (startup, script): qua PgBouncer thì vẫn phải đặt mặc định cho từng transaction
+        if not settings.DB_PGBOUNCER or not settings.DB_STATEMENT_TIMEOUT_MS:
+            return
+        timeout_ms = settings.DB_STATEMENT_TIMEOUT_MS
+    elif timeout_ms == settings.DB_STATEMENT_TIMEOUT_MS and not settings.DB_PGBOUNCER:
+        return # Đã là mặc định của kết nối
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+event.listen(engine, "begin", _apply_statement_timeout)
+event.listen(async_engine.sync_engine, "begin", _apply_statement_timeout)
+
+# expire_on_commit=False: object vẫn đọc được sau commit mà không phải lazy-load (lazy-load không dùng được với async)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class cho các model. Tất cả các model của bạn trong models.py
 # sẽ kế thừa từ lớp Base này.
 Base = declarative_base()
@@ -31,4 +165,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Dependency to get an async DB session for FastAPI (dùng cho endpoint `async def`)."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import text, inspect
 from ..core.config import logger
-from ..db.models import User, Branch
+from ..db.models import User, Branch, TASK_STATUS_RANK_SQL
 
 # Import the `employees` list from the `employees` module
 from ..services.user_service import sync_employees_from_source
@@ -61,8 +61,49 @@ def reset_all_sequences(db: Session):
     except Exception as e:
         db.rollback()
         logger.error(f"An error occurred during sequence reset: {e}", exc_info=True)
+        raise # Để run_steps không ghi nhận migrate đã hoàn tất
 
 
+def apply_schema_upgrades(db: Session):
+    """
+    Bổ sung các cột/index mới cho database đã tồn tại (create_all không tự thêm cột vào bảng cũ).
+    Mọi câu lệnh đều dùng IF NOT EXISTS nên có thể chạy lại nhiều lần an toàn.
+    """
+    if db.bind.dialect.name != 'postgresql':
+        logger.warning("Schema upgrades are only implemented for PostgreSQL. Skipping.")
+        return
+
+    statements = [
+        # user-028: Chống điểm danh trùng theo (nhân viên, ngày làm việc, người chấm, ca)
+        "ALTER TABLE attendance_records ADD COLUMN IF NOT EXISTS work_date DATE",
+        "ALTER TABLE attendance_records ADD COLUMN IF NOT EXISTS shift_slot VARCHAR(20)",
+        """CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_user_workdate_checker_slot
+           ON attendance_records (user_id, work_date, checker_id, shift_slot)""",
+        # user-029: Bán kính điểm danh riêng cho từng chi nhánh
+        "ALTER TABLE branches ADD COLUMN IF NOT EXISTS gps_radius_m INTEGER",
+        # user-042: Hạng sắp xếp lưu sẵn + index cho Keyset Pagination danh sách công việc
+        f"""ALTER TABLE tasks ADD COLUMN IF NOT EXISTS status_rank SMALLINT
+           GENERATED ALWAYS AS ({TASK_STATUS_RANK_SQL}) STORED""",
+        """CREATE INDEX IF NOT EXISTS ix_tasks_branch_status_rank_due
+           ON tasks (branch_id, status_rank, due_date, id)""",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_status_rank_due ON tasks (status_rank, due_date, id)",
+        # user-044: Lịch công việc theo chi nhánh + khoảng hạn hoàn thành
+        "CREATE INDEX IF NOT EXISTS ix_tasks_branch_due ON tasks (branch_id, due_date)",
+        # user-045: Đồng bộ nhân viên theo hash từng bản ghi
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS source_hash VARCHAR(64)",
+        # user-044: Thế hệ dữ liệu công việc dùng chung cho cache đọc của mọi worker
+        "CREATE SEQUENCE IF NOT EXISTS task_read_generation",
+    ]
+    try:
+        for statement in statements:
+            db.execute(text(statement))
+        db.commit()
+        logger.info("Schema upgrades applied.")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"An error occurred during schema upgrades: {e}", exc_info=True)
+        raise # Để run_steps không ghi nhận migrate đã hoàn tất
+
 def sync_employees_on_startup(db: Session):
     """
     Kiểm tra và đồng bộ dữ liệu nhân viên từ file `employees.py` vào database khi khởi động.
@@ -71,5 +112,6 @@ def sync_employees_on_startup(db: Session):
     logger.info("Starting employee data synchronization on startup...")
     # Gọi hàm đồng bộ thực tế từ user_service
     # force_delete=False để tránh xóa nhầm nhân viên khi file nguồn có thể bị lỗi
-    sync_employees_from_source(db=db, employees_source=employees, force_delete=False)
+    # skip_if_unchanged=True: bỏ qua hoàn toàn nếu employees.py không đổi kể từ lần đồng bộ trước
+    sync_employees_from_source(db=db, employees_source=employees, force_delete=False, skip_if_unchanged=True)
     logger.info("Employee data synchronization on startup finished.")
\ No newline at end of file
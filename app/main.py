@@ -1,27 +1,33 @@
 # app/main.py
 import os
+import time
 import atexit
+import asyncio
+import contextlib
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 from starlette.middleware.sessions import SessionMiddleware
-from apscheduler.schedulers.background import BackgroundScheduler
 
 # --- IMPORT MODULES ---
 # Đảm bảo file api/__init__.py đã export các router này
 from .api import (
     users, attendance, tasks, lost_and_found, 
     choose_function, utils, calendar, qr_checkin, 
-    results, export, service, shift_report
+    results, export, service, shift_report, live_feed
 )
 
 from .core.config import settings, logger
-from .core.utils import VN_TZ
-from .db.session import SessionLocal, engine, Base
-from .db.utils import reset_all_sequences, sync_employees_on_startup
-from .services.missing_attendance_service import run_daily_absence_check
-from .services.task_service import update_overdue_tasks_status
-from .services.lost_and_found_service import update_disposable_items_status
+from .db.session import SessionLocal, async_engine
+from .db.bootstrap import BOOTSTRAP_STEPS, run_steps, last_bootstrap_at
+from .services.task_due_queue import task_due_queue
+from .services.job_runner import build_scheduler
+from .services.job_queue import job_queue_worker
+from .core.pubsub import listen_postgres_notifications
+from .core.middleware import StatementTimeoutMiddleware, MetricsMiddleware
+from .core.query_inspector import QueryDebugMiddleware
+from .core.metrics import STARTUP_DURATION
+from .core.templating import warmup_templates
 
 # --- KHỞI TẠO APP ---
 app = FastAPI(
@@ -32,6 +38,11 @@ app = FastAPI(
 
 # --- MIDDLEWARE ---
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
+app.add_middleware(StatementTimeoutMiddleware)
+# Middleware thêm sau bọc ngoài: QueryDebugMiddleware nằm trong MetricsMiddleware để dùng chung bộ đếm SQL
+if settings.DEBUG_SQL_QUERIES:
+    app.add_middleware(QueryDebugMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # --- STATIC FILES ---
 static_dir = os.path.join(os.path.dirname(__file__), "static")
@@ -45,45 +56,79 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 @app.on_event("startup")
 async def startup_event():
     """
-    Khởi tạo DB và Scheduler khi ứng dụng bắt đầu.
+    Khởi động worker: chỉ kết nối DB và bật các thành phần chạy nền.
+    Tạo bảng, nâng cấp schema, reset sequence, đồng bộ nhân viên chạy một lần lúc deploy
+    bằng `python manage.py bootstrap` (hoặc bật RUN_BOOTSTRAP_ON_STARTUP cho dev).
+    Thời gian từng bước được ghi log và xuất ra /metrics (app_startup_seconds).
     """
     logger.info("🚀 Bắt đầu quá trình khởi động ứng dụng...")
+    started = phase_started = time.perf_counter()
+
+    def mark_phase(phase: str):
+        nonlocal phase_started
+        now = time.perf_counter()
+        STARTUP_DURATION.set((phase,), now - phase_started)
+        phase_started = now
 
-    # Tạo bảng nếu chưa có
-    Base.metadata.create_all(bind=engine)
-    
     try:
-        # Dùng context manager để đảm bảo đóng session an toàn
+        if settings.RUN_BOOTSTRAP_ON_STARTUP:
+            # Worker nào lấy được advisory lock thì chạy, các worker khác bỏ qua.
+            # Bước lỗi không được ghi nhận hoàn tất; worker vẫn khởi động tiếp (cảnh báo bên dưới nếu DB chưa từng được khởi tạo)
+            try:
+                run_steps(BOOTSTRAP_STEPS, wait=False)
+            except Exception as e:
+                logger.error(f"❌ Bootstrap lúc khởi động thất bại: {e}")
+            mark_phase("bootstrap")
+
         with SessionLocal() as db:
-            reset_all_sequences(db)
-            sync_employees_on_startup(db)
-
-        # Logic Scheduler (chỉ chạy ở process chính để tránh duplicate khi dev reload)
-        if os.environ.get("UVICORN_RELOAD") != "true":
-            scheduler = BackgroundScheduler(timezone=str(VN_TZ))
-            
-            # 7:05 sáng hàng ngày check vắng mặt
-            scheduler.add_job(
-                run_daily_absence_check, 
-                'cron', hour=7, minute=5, 
-                misfire_grace_time=900, id="daily_absence_check"
-            )
-            
-            # 30 phút/lần update task quá hạn
-            scheduler.add_job(
-                update_overdue_tasks_status, 
-                'cron', hour='0-23', minute='*/30', 
-                misfire_grace_time=300, id="update_overdue_tasks"
-            )
-            
+            if last_bootstrap_at(db) is None:
+                logger.warning("⚠️ Database chưa được khởi tạo: chạy `python manage.py bootstrap` trước khi khởi động worker.")
+            mark_phase("connect")
+
+        # Biên dịch sẵn toàn bộ template (bytecode cache trên đĩa dùng chung giữa các worker)
+        warmup_templates()
+        mark_phase("templates")
+
+        # Nhiều worker: nhận sự kiện pub/sub của các worker khác qua Postgres LISTEN/NOTIFY
+        if settings.PUBSUB_BACKEND == "postgres":
+            # Giữ tham chiếu: event loop chỉ giữ weak reference tới task; shutdown_event hủy task này
+            app.state.pubsub_listener_task = asyncio.create_task(listen_postgres_notifications())
+
+        # Scheduler + hàng đợi việc (background_jobs). Chạy ở đây hoặc ở tiến trình riêng `python manage.py worker`
+        # (RUN_BACKGROUND_WORKERS_IN_WEB=False). Mọi worker đều lập lịch; run_leased_job đảm bảo mỗi lượt
+        # chỉ một worker thực sự chạy (lease trong bảng job_leases, lịch sử ở job_runs, xem /api/admin/jobs).
+        # Không chạy ở process dev reload để tránh duplicate.
+        if settings.RUN_BACKGROUND_WORKERS_IN_WEB and os.environ.get("UVICORN_RELOAD") != "true":
+            scheduler = build_scheduler()
             scheduler.start()
             atexit.register(lambda: scheduler.shutdown())
-            logger.info("✅ Các tác vụ nền (Scheduler) đã được lập lịch.")
+            job_queue_worker.start()
+            atexit.register(job_queue_worker.stop)
+            # Lật trạng thái "Quá hạn" đúng hạn cho từng công việc; chỉ một tiến trình trong cụm giữ hàng đợi
+            task_due_queue.start()
+            atexit.register(task_due_queue.stop)
+            logger.info("✅ Các tác vụ nền (Scheduler, hàng đợi việc, hạn công việc) đã được khởi động.")
+        mark_phase("scheduler")
 
     except Exception as e:
         logger.error(f"❌ Lỗi khởi động: {e}", exc_info=True)
     
-    logger.info("✅ Startup hoàn tất.")
+    total_seconds = time.perf_counter() - started
+    STARTUP_DURATION.set(("total",), total_seconds)
+    logger.info(f"✅ Startup hoàn tất sau {total_seconds:.2f}s.")
+
+
+# --- SHUTDOWN EVENT ---
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Dừng tác vụ LISTEN của pub/sub và đóng các kết nối trong pool của engine async khi tắt ứng dụng."""
+    listener_task = getattr(app.state, "pubsub_listener_task", None)
+    if listener_task is not None:
+        listener_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await listener_task
+        app.state.pubsub_listener_task = None
+    await async_engine.dispose()
 
 
 # --- ROUTERS ---
@@ -100,6 +145,7 @@ app.include_router(shift_report.router, prefix="/shift-report", tags=["Shift Rep
 # QUAN TRỌNG: users.router chứa logic Login (/login), Logout (/logout)
 app.include_router(users.router, tags=["Authentication"]) 
 app.include_router(tasks.router, tags=["Tasks"])
+app.include_router(live_feed.router, tags=["Live Feed"])
 app.include_router(choose_function.router, tags=["Core UI"])
 app.include_router(utils.router, tags=["Utilities"])
 app.include_router(export.router, tags=["Export"])
@@ -0,0 +1,155 @@
+# app/services/branch_locator_service.py
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from ..core.config import BRANCH_COORDINATES, logger, settings
+from ..db.models import Branch
+from ..db.session import SessionLocal
+
+EARTH_RADIUS_KM = 6371.0
+
+# Tự nạp lại định kỳ để các worker khác cũng thấy thay đổi chi nhánh (mỗi process có bộ nhớ riêng)
+_REFRESH_INTERVAL_SECONDS = 600
+
+
+class BranchLocator:
+    """
+    Tra cứu chi nhánh gần nhất theo tọa độ GPS.
+    Tọa độ (đã đổi sang radian) và bán kính của các chi nhánh được giữ sẵn trong mảng NumPy,
+    nên mỗi lần tra cứu chỉ là vài phép tính vector thay vì vòng lặp Python qua từng chi nhánh.
+    """
+
+    def __init__(self):
+        self._refresh_lock = threading.Lock()
+        # (mã chi nhánh, vĩ độ rad, kinh độ rad, cos(vĩ độ), bán kính km) - thay thế cả bộ một lần
+        # để các request đang tra cứu không bao giờ thấy dữ liệu nửa cũ nửa mới.
+        self._snapshot: Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray] = (
+            [], np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+        )
+        self._loaded_at: Optional[float] = None
+
+    def load(self, entries: Iterable[Tuple[str, float, float, float]]):
+        """Nạp danh sách (mã chi nhánh, vĩ độ, kinh độ, bán kính km) vào bộ nhớ."""
+        entries = list(entries)
+        codes = [code for code, _, _, _ in entries]
+        lat_rad = np.radians(np.array([lat for _, lat, _, _ in entries], dtype=float))
+        lng_rad = np.radians(np.array([lng for _, _, lng, _ in entries], dtype=float))
+        radius_km = np.array([radius for _, _, _, radius in entries], dtype=float)
+
+        self._snapshot = (codes, lat_rad, lng_rad, np.cos(lat_rad), radius_km)
+        self._loaded_at = time.monotonic()
+
+    def refresh(self, db: Session):
+        """
+        Đọc tọa độ chi nhánh từ bảng `branches`.
+        Chi nhánh chưa có tọa độ trong DB sẽ dùng tọa độ cấu hình sẵn trong BRANCH_COORDINATES.
+        """
+        default_radius_km = settings.BRANCH_CHECKIN_RADIUS_M / 1000
+        rows = db.query(Branch.branch_code, Branch.gps_lat, Branch.gps_lng, Branch.gps_radius_m).all()
+
+        entries: Dict[str, Tuple[str, float, float, float]] = {}
+        for code, lat, lng, radius_m in rows:
+            if lat is None or lng is None:
+                if code not in BRANCH_COORDINATES:
+                    continue
+                lat, lng = BRANCH_COORDINATES[code]
+            radius_km = radius_m / 1000 if radius_m else default_radius_km
+            entries[code] = (code, float(lat), float(lng), radius_km)
+
+        for code, (lat, lng) in BRANCH_COORDINATES.items():
+            if code not in entries:
+                entries[code] = (code, float(lat), float(lng), default_radius_km)
+
+        self.load(entries.values())
+        logger.info(f"Đã nạp tọa độ của {len(entries)} chi nhánh cho tra cứu GPS.")
+
+    def invalidate(self):
+        """Đánh dấu dữ liệu đã cũ, lần tra cứu tiếp theo sẽ nạp lại từ DB."""
+        self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        with self._refresh_lock:
+            if self._is_fresh():
+                return
+            try:
+                with SessionLocal() as db:
+                    self.refresh(db)
+            except Exception as e:
+                logger.error(f"Lỗi khi nạp tọa độ chi nhánh từ DB: {e}", exc_info=True)
+                if not self._snapshot[0]:
+                    # Chưa từng nạp được -> dùng tọa độ cấu hình sẵn để không chặn điểm danh
+                    default_radius_km = settings.BRANCH_CHECKIN_RADIUS_M / 1000
+                    self.load((code, lat, lng, default_radius_km) for code, (lat, lng) in BRANCH_COORDINATES.items())
+
+    def _is_fresh(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < _REFRESH_INTERVAL_SECONDS
+
+    def has_branch(self, branch_code: str) -> bool:
+        self._ensure_loaded()
+        return branch_code in self._snapshot[0]
+
+    @staticmethod
+    def _distances_km(snapshot, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """Ma trận khoảng cách Haversine (km), kích thước (số điểm, số chi nhánh)."""
+        _, branch_lat_rad, branch_lng_rad, branch_cos_lat, _ = snapshot
+        lat_rad = np.radians(lats)[:, None]
+        lng_rad = np.radians(lngs)[:, None]
+        dlat = branch_lat_rad[None, :] - lat_rad
+        dlng = branch_lng_rad[None, :] - lng_rad
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad) * branch_cos_lat[None, :] * np.sin(dlng / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    def nearby_many(self, points: Sequence[Tuple[float, float]]) -> List[List[Tuple[str, float]]]:
+        """
+        Tra cứu theo lô: với mỗi điểm (lat, lng) trả về danh sách (mã chi nhánh, khoảng cách km)
+        nằm trong bán kính của chi nhánh đó, sắp xếp theo khoảng cách tăng dần.
+        Dùng để phát lại log GPS hoặc kiểm tra nhiều điểm cùng lúc.
+        """
+        self._ensure_loaded()
+        snapshot = self._snapshot
+        codes, radius_km = snapshot[0], snapshot[4]
+        if not len(points) or not codes:
+            return [[] for _ in points]
+
+        coords = np.asarray(points, dtype=float)
+        distances = self._distances_km(snapshot, coords[:, 0], coords[:, 1])
+        within = distances <= radius_km[None, :]
+
+        results = []
+        for row_distances, row_within in zip(distances, within):
+            idx = np.flatnonzero(row_within)
+            idx = idx[np.argsort(row_distances[idx])]
+            results.append([(codes[i], float(row_distances[i])) for i in idx])
+        return results
+
+    def nearby(self, lat: float, lng: float) -> List[Tuple[str, float]]:
+        """Danh sách chi nhánh trong bán kính quanh một điểm, gần nhất trước."""
+        return self.nearby_many([(lat, lng)])[0]
+
+
+# Một instance dùng chung cho toàn bộ process
+branch_locator = BranchLocator()
+
+
+# --- TỰ ĐỘNG LÀM MỚI KHI CHI NHÁNH BỊ SỬA ---
+# Đánh dấu trong session khi flush thay đổi bảng branches, và chỉ invalidate sau khi commit thành công.
+def _mark_branches_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["branches_changed"] = True
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Branch, _event_name, _mark_branches_changed)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_branch_locator(session):
+    if session.info.pop("branches_changed", False):
+        branch_locator.invalidate()
@@ -0,0 +1,296 @@
+# app/services/job_queue.py
+"""
+Hàng đợi việc chạy sau request, lưu trong bảng background_jobs của PostgreSQL.
+
+- Endpoint gọi `enqueue(db, ...)` trước khi commit: việc được ghi cùng transaction với dữ liệu chính
+  (request rollback thì việc cũng không có), rồi trả kết quả ngay không chờ việc chạy xong.
+- Worker lấy việc bằng UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED): nhiều worker/tiến trình
+  cùng chạy không lấy trùng và không chặn nhau.
+- Việc lỗi được thử lại với backoff lũy thừa (có jitter) tới max_attempts, sau đó chuyển "failed".
+- Việc "running" quá JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS (worker chết) được đưa lại hàng đợi,
+  hoặc chuyển "failed" nếu đã hết lượt thử.
+
+Worker chạy trong luồng nền của worker web (RUN_BACKGROUND_WORKERS_IN_WEB) hoặc tiến trình riêng:
+    python manage.py worker
+Handler phải idempotent: một việc có thể chạy lại khi worker chết sau khi xử lý mà chưa kịp ghi "done".
+"""
+import random
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..core.config import settings, logger
+from ..core.utils import worker_id
+from ..core.metrics import JOB_QUEUE_DEPTH, JOB_QUEUE_OLDEST_AGE, JOB_QUEUE_PROCESSED, JOB_QUEUE_DURATION
+from ..db.models import BackgroundJob
+from ..db.session import SessionLocal, statement_timeout_ms
+
+JobHandler = Callable[[Session, dict], Optional[int]]
+
+# Các module đăng ký handler bằng @job_handler; được import khi worker khởi động
+# để tiến trình `manage.py worker` (không import app.main) cũng có đủ handler.
+HANDLER_MODULES = ("shift_report_service", "lost_and_found_service", "missing_attendance_service")
+
+_CLAIM_BATCH_SIZE = 10
+_BACKOFF_BASE_SECONDS = 10
+_BACKOFF_MAX_SECONDS = 3600
+_MAX_ERROR_LENGTH = 4000
+# Việc "done" được xóa sau số ngày này (việc "failed" giữ lại để kiểm tra)
+_DONE_RETENTION_DAYS = 7
+_MAINTENANCE_INTERVAL_SECONDS = 60
+# /metrics đọc độ sâu hàng đợi từ DB tối đa một lần trong khoảng này
+_METRICS_REFRESH_SECONDS = 10
+# Phải khớp điều kiện của index uq_background_jobs_dedupe
+_DEDUPE_INDEX_WHERE = text("status = 'queued' AND dedupe_key IS NOT NULL")
+
+_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Đăng ký hàm xử lý cho một loại việc: handler(db, payload) -> số dòng bị ảnh hưởng (tùy chọn)."""
+    def decorator(func_to_register: JobHandler) -> JobHandler:
+        _HANDLERS[kind] = func_to_register
+        return func_to_register
+    return decorator
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    delay_seconds: float = 0,
+    max_attempts: int = 5,
+    dedupe_key: Optional[str] = None,
+):
+    """
+    Thêm việc vào hàng đợi trong transaction hiện tại của `db` (người gọi commit).
+    dedupe_key: nếu đã có việc cùng khóa đang chờ thì không thêm nữa (vd. các lần quét định kỳ).
+    """
+    stmt = pg_insert(BackgroundJob).values(
+        kind=kind,
+        payload=payload or {},
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=func.now() + timedelta(seconds=delay_seconds),
+        dedupe_key=dedupe_key,
+        created_at=func.now(),
+    )
+    if dedupe_key:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[BackgroundJob.dedupe_key], index_where=_DEDUPE_INDEX_WHERE)
+    db.execute(stmt)
+
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _claim(owner: str, limit: int) -> list:
+    ready = (
+        select(BackgroundJob.id)
+        .where(BackgroundJob.status == "queued", BackgroundJob.run_at <= func.now())
+        .order_by(BackgroundJob.run_at, BackgroundJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(BackgroundJob)
+        .where(BackgroundJob.id.in_(ready))
+        # Rời trạng thái chờ -> bỏ dedupe_key để việc mới cùng khóa có thể được thêm
+        .values(status="running", locked_by=owner, locked_at=func.now(),
+                attempts=BackgroundJob.attempts + 1, dedupe_key=None)
+        .returning(BackgroundJob.id, BackgroundJob.kind, BackgroundJob.payload,
+                   BackgroundJob.attempts, BackgroundJob.max_attempts)
+        .execution_options(synchronize_session=False)
+    )
+    with SessionLocal() as db:
+        rows = db.execute(stmt).all()
+        db.commit()
+    return rows
+
+
+def _mark_failed_attempt(job_id: int, attempts: int, max_attempts: int, error: str) -> str:
+    if attempts >= max_attempts:
+        values = {"status": "failed", "finished_at": func.now()}
+        result = "failed"
+    else:
+        values = {"status": "queued", "run_at": func.now() + timedelta(seconds=_backoff_seconds(attempts))}
+        result = "retry"
+    with SessionLocal() as db:
+        db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id)
+            .values(locked_by=None, locked_at=None, last_error=error, **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return result
+
+
+def _process(job) -> str:
+    """Chạy handler và đánh dấu "done" trong cùng transaction; lỗi -> thử lại sau hoặc "failed"."""
+    started = time.perf_counter()
+    handler = _HANDLERS.get(job.kind)
+    # Handler chạy với timeout của tác vụ nền, không dùng mặc định 30s của kết nối (dành cho request web)
+    timeout_token = statement_timeout_ms.set(settings.DB_JOB_STATEMENT_TIMEOUT_MS)
+    with SessionLocal() as db:
+        try:
+            if handler is None:
+                raise LookupError(f"Không có handler cho loại việc '{job.kind}'")
+            handler(db, job.payload or {})
+            db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job.id)
+                .values(status="done", finished_at=func.now(), last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            result = "done"
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[JOB_QUEUE] Việc #{job.id} ({job.kind}) lỗi ở lần thử {job.attempts}/{job.max_attempts}: {e}", exc_info=True)
+            result = None
+            error = f"{type(e).__name__}: {e}"[:_MAX_ERROR_LENGTH]
+        finally:
+            statement_timeout_ms.reset(timeout_token)
+    if result is None:
+        result = _mark_failed_attempt(job.id, job.attempts, job.max_attempts, error)
+    JOB_QUEUE_DURATION.observe((job.kind,), time.perf_counter() - started)
+    JOB_QUEUE_PROCESSED.inc((job.kind, result))
+    return result
+
+
+def _maintenance():
+    """
+    Xử lý các việc bị bỏ dở (worker chết): đã dùng hết lượt thử thì chuyển "failed", còn lại đưa lại hàng đợi.
+    Xóa việc "done" đã cũ.
+    """
+    stuck = (
+        BackgroundJob.status == "running",
+        BackgroundJob.locked_at < func.now() - timedelta(seconds=settings.JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS),
+    )
+    with SessionLocal() as db:
+        # attempts đã được tăng lúc lấy việc -> lần bị bỏ dở cũng tính là một lượt thử
+        failed = db.execute(
+            update(BackgroundJob)
+            .where(*stuck, BackgroundJob.attempts >= BackgroundJob.max_attempts)
+            .values(status="failed", finished_at=func.now(), locked_by=None, locked_at=None,
+                    last_error="Worker dừng giữa chừng ở lượt thử cuối (quá hạn xử lý)")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        requeued = db.execute(
+            update(BackgroundJob)
+            .where(*stuck, BackgroundJob.attempts < BackgroundJob.max_attempts)
+            .values(status="queued", run_at=func.now(), locked_by=None, locked_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        purged = db.execute(
+            delete(BackgroundJob)
+            .where(BackgroundJob.status == "done", BackgroundJob.finished_at < func.now() - timedelta(days=_DONE_RETENTION_DAYS))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+    if failed:
+        logger.error(f"[JOB_QUEUE] {failed} việc bị bỏ dở quá hạn xử lý đã hết lượt thử, chuyển 'failed'.")
+    if requeued:
+        logger.warning(f"[JOB_QUEUE] Đưa lại hàng đợi {requeued} việc bị bỏ dở quá hạn xử lý.")
+    if purged:
+        logger.info(f"[JOB_QUEUE] Đã xóa {purged} việc hoàn tất cũ hơn {_DONE_RETENTION_DAYS} ngày.")
+
+
+_metrics_lock = threading.Lock()
+_metrics_refreshed_at = 0.0
+
+
+def refresh_queue_metrics():
+    """Cập nhật gauge độ sâu/tuổi hàng đợi từ DB (gọi khi scrape /metrics, tối đa mỗi _METRICS_REFRESH_SECONDS)."""
+    global _metrics_refreshed_at
+    with _metrics_lock:
+        if time.monotonic() - _metrics_refreshed_at < _METRICS_REFRESH_SECONDS:
+            return
+        _metrics_refreshed_at = time.monotonic()
+    try:
+        with SessionLocal() as db:
+            counts = dict(db.execute(
+                select(BackgroundJob.status, func.count())
+                .where(BackgroundJob.status.in_(("queued", "running", "failed")))
+                .group_by(BackgroundJob.status)
+            ).all())
+            oldest_age = db.execute(
+                select(func.extract("epoch", func.now() - func.min(BackgroundJob.run_at)))
+                .where(BackgroundJob.status == "queued", BackgroundJob.run_at <= func.now())
+            ).scalar()
+    except Exception as e:
+        logger.error(f"[JOB_QUEUE] Lỗi khi đọc độ sâu hàng đợi cho /metrics: {e}", exc_info=True)
+        return
+    for status in ("queued", "running", "failed"):
+        JOB_QUEUE_DEPTH.set((status,), counts.get(status, 0))
+    JOB_QUEUE_OLDEST_AGE.set((), float(oldest_age or 0))
+
+
+def load_handlers():
+    for module_name in HANDLER_MODULES:
+        import_module(f".{module_name}", __package__)
+
+
+class JobQueueWorker:
+    """Vòng lặp lấy và xử lý việc; chạy trong luồng nền (start/stop) hoặc ở tiền cảnh (run_forever)."""
+
+    def __init__(self, batch_size: int = _CLAIM_BATCH_SIZE):
+        self._batch_size = batch_size
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        load_handlers()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-queue-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def run_forever(self):
+        load_handlers()
+        self._stopped.clear()
+        self._loop()
+
+    def _loop(self):
+        owner = worker_id()
+        logger.info(f"[JOB_QUEUE] Worker {owner} bắt đầu xử lý hàng đợi ({len(_HANDLERS)} loại việc).")
+        last_maintenance = 0.0
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() - last_maintenance >= _MAINTENANCE_INTERVAL_SECONDS:
+                    _maintenance()
+                    last_maintenance = time.monotonic()
+                jobs = _claim(owner, self._batch_size)
+            except Exception as e:
+                logger.error(f"[JOB_QUEUE] Lỗi khi lấy việc từ hàng đợi: {e}", exc_info=True)
+                self._stopped.wait(settings.JOB_QUEUE_POLL_SECONDS)
+                continue
+            for job in jobs:
+                _process(job)
+            # Lô đầy -> có thể còn việc, lấy tiếp ngay
+            if len(jobs) < self._batch_size:
+                self._stopped.wait(settings.JOB_QUEUE_POLL_SECONDS)
+
+
+# Một instance dùng chung cho worker web
+job_queue_worker = JobQueueWorker()
@@ -0,0 +1,243 @@
+# app/services/job_runner.py
+"""
+Chạy tác vụ nền đúng MỘT lần trên toàn cụm dù mỗi worker đều có BackgroundScheduler riêng.
+
+Mỗi tác vụ có một dòng trong bảng job_leases. Khi tới giờ, mọi worker cùng thử "thuê" dòng đó bằng
+một câu INSERT ... ON CONFLICT DO UPDATE ... WHERE lease_until <= now(): chỉ một worker thắng.
+- Worker thắng gia hạn lease định kỳ (heartbeat) trong lúc chạy; nếu worker chết, lease tự hết hạn.
+- Chạy xong, lease vẫn được giữ tới ít nhất locked_at + min_hold_seconds để worker nào tới muộn
+  vài giây (lệch đồng hồ, event loop bận) không chạy lại cùng lượt.
+- Mọi mốc thời gian dùng đồng hồ của PostgreSQL (now()) nên không phụ thuộc đồng hồ từng máy.
+
+Mỗi lần chạy ghi một dòng vào job_runs (bắt đầu, kết thúc, số dòng bị ảnh hưởng, lỗi).
+"""
+import threading
+from datetime import timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from ..core.config import settings, logger
+from ..core.utils import VN_TZ, worker_id
+from ..db.models import JobLease, JobRun
+from ..db.session import SessionLocal, statement_timeout_ms
+from .missing_attendance_service import run_daily_absence_check
+from .task_service import update_overdue_tasks_status
+
+# Lease hết hạn sau chừng này giây nếu không được gia hạn (worker chết giữa chừng)
+DEFAULT_LEASE_SECONDS = 60
+# Giữ lease tối thiểu kể từ lúc bắt đầu, kể cả khi tác vụ chạy xong sớm hơn.
+# Phải dài hơn misfire_grace_time của các tác vụ (worker khởi động muộn vẫn chạy bù trong khoảng đó).
+DEFAULT_MIN_HOLD_SECONDS = 2 * 3600
+# Giới hạn độ dài thông báo lỗi lưu vào job_runs
+_MAX_ERROR_LENGTH = 4000
+
+
+def _try_acquire(job_name: str, owner: str, lease_seconds: int) -> bool:
+    lease_until = func.now() + timedelta(seconds=lease_seconds)
+    stmt = pg_insert(JobLease).values(
+        job_name=job_name, owner=owner, locked_at=func.now(), lease_until=lease_until, heartbeat_at=func.now()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[JobLease.job_name],
+        set_={"owner": owner, "locked_at": func.now(), "lease_until": lease_until, "heartbeat_at": func.now()},
+        where=JobLease.lease_until <= func.now()
+    ).returning(JobLease.job_name)
+    with SessionLocal() as db:
+        acquired = db.execute(stmt).scalar() is not None
+        if acquired:
+            # Lease cũ đã hết hạn mà lần chạy trước vẫn "running" -> worker đó đã chết giữa chừng
+            db.execute(
+                update(JobRun)
+                .where(JobRun.job_name == job_name, JobRun.status == "running")
+                .values(status="abandoned", finished_at=func.now())
+            )
+        db.commit()
+    return acquired
+
+
+def _renew(job_name: str, owner: str, lease_seconds: int) -> bool:
+    with SessionLocal() as db:
+        renewed = db.execute(
+            update(JobLease)
+            .where(JobLease.job_name == job_name, JobLease.owner == owner)
+            .values(lease_until=func.now() + timedelta(seconds=lease_seconds), heartbeat_at=func.now())
+        ).rowcount
+        db.commit()
+    return renewed > 0
+
+
+def _release(job_name: str, owner: str, min_hold_seconds: int):
+    with SessionLocal() as db:
+        db.execute(
+            update(JobLease)
+            .where(JobLease.job_name == job_name, JobLease.owner == owner)
+            .values(lease_until=func.greatest(func.now(), JobLease.locked_at + timedelta(seconds=min_hold_seconds)))
+        )
+        db.commit()
+
+
+def _start_run(job_name: str, owner: str) -> int:
+    with SessionLocal() as db:
+        run_id = db.execute(
+            pg_insert(JobRun)
+            .values(job_name=job_name, owner=owner, started_at=func.now(), status="running")
+            .returning(JobRun.id)
+        ).scalar()
+        db.commit()
+    return run_id
+
+
+def _finish_run(run_id: int, status: str, rows_affected: Optional[int], error: Optional[str]):
+    with SessionLocal() as db:
+        db.execute(
+            update(JobRun)
+            .where(JobRun.id == run_id)
+            .values(finished_at=func.now(), status=status, rows_affected=rows_affected, error=error)
+        )
+        db.commit()
+
+
+class _Heartbeat:
+    """Luồng nền gia hạn lease mỗi lease_seconds/3 trong lúc tác vụ đang chạy."""
+
+    def __init__(self, job_name: str, owner: str, lease_seconds: int):
+        self._job_name = job_name
+        self._owner = owner
+        self._lease_seconds = lease_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_name}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stopped.wait(self._lease_seconds / 3):
+            try:
+                if not _renew(self._job_name, self._owner, self._lease_seconds):
+                    logger.warning(f"[JOB] '{self._job_name}': mất lease (worker khác đã giành), tác vụ vẫn chạy nốt.")
+                    return
+            except Exception as e:
+                logger.error(f"[JOB] Lỗi khi gia hạn lease '{self._job_name}': {e}", exc_info=True)
+
+
+def run_leased_job(
+    job_name: str,
+    func_to_run: Callable[[], Any],
+    lease_seconds: int = DEFAULT_LEASE_SECONDS,
+    min_hold_seconds: int = DEFAULT_MIN_HOLD_SECONDS,
+) -> bool:
+    """
+    Chạy `func_to_run` nếu worker này thuê được lease của `job_name`; worker khác đang/vừa chạy thì bỏ qua.
+    Giá trị trả về kiểu int của tác vụ được lưu làm rows_affected. Trả về True nếu tác vụ đã chạy ở worker này.
+    Dùng làm hàm cho scheduler: scheduler.add_job(run_leased_job, 'cron', ..., args=("tên", hàm)).
+    """
+    owner = worker_id()
+    try:
+        if not _try_acquire(job_name, owner, lease_seconds):
+            logger.debug(f"[JOB] '{job_name}' đang/vừa được worker khác chạy, bỏ qua.")
+            return False
+        run_id = _start_run(job_name, owner)
+    except Exception as e:
+        logger.error(f"[JOB] Không lấy được lease cho '{job_name}': {e}", exc_info=True)
+        return False
+
+    logger.info(f"[JOB] Bắt đầu '{job_name}' trên worker {owner} (run #{run_id}).")
+    status, rows_affected, error = "error", None, None
+    # Không dùng timeout mặc định 30s của kết nối (dành cho request web)
+    timeout_token = statement_timeout_ms.set(settings.DB_JOB_STATEMENT_TIMEOUT_MS)
+    try:
+        with _Heartbeat(job_name, owner, lease_seconds):
+            result = func_to_run()
+        status = "success"
+        if isinstance(result, int) and not isinstance(result, bool):
+            rows_affected = result
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:_MAX_ERROR_LENGTH]
+        logger.error(f"[JOB] '{job_name}' thất bại: {e}", exc_info=True)
+    finally:
+        statement_timeout_ms.reset(timeout_token)
+        try:
+            _finish_run(run_id, status, rows_affected, error)
+            _release(job_name, owner, min_hold_seconds)
+        except Exception as e:
+            # Lease vẫn tự hết hạn sau lease_seconds
+            logger.error(f"[JOB] Lỗi khi ghi kết quả/nhả lease '{job_name}': {e}", exc_info=True)
+    logger.info(f"[JOB] Kết thúc '{job_name}' (run #{run_id}): {status}, rows_affected={rows_affected}.")
+    return True
+
+
+def build_scheduler() -> BackgroundScheduler:
+    """
+    Lịch các tác vụ nền. Dùng chung cho worker web và tiến trình `manage.py worker`:
+    mọi tiến trình đều lập lịch, run_leased_job đảm bảo mỗi lượt chỉ một tiến trình thực sự chạy.
+    """
+    scheduler = BackgroundScheduler(timezone=str(VN_TZ))
+
+    # 7:05 sáng hàng ngày check vắng mặt
+    scheduler.add_job(
+        run_leased_job,
+        'cron', hour=7, minute=5,
+        args=("daily_absence_check", run_daily_absence_check),
+        misfire_grace_time=900, id="daily_absence_check"
+    )
+
+    # Quét bù task quá hạn 1 lần/ngày (việc lật đúng hạn do task_due_queue đảm nhận)
+    scheduler.add_job(
+        run_leased_job,
+        'cron', hour=3, minute=30,
+        args=("update_overdue_tasks", update_overdue_tasks_status),
+        misfire_grace_time=3600, id="update_overdue_tasks"
+    )
+    return scheduler
+
+
+def job_status(db: Session, job_name: Optional[str] = None, limit: int = 50) -> dict:
+    """Lease hiện tại của các tác vụ và lịch sử chạy gần nhất (mới nhất trước), dùng cho trang quản trị."""
+    leases = db.execute(select(JobLease).order_by(JobLease.job_name)).scalars().all()
+    runs_query = select(JobRun).order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit)
+    if job_name:
+        runs_query = runs_query.where(JobRun.job_name == job_name)
+    runs = db.execute(runs_query).scalars().all()
+    db_now = db.execute(select(func.now())).scalar()
+
+    def iso(value):
+        return value.isoformat() if value else None
+
+    return {
+        "now": iso(db_now),
+        "leases": [
+            {
+                "job_name": lease.job_name,
+                "owner": lease.owner,
+                "locked_at": iso(lease.locked_at),
+                "lease_until": iso(lease.lease_until),
+                "heartbeat_at": iso(lease.heartbeat_at),
+                "held": lease.lease_until > db_now,
+            }
+            for lease in leases
+        ],
+        "runs": [
+            {
+                "id": run.id,
+                "job_name": run.job_name,
+                "owner": run.owner,
+                "started_at": iso(run.started_at),
+                "finished_at": iso(run.finished_at),
+                "duration_seconds": (run.finished_at - run.started_at).total_seconds() if run.finished_at else None,
+                "status": run.status,
+                "rows_affected": run.rows_affected,
+                "error": run.error,
+            }
+            for run in runs
+        ],
+    }
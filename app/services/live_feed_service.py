@@ -0,0 +1,80 @@
+# app/services/live_feed_service.py
+"""
+Luồng cập nhật trực tiếp theo chi nhánh cho trang Báo cáo ca và Công việc.
+Các endpoint ghi dữ liệu gọi `publish_branch_delta()` sau khi commit; client đang mở WebSocket
+`/ws/branches/{branch_code}` nhận delta gọn và tự cập nhật danh sách mà không cần tải lại.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..core.config import logger, settings
+from ..core.pubsub import PG_NOTIFY_MAX_PAYLOAD, broker, publish
+
+# Các loại tài nguyên và hành động được phát
+LIVE_FEED_RESOURCES = ("shift_report", "tasks")
+LIVE_FEED_ACTIONS = ("created", "updated", "closed", "deleted")
+# Vai trò được xem bản ghi đã xóa mềm trong danh sách (khớp bộ lọc "Đã xoá" của từng trang)
+SOFT_DELETED_VISIBLE_ROLES = {
+    "shift_report": ("admin", "boss"),
+    "tasks": ("quanly", "admin", "boss"),
+}
+
+
+def branch_channel(branch_code: str) -> str:
+    """Kênh sự kiện của một chi nhánh."""
+    return f"branch:{branch_code}"
+
+
+def publish_branch_delta(
+    branch_code: Optional[str],
+    resource: str,
+    action: str,
+    ids: Iterable[int],
+    items: Optional[List[Dict[str, Any]]] = None,
+    soft_deleted: bool = False,
+):
+    """
+    Phát một delta tới các client đang theo dõi chi nhánh:
+    {"resource": "shift_report"|"tasks", "action": "created"|"updated"|"closed"|"deleted",
+     "ids": [...], "items": [...]}
+    `items` là các bản ghi đã serialize (bỏ trống với "deleted").
+    soft_deleted=True: các bản ghi vừa bị xóa mềm; vai trò không được xem bản ghi đã xóa
+    nhận delta "deleted" thay vì "updated" (xem delta_for_role).
+    Không bao giờ raise: lỗi phát sự kiện không được làm hỏng thao tác ghi đã commit.
+    """
+    if not branch_code:
+        return
+    try:
+        ids = list(ids)
+        if not ids:
+            return
+        channel = branch_channel(branch_code)
+        # Không ai theo dõi trong process này và không cần gửi qua Postgres -> bỏ qua serialize
+        if settings.PUBSUB_BACKEND != "postgres" and not broker.subscriber_count(channel):
+            return
+
+        message = {"resource": resource, "action": action, "ids": ids, "items": items or []}
+        if soft_deleted:
+            message["soft_deleted"] = True
+        if items and settings.PUBSUB_BACKEND == "postgres":
+            # Delta quá lớn cho NOTIFY: chỉ gửi id, client sẽ tự tải lại danh sách
+            size = len(json.dumps({"channel": channel, "message": message}, ensure_ascii=False, default=str).encode("utf-8"))
+            if size > PG_NOTIFY_MAX_PAYLOAD:
+                message["items"] = []
+                message["reload"] = True
+
+        publish(channel, message)
+    except Exception as e:
+        logger.error(f"[LIVE_FEED] Lỗi khi phát delta {resource}/{action} cho chi nhánh {branch_code}: {e}", exc_info=True)
+
+
+def delta_for_role(message: Dict[str, Any], role: Optional[str]) -> Dict[str, Any]:
+    """
+    Điều chỉnh delta theo vai trò người nhận: bản ghi xóa mềm chỉ được gửi đầy đủ cho vai trò
+    được xem "Đã xoá"; các vai trò khác chỉ nhận lệnh gỡ bản ghi khỏi danh sách.
+    """
+    if not message.get("soft_deleted"):
+        return message
+    if role in SOFT_DELETED_VISIBLE_ROLES.get(message.get("resource"), ()):
+        return {key: value for key, value in message.items() if key != "soft_deleted"}
+    return {"resource": message["resource"], "action": "deleted", "ids": message["ids"], "items": []}
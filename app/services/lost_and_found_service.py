@@ -6,8 +6,12 @@ from ..db.models import LostAndFoundItem, LostItemStatus
 from ..core.utils import VN_TZ
 from ..db.session import SessionLocal
 from ..core.config import logger
+from .job_queue import job_handler
 
-def update_disposable_items_status(db: Session):
+# Loại việc trong hàng đợi: quét chuyển đồ thất lạc quá 30 ngày sang "Có thể thanh lý"
+DISPOSABLE_SWEEP_JOB = "lost_and_found.disposable_sweep"
+
+def update_disposable_items_status(db: Session) -> int:
     """
     Cập nhật trạng thái các món đồ từ "Đang lưu giữ"
     sang "Có thể thanh lý" sau 30 ngày.
@@ -28,8 +32,14 @@ def update_disposable_items_status(db: Session):
 
         if updated_count > 0:
             logger.info(f"[STATUS_UPDATE] Đã cập nhật {updated_count} đồ thất lạc sang trạng thái 'Có thể thanh lý'.")
+        return updated_count
 
     except Exception as e:
         logger.error(f"[STATUS_UPDATE] Lỗi khi cập nhật trạng thái đồ thất lạc: {e}", exc_info=True)
         # Không rollback ở đây, để endpoint tự quản lý
         raise # Ném lại lỗi để endpoint có thể xử lý
+
+
+@job_handler(DISPOSABLE_SWEEP_JOB)
+def _disposable_sweep_job(db: Session, payload: dict) -> int:
+    return update_disposable_items_status(db)
@@ -1,115 +1,157 @@
 # app/services/missing_attendance_service.py
 from datetime import datetime, time, timedelta, date
 from typing import Optional
-from sqlalchemy import and_, or_, cast, Date
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, or_, cast, Date, BIGINT, select, insert, exists, literal, column, values, func, true, text
+from sqlalchemy.orm import Session
 
 # Import từ các module đã tái cấu trúc
 from ..db.session import SessionLocal
-from ..db.models import User, AttendanceRecord, Department
+from ..db.models import User, AttendanceRecord, Department, Branch
 from ..core.config import logger
 from ..core.utils import VN_TZ
+from ..core.metrics import timed_job
+from .job_queue import job_handler
 
-def run_daily_absence_check(target_date: Optional[date] = None):
+# Giá trị shift_slot cho bản ghi vắng mặt do hệ thống tạo
+ABSENCE_SHIFT_SLOT = "Vắng mặt"
+# Advisory lock (PostgreSQL) cho việc tính lại vắng mặt: lần chạy theo lịch và chạy bù thủ công
+# không được xóa/chèn chồng lên nhau (bản ghi hệ thống có checker_id NULL nên UNIQUE không chặn trùng)
+ABSENCE_CHECK_LOCK_KEY = 734502
+# Loại việc trong hàng đợi: chạy bù kiểm tra vắng mặt do admin yêu cầu
+ABSENCE_BACKFILL_JOB = "attendance.absence_backfill"
+
+@timed_job("daily_absence_check")
+def run_daily_absence_check(target_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
     """
     Chạy kiểm tra và ghi nhận nhân viên vắng mặt.
-    Nếu target_date được cung cấp, sẽ chạy cho ngày đó (chạy thủ công).
+    Nếu target_date được cung cấp, sẽ chạy cho ngày đó (chạy thủ công),
+    hoặc cho cả khoảng [target_date, end_date] nếu có end_date (chạy bù nhiều ngày).
     Nếu không, sẽ chạy cho ngày hôm trước (dùng cho cron job tự động).
+    Trả về số bản ghi vắng mặt đã thêm.
     """
     log_prefix = "thủ công"
     if target_date is None:
         target_date = datetime.now(VN_TZ).date() - timedelta(days=1)
         log_prefix = "tự động"
+    end_date = end_date or target_date
+
+    period_str = target_date.strftime('%d/%m/%Y')
+    if end_date != target_date:
+        period_str += f" - {end_date.strftime('%d/%m/%Y')}"
 
-    logger.info(f"Bắt đầu chạy kiểm tra điểm danh vắng {log_prefix} cho ngày {target_date.strftime('%d/%m/%Y')}")
+    logger.info(f"Bắt đầu chạy kiểm tra điểm danh vắng {log_prefix} cho ngày {period_str}")
     # Gọi hàm xử lý chính trong cùng file
-    update_missing_attendance_to_db(target_date=target_date)
-    logger.info(f"Hoàn tất kiểm tra điểm danh vắng cho ngày {target_date.strftime('%d/%m/%Y')}")
+    inserted = update_missing_attendance_to_db(target_date=target_date, end_date=end_date)
+    logger.info(f"Hoàn tất kiểm tra điểm danh vắng cho ngày {period_str}")
+    return inserted
 
 
-def update_missing_attendance_to_db(target_date: Optional[date] = None):
+def update_missing_attendance_to_db(target_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
     """
-    Kiểm tra và cập nhật các bản ghi vắng mặt cho một ngày cụ thể.
-    - Lấy danh sách nhân viên trực tiếp từ bảng users.
-    - Hoạt động với kiến trúc database mới.
+    Kiểm tra và cập nhật các bản ghi vắng mặt cho một ngày hoặc một khoảng ngày.
+    TỐI ƯU: Toàn bộ xử lý chạy trong database bằng 1 câu DELETE + 1 câu INSERT ... SELECT ... WHERE NOT EXISTS
+    trong cùng một transaction, thay vì tải nhân viên lên Python và tạo từng bản ghi ORM.
+    Chạy lại nhiều lần cho cùng ngày cho ra cùng kết quả (idempotent).
+    Trả về số bản ghi vắng mặt đã thêm.
     """
     if target_date is None:
-        workday_to_check = datetime.now().date() - timedelta(days=1)
+        workday_start = datetime.now().date() - timedelta(days=1)
     else:
-        workday_to_check = target_date
-    
-    workday_str = workday_to_check.strftime('%d/%m/%Y')
-    
+        workday_start = target_date
+    workday_end = end_date or workday_start
+    if workday_end < workday_start:
+        workday_start, workday_end = workday_end, workday_start
+
+    period_str = f"{workday_start.strftime('%d/%m/%Y')} - {workday_end.strftime('%d/%m/%Y')}"
+    work_days = [workday_start + timedelta(days=i) for i in range((workday_end - workday_start).days + 1)]
+
     with SessionLocal() as db:
         try:
-            # 1. Xóa các bản ghi vắng mặt "Hệ thống" cũ cho ngày này để tránh trùng lặp.
-            db.query(AttendanceRecord).filter(
-                cast(AttendanceRecord.attendance_datetime, Date) == workday_to_check,
+            # 0. Chờ lượt: mỗi lúc chỉ một lần tính lại vắng mặt (khóa tự nhả khi commit/rollback)
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ABSENCE_CHECK_LOCK_KEY})
+
+            # 1. Xóa các bản ghi vắng mặt "Hệ thống" cũ trong khoảng ngày này để tính lại (cùng transaction).
+            deleted = db.query(AttendanceRecord).filter(
+                cast(AttendanceRecord.attendance_datetime, Date).between(workday_start, workday_end),
                 AttendanceRecord.checker_id == None # Giả định checker_id là NULL cho hệ thống
             ).delete(synchronize_session=False)
-            db.commit()
-            logger.info(f"[ABSENCE_CHECK] Đã xóa các bản ghi vắng mặt cũ cho ngày {workday_str}.")
-    
-            # 2. Lấy danh sách ID của các nhân viên đã điểm danh trong "ngày làm việc".
+            logger.info(f"[ABSENCE_CHECK] Đã xóa {deleted} bản ghi vắng mặt cũ cho ngày {period_str}.")
+
+            # 2. Danh sách ngày làm việc cần kiểm tra dưới dạng bảng VALUES.
+            days = values(column("work_day", Date), name="work_days").data([(d,) for d in work_days])
+            work_day = days.c.work_day
             # Ngày làm việc được tính từ 07:00 ngày đó đến 06:59 Sáng hôm sau.
-            start_datetime = datetime.combine(workday_to_check, time(7, 0, 0))
-            end_datetime = start_datetime + timedelta(days=1)
-
-            checked_in_user_ids = {
-                r.user_id for r in db.query(AttendanceRecord.user_id).filter(
-                    AttendanceRecord.attendance_datetime >= start_datetime,
-                    AttendanceRecord.attendance_datetime < end_datetime,
-                    AttendanceRecord.work_units > 0 # Chỉ tính các lần điểm danh có công
-                ).distinct().all()
-            }
-            logger.info(f"[ABSENCE_CHECK] Ngày {workday_str}: Tìm thấy {len(checked_in_user_ids)} nhân viên đã điểm danh.")
-
-            # 3. Lấy danh sách tất cả nhân viên cần điểm danh từ bảng users.
-            employees_to_check = db.query(User).options(
-                joinedload(User.department),
-                joinedload(User.main_branch)
-            ).filter(
+            shift_start = work_day + literal(time(7, 0, 0))
+            shift_end = shift_start + literal(timedelta(days=1))
+
+            checked_in = select(AttendanceRecord.id).where(
+                AttendanceRecord.user_id == User.id,
+                AttendanceRecord.attendance_datetime >= shift_start,
+                AttendanceRecord.attendance_datetime < shift_end,
+                AttendanceRecord.work_units > 0 # Chỉ tính các lần điểm danh có công
+            )
+
+            # 3. Nhân viên cần điểm danh (trừ boss/admin) x ngày làm việc, chưa điểm danh -> vắng mặt.
+            absent_rows = select(
+                User.id,
+                literal(None, type_=BIGINT), # checker_id NULL để nhận biết là do hệ thống tạo
+                User.main_branch_id,
+                User.employee_code,
+                User.name,
+                func.coalesce(Department.name, ''),
+                func.coalesce(Branch.name, ''),
+                work_day + literal(time(23, 59, 0)),
+                literal(0.0),
+                literal(False),
+                literal("Hệ thống: Vắng mặt ngày ") + func.to_char(work_day, 'DD/MM/YYYY'),
+                work_day,
+                literal(ABSENCE_SHIFT_SLOT),
+            ).select_from(User
+            ).join(Department, User.department_id == Department.id
+            ).outerjoin(Branch, User.main_branch_id == Branch.id
+            ).join(days, true()
+            ).where(
                 User.is_active == True,
-                # Loại trừ các vai trò không cần điểm danh
-                User.department_id.in_(
-                    db.query(Department.id).filter(
-                        ~Department.role_code.in_(['boss', 'admin'])
-                    )
-                )
-            ).all()
-
-            # 4. Lọc ra những nhân viên vắng mặt và tạo bản ghi.
-            new_absence_records = []
-            for emp in employees_to_check:
-                if emp.id not in checked_in_user_ids:
-                    absence_record = AttendanceRecord(
-                        user_id=emp.id,
-                        checker_id=None, # NULL để nhận biết là do hệ thống tạo
-                        branch_id=emp.main_branch_id,
-                        
-                        # Dữ liệu snapshot
-                        employee_code_snapshot=emp.employee_code,
-                        employee_name_snapshot=emp.name,
-                        role_snapshot=emp.department.name if emp.department else '',
-                        main_branch_snapshot=emp.main_branch.name if emp.main_branch else '',
-                        
-                        attendance_datetime=datetime.combine(workday_to_check, time(23, 59, 0)),
-                        work_units=0.0,
-                        is_overtime=False,
-                        notes=f"Hệ thống: Vắng mặt ngày {workday_str}"
-                    )
-                    new_absence_records.append(absence_record)
-    
-            if not new_absence_records:
-                logger.info(f"[ABSENCE_CHECK] Ngày {workday_str}: Không có nhân viên nào vắng mặt.")
-                return
-    
-            # 5. Thêm tất cả các bản ghi vắng mặt vào database.
-            db.add_all(new_absence_records)
+                User.main_branch_id.isnot(None),
+                ~Department.role_code.in_(['boss', 'admin']),
+                ~exists(checked_in)
+            )
+
+            # 4. Thêm tất cả các bản ghi vắng mặt bằng một câu lệnh duy nhất.
+            insert_stmt = insert(AttendanceRecord).from_select([
+                AttendanceRecord.user_id,
+                AttendanceRecord.checker_id,
+                AttendanceRecord.branch_id,
+                AttendanceRecord.employee_code_snapshot,
+                AttendanceRecord.employee_name_snapshot,
+                AttendanceRecord.role_snapshot,
+                AttendanceRecord.main_branch_snapshot,
+                AttendanceRecord.attendance_datetime,
+                AttendanceRecord.work_units,
+                AttendanceRecord.is_overtime,
+                AttendanceRecord.notes,
+                AttendanceRecord.work_date,
+                AttendanceRecord.shift_slot,
+            ], absent_rows)
+            inserted = db.execute(insert_stmt).rowcount
             db.commit()
-            logger.info(f"[ABSENCE_CHECK] Ngày {workday_str}: Đã thêm {len(new_absence_records)} bản ghi vắng mặt.")
-    
+
+            if not inserted:
+                logger.info(f"[ABSENCE_CHECK] Ngày {period_str}: Không có nhân viên nào vắng mặt.")
+            else:
+                logger.info(f"[ABSENCE_CHECK] Ngày {period_str}: Đã thêm {inserted} bản ghi vắng mặt.")
+            return inserted
+
         except Exception as e:
             logger.error(f"[ABSENCE_CHECK] Lỗi khi cập nhật điểm danh vắng mặt: {e}", exc_info=True)
             db.rollback()
-            raise
\ No newline at end of file
+            raise
+
+
+@job_handler(ABSENCE_BACKFILL_JOB)
+def _absence_backfill_job(db: Session, payload: dict) -> int:
+    """Chạy bù do admin yêu cầu (tự quản lý session riêng, không dùng `db` của hàng đợi)."""
+    return run_daily_absence_check(
+        target_date=date.fromisoformat(payload["check_date"]),
+        end_date=date.fromisoformat(payload["end_date"]),
+    )
@@ -0,0 +1,79 @@
+# app/services/shift_report_service.py
+from typing import Iterable
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from ..core.config import logger
+from ..db.models import ShiftCloseLog, ShiftReportTransaction, TransactionType
+from .job_queue import job_handler
+
+# Loại việc trong hàng đợi: gỡ giao dịch đã xóa vĩnh viễn khỏi các log kết ca và tính lại doanh thu
+DETACH_CLOSE_LOG_TRANSACTIONS_JOB = "shift_report.detach_close_log_transactions"
+
+_ONLINE_TYPES = (TransactionType.OTA, TransactionType.UNC, TransactionType.CARD, TransactionType.COMPANY_ACCOUNT)
+
+
+def _close_log_revenues(transactions) -> tuple[int, int]:
+    """(doanh thu online, doanh thu chi nhánh) của một lần kết ca."""
+    closed_online_revenue = 0
+    closed_branch_revenue = 0
+    for tx in transactions:
+        if tx.transaction_type in _ONLINE_TYPES:
+            closed_online_revenue += tx.amount
+        elif tx.transaction_type == TransactionType.CASH_EXPENSE:
+            closed_online_revenue -= tx.amount
+        elif tx.transaction_type == TransactionType.BRANCH_ACCOUNT:
+            closed_branch_revenue += tx.amount
+    return closed_online_revenue, closed_branch_revenue
+
+
+def detach_transactions_from_close_logs(db: Session, transaction_ids: Iterable[int]) -> int:
+    """
+    Gỡ các giao dịch (đã xóa vĩnh viễn) khỏi closed_transaction_ids của các log kết ca,
+    tính lại doanh thu từ các giao dịch còn lại; log không còn giao dịch nào thì bị xóa.
+    Chạy lại nhiều lần cho cùng kết quả. Trả về số log đã sửa/xóa. Không commit.
+    """
+    removed_ids = {int(tx_id) for tx_id in transaction_ids}
+    if not removed_ids:
+        return 0
+
+    ids_column = ShiftCloseLog.closed_transaction_ids.cast(JSONB)
+    # ID được lưu dạng số; dữ liệu cũ có thể lưu dạng chuỗi -> khớp cả hai
+    contains_any = or_(*(
+        ids_column.contains([value])
+        for tx_id in removed_ids
+        for value in (tx_id, str(tx_id))
+    ))
+    logs_to_update = db.query(ShiftCloseLog).filter(
+        ShiftCloseLog.closed_transaction_ids.isnot(None),
+        contains_any
+    ).with_for_update().all()
+
+    for log_entry in logs_to_update:
+        current_ids = log_entry.closed_transaction_ids
+        if not isinstance(current_ids, list):
+            logger.warning(f"closed_transaction_ids cho log {log_entry.id} không phải là list: {current_ids}")
+            continue
+
+        remaining_ids = [tx_id for tx_id in current_ids if int(tx_id) not in removed_ids]
+        log_entry.closed_transaction_ids = remaining_ids
+
+        if not remaining_ids:
+            db.delete(log_entry)
+            logger.info(f"ShiftCloseLog {log_entry.id} đã bị xóa do không còn giao dịch nào.")
+            continue
+
+        remaining_transactions = db.query(ShiftReportTransaction).filter(
+            ShiftReportTransaction.id.in_([int(tx_id) for tx_id in remaining_ids])
+        ).all()
+        log_entry.closed_online_revenue, log_entry.closed_branch_revenue = _close_log_revenues(remaining_transactions)
+        logger.info(f"ShiftCloseLog {log_entry.id} đã tính toán lại doanh thu sau khi xóa giao dịch {sorted(removed_ids)}.")
+
+    return len(logs_to_update)
+
+
+@job_handler(DETACH_CLOSE_LOG_TRANSACTIONS_JOB)
+def _detach_close_log_transactions_job(db: Session, payload: dict) -> int:
+    return detach_transactions_from_close_logs(db, payload.get("transaction_ids", []))
@@ -0,0 +1,250 @@
+# app/services/task_due_queue.py
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, object_session
+
+from ..core.config import settings, logger
+from ..core.metrics import timed_job
+from ..core.utils import VN_TZ
+from ..db.models import Task
+from ..db.session import SessionLocal, engine, statement_timeout_ms
+from .task_service import invalidate_task_read_cache
+
+# Số công việc tối đa chuyển sang "Quá hạn" trong một câu UPDATE
+_FLIP_BATCH_SIZE = 200
+# Thức dậy ít nhất mỗi phút để không lệch nhiều nếu đồng hồ hệ thống bị chỉnh
+_MAX_WAIT_SECONDS = 60
+# Lỗi DB khi chuyển trạng thái -> thử lại sau
+_RETRY_DELAY_SECONDS = 30
+# Advisory lock (PostgreSQL, mức session) của tiến trình giữ hàng đợi: cả cụm chỉ một tiến trình lật hạn,
+# các tiến trình khác chờ và thử giành lại sau mỗi _RESYNC_SECONDS
+TASK_DUE_LOCK_KEY = 734503
+# Nạp lại công việc đang chờ từ DB theo chu kỳ này để nhận công việc được thêm/sửa ở tiến trình khác
+# (khi đọc, trạng thái "Quá hạn" luôn được tính lại từ due_date nên độ trễ này không hiện ra giao diện)
+_RESYNC_SECONDS = 300
+
+
+class TaskDueQueue:
+    """
+    Hàng đợi ưu tiên (min-heap) theo hạn hoàn thành của các công việc "Đang chờ".
+    Một luồng nền ngủ tới đúng hạn của công việc gần nhất rồi chuyển các công việc đã tới hạn
+    sang "Quá hạn" theo lô nhỏ, thay cho việc quét toàn bảng định kỳ.
+
+    Công việc bị sửa hạn/hoàn thành/xóa không bị gỡ khỏi heap ngay (xóa lười):
+    `_due_by_id` giữ hạn hiện hành, mục nào trong heap không khớp sẽ bị bỏ qua khi tới lượt.
+
+    Chỉ khởi động ở tiến trình chạy tác vụ nền (RUN_BACKGROUND_WORKERS_IN_WEB hoặc `manage.py worker`);
+    trong số đó chỉ tiến trình giữ TASK_DUE_LOCK_KEY thực sự nạp và lật hạn.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._due_by_id: Dict[int, float] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._stopped = threading.Event()
+        # True khi tiến trình này đang giữ khóa và lật hạn (chỉ khi đó mới nhận thay đổi công việc cục bộ)
+        self._serving = False
+
+    def __len__(self) -> int:
+        return len(self._due_by_id)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def serving(self) -> bool:
+        return self._serving and self.running
+
+    def load(self, db: Session) -> int:
+        """Nạp toàn bộ công việc "Đang chờ" có hạn (kể cả đã quá hạn trong lúc app tắt -> sẽ được chuyển ngay)."""
+        rows = db.query(Task.id, Task.due_date).filter(
+            Task.status == "Đang chờ",
+            Task.due_date.isnot(None)
+        ).all()
+        entries = {task_id: due_date.timestamp() for task_id, due_date in rows}
+        with self._condition:
+            self._due_by_id = entries
+            self._heap = [(due_ts, task_id) for task_id, due_ts in entries.items()]
+            heapq.heapify(self._heap)
+            self._condition.notify()
+        logger.debug(f"Đã nạp {len(entries)} công việc đang chờ vào hàng đợi hạn hoàn thành.")
+        return len(entries)
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="task-due-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def schedule(self, task_id: int, due_date: datetime):
+        """Thêm/cập nhật hạn của một công việc đang chờ."""
+        self._push(task_id, due_date.timestamp())
+
+    def discard(self, task_id: int):
+        """Công việc không còn "Đang chờ" (hoàn thành, xóa, bỏ hạn)."""
+        with self._condition:
+            self._due_by_id.pop(task_id, None)
+
+    def _push(self, task_id: int, due_ts: float):
+        with self._condition:
+            self._due_by_id[task_id] = due_ts
+            heapq.heappush(self._heap, (due_ts, task_id))
+            if self._heap[0] == (due_ts, task_id):
+                # Hạn mới sớm hơn hạn luồng nền đang chờ -> đánh thức để tính lại thời gian ngủ
+                self._condition.notify()
+
+    def _drop_stale_head(self):
+        while self._heap and self._due_by_id.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now_ts: float) -> List[int]:
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now_ts and len(due_ids) < _FLIP_BATCH_SIZE:
+            due_ts, task_id = heapq.heappop(self._heap)
+            if self._due_by_id.get(task_id) == due_ts:
+                del self._due_by_id[task_id]
+                due_ids.append(task_id)
+        return due_ids
+
+    def _run(self):
+        # Luồng riêng có context riêng: đặt timeout của tác vụ nền thay cho mặc định của kết nối
+        statement_timeout_ms.set(settings.DB_JOB_STATEMENT_TIMEOUT_MS)
+        while not self._stopping:
+            try:
+                # Kết nối riêng giữ advisory lock suốt thời gian tiến trình này giữ hàng đợi
+                with engine.connect() as lock_conn:
+                    lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+                    params = {"key": TASK_DUE_LOCK_KEY}
+                    if lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), params).scalar():
+                        logger.info("[TASK_DUE_QUEUE] Tiến trình này giữ hàng đợi hạn hoàn thành.")
+                        self._serving = True
+                        try:
+                            self._serve()
+                        finally:
+                            self._serving = False
+                            try:
+                                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+                            except Exception:
+                                # Không nhả được (mất kết nối) -> bỏ kết nối khỏi pool, khóa tự nhả theo session
+                                lock_conn.invalidate()
+            except Exception as e:
+                logger.error(f"[TASK_DUE_QUEUE] Lỗi hàng đợi hạn hoàn thành, thử lại sau {_RESYNC_SECONDS}s: {e}", exc_info=True)
+            self._stopped.wait(_RESYNC_SECONDS)
+
+    def _serve(self):
+        """Vòng lặp của tiến trình giữ khóa: nạp lại định kỳ và lật các công việc tới hạn cho tới khi stop()."""
+        next_resync = 0.0
+        while True:
+            if time.monotonic() >= next_resync:
+                with SessionLocal() as db:
+                    self.load(db)
+                next_resync = time.monotonic() + _RESYNC_SECONDS
+
+            due_ids: List[int] = []
+            with self._condition:
+                while not self._stopping:
+                    self._drop_stale_head()
+                    timeout = next_resync - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    if self._heap:
+                        delay = self._heap[0][0] - time.time()
+                        if delay <= 0:
+                            due_ids = self._pop_due(time.time())
+                            break
+                        timeout = min(timeout, delay)
+                    self._condition.wait(timeout=min(timeout, _MAX_WAIT_SECONDS))
+                if self._stopping:
+                    return
+
+            if not due_ids:
+                continue
+            try:
+                flip_due_tasks(due_ids)
+            except Exception as e:
+                logger.error(f"[TASK_DUE_QUEUE] Lỗi khi chuyển công việc sang 'Quá hạn': {e}", exc_info=True)
+                retry_ts = time.time() + _RETRY_DELAY_SECONDS
+                for task_id in due_ids:
+                    with self._condition:
+                        if task_id not in self._due_by_id:
+                            self._push(task_id, retry_ts)
+
+
+@timed_job("flip_due_tasks")
+def flip_due_tasks(task_ids: Iterable[int]) -> int:
+    """
+    Chuyển các công việc đã tới hạn sang "Quá hạn".
+    Điều kiện status/due_date được kiểm tra lại trong câu UPDATE nên an toàn khi hàng đợi còn mục cũ
+    (công việc đã hoàn thành hoặc được lùi hạn ở worker khác).
+    """
+    task_ids = list(task_ids)
+    with SessionLocal() as db:
+        try:
+            updated_count = db.query(Task).filter(
+                Task.id.in_(task_ids),
+                Task.status == "Đang chờ",
+                Task.due_date <= datetime.now(VN_TZ)
+            ).update({"status": "Quá hạn"}, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    if updated_count > 0:
+        invalidate_task_read_cache()
+        logger.info(f"[TASK_DUE_QUEUE] Đã chuyển {updated_count} công việc sang trạng thái 'Quá hạn'.")
+    return updated_count
+
+
+# Một instance dùng chung cho toàn bộ process
+task_due_queue = TaskDueQueue()
+
+
+# --- CẬP NHẬT HÀNG ĐỢI KHI CÔNG VIỆC THAY ĐỔI (thêm, sửa, hoàn thành, xóa) ---
+# Ghi lại trong session khi flush, chỉ áp dụng vào hàng đợi sau khi commit thành công.
+def _record_task_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("task_due_changes", {})[target.id] = (target.status, target.due_date)
+
+def _record_task_delete(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("task_due_changes", {})[target.id] = (None, None)
+
+event.listen(Task, "after_insert", _record_task_change)
+event.listen(Task, "after_update", _record_task_change)
+event.listen(Task, "after_delete", _record_task_delete)
+
+@event.listens_for(Session, "after_commit")
+def _apply_task_due_changes(session):
+    changes = session.info.pop("task_due_changes", None)
+    if not changes or not task_due_queue.serving:
+        return
+    for task_id, (status, due_date) in changes.items():
+        if status == "Đang chờ" and due_date is not None:
+            task_due_queue.schedule(task_id, due_date)
+        else:
+            task_due_queue.discard(task_id)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_task_due_changes(session):
+    session.info.pop("task_due_changes", None)
@@ -1,13 +1,16 @@
 # app/services/task_service.py
+import threading
+import time
 from sqlalchemy.orm import Session
-from typing import Dict, Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 from datetime import datetime, timezone
 
 from ..db.models import Task
 from ..core.utils import VN_TZ
-from ..db.session import SessionLocal
-from ..core.config import logger
-from sqlalchemy import func
+from ..db.session import SessionLocal, engine
+from ..core.config import logger, settings
+from ..core.metrics import timed_job
+from sqlalchemy import func, and_, or_, text
 
 def get_task_stats(db: Session, user_data: dict, branch_id: Optional[int] = None) -> Dict[str, int]:
     """
@@ -52,6 +55,69 @@ def get_task_stats(db: Session, user_data: dict, branch_id: Optional[int] = None
     return stats
 
 
+# --- THÊM: CACHE KẾT QUẢ ĐỌC TỪ BẢNG TASKS (thống kê, sự kiện lịch, ...) THEO BỘ LỌC ---
+# khóa (loại, bộ lọc...) -> (hết hạn lúc, thế hệ, kết quả).
+# "Thế hệ" là trạng thái của sequence task_read_generation trong PostgreSQL, tăng sau mỗi lần ghi công việc ở BẤT KỲ
+# tiến trình nào (worker web, tiến trình tác vụ nền) -> cache của mọi worker hết hiệu lực ngay, không chờ TTL.
+# Thế hệ được đọc TRƯỚC khi tính nên kết quả tính dở trong lúc có thay đổi sẽ không được dùng lại.
+_TASK_READ_CACHE_MAX_ENTRIES = 512
+_TASK_READ_GENERATION_SEQUENCE = "task_read_generation"
+_task_read_cache: Dict[tuple, tuple] = {}
+_task_read_lock = threading.Lock()
+
+
+def _current_task_read_generation(db: Session) -> Optional[tuple]:
+    """(last_value, is_called) của sequence; None nếu không đọc được (chưa migrate) -> không dùng cache."""
+    try:
+        return tuple(db.execute(text(f"SELECT last_value, is_called FROM {_TASK_READ_GENERATION_SEQUENCE}")).one())
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Không đọc được thế hệ cache công việc, bỏ qua cache: {e}")
+        return None
+
+
+def get_cached_task_read(db: Session, cache_key: tuple, compute: Callable[[], Any]) -> Any:
+    """
+    Trả kết quả đọc đã cache cho khóa `cache_key`, hoặc gọi `compute()` rồi lưu lại.
+    Dùng cho mọi kết quả suy ra từ bảng tasks (thống kê, sự kiện lịch, ...) - phần tử đầu của khóa phân biệt loại.
+    Mỗi lần gọi tốn một truy vấn đọc sequence (thay cho truy vấn gốc khi cache còn đúng).
+    """
+    ttl = settings.TASK_STATS_CACHE_SECONDS
+    if ttl <= 0:
+        return compute()
+
+    generation = _current_task_read_generation(db)
+    if generation is None:
+        return compute()
+    now = time.monotonic()
+    with _task_read_lock:
+        entry = _task_read_cache.get(cache_key)
+    if entry is not None and entry[0] > now and entry[1] == generation:
+        return entry[2]
+
+    value = compute()
+    with _task_read_lock:
+        if len(_task_read_cache) >= _TASK_READ_CACHE_MAX_ENTRIES:
+            _task_read_cache.clear()
+        _task_read_cache[cache_key] = (now + ttl, generation, value)
+    return value
+
+
+def invalidate_task_read_cache():
+    """
+    Gọi sau mỗi lần thêm/sửa/xóa công việc (đã commit): tăng thế hệ trong DB để cache ở mọi tiến trình hết hiệu lực.
+    nextval không phụ thuộc transaction và không khóa dòng nào nên rẻ cả khi ghi dồn dập.
+    """
+    with _task_read_lock:
+        _task_read_cache.clear()
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"SELECT nextval('{_TASK_READ_GENERATION_SEQUENCE}')"))
+    except Exception as e:
+        # Worker khác có thể trả dữ liệu cũ tới hết TASK_STATS_CACHE_SECONDS
+        logger.error(f"Lỗi khi tăng thế hệ cache công việc: {e}", exc_info=True)
+
+
 def is_overdue(task: Task) -> bool:
     """
     Kiểm tra xem công việc có quá hạn không.
@@ -70,10 +136,34 @@ def is_overdue(task: Task) -> bool:
 
     return due_date_aware < now_aware
 
-def update_overdue_tasks_status():
+
+# --- THÊM: TRẠNG THÁI "QUÁ HẠN" TÍNH TẠI THỜI ĐIỂM ĐỌC ---
+# Hàng đợi hạn hoàn thành (task_due_queue) lật trạng thái trong DB đúng lúc tới hạn, nhưng giữa lúc tới hạn
+# và lúc lật (hoặc khi worker khác giữ hàng đợi) vẫn có thể còn "Đang chờ" -> khi đọc luôn tính lại từ due_date.
+def effective_task_status(status: Optional[str], due_date: Optional[datetime], now: Optional[datetime] = None) -> Optional[str]:
+    """Trạng thái hiển thị: công việc "Đang chờ" đã qua hạn được coi là "Quá hạn"."""
+    if status == "Đang chờ" and due_date is not None and due_date < (now or datetime.now(VN_TZ)):
+        return "Quá hạn"
+    return status
+
+
+def overdue_condition(status_column, due_column, now: datetime):
+    """Điều kiện SQL "quá hạn" (đã lật trong DB hoặc đang chờ nhưng đã qua hạn)."""
+    return or_(status_column == "Quá hạn", and_(status_column == "Đang chờ", due_column < now))
+
+
+def pending_condition(status_column, due_column, now: datetime):
+    """Điều kiện SQL "đang chờ" và chưa tới hạn."""
+    return and_(status_column == "Đang chờ", or_(due_column.is_(None), due_column >= now))
+
+@timed_job("update_overdue_tasks")
+def update_overdue_tasks_status() -> int:
     """
-    Tác vụ nền tự động cập nhật trạng thái các công việc từ "Đang chờ" sang "Quá hạn".
+    Quét bù: cập nhật trạng thái các công việc từ "Đang chờ" sang "Quá hạn".
+    Việc lật đúng hạn do task_due_queue đảm nhận; hàm này chỉ chạy thưa để bắt các thay đổi
+    không đi qua ORM (UPDATE hàng loạt, sửa tay trong DB).
     Hàm này tự quản lý session DB để có thể chạy độc lập trong một tiến trình nền (background job).
+    Trả về số công việc đã chuyển trạng thái (ghi vào lịch sử chạy tác vụ).
     """
     with SessionLocal() as db:
         try:
@@ -91,11 +181,14 @@ def update_overdue_tasks_status():
             db.commit()
 
             if updated_count > 0:
+                invalidate_task_read_cache()
                 logger.info(f"[AUTO_UPDATE_STATUS] Đã cập nhật {updated_count} công việc sang trạng thái 'Quá hạn'.")
             else:
                 # Log ở mức DEBUG để tránh làm nhiễu log khi không có gì thay đổi
                 logger.debug("[AUTO_UPDATE_STATUS] Không có công việc nào cần cập nhật trạng thái.")
+            return updated_count
 
         except Exception as e:
             logger.error(f"[AUTO_UPDATE_STATUS] Lỗi khi cập nhật trạng thái công việc quá hạn: {e}", exc_info=True)
-            db.rollback()
\ No newline at end of file
+            db.rollback()
+            raise # Để lịch sử chạy tác vụ ghi nhận lỗi
\ No newline at end of file
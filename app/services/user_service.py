@@ -1,89 +1,150 @@
+import hashlib
+import json
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from ..db.models import User, Branch, Department
+from ..db.models import User, Branch, Department, AppState
 from ..core.config import logger
+from ..core.utils import VN_TZ
+
+# Khóa advisory lock (PostgreSQL) cho việc đồng bộ nhân viên: mỗi lúc chỉ một worker thực hiện
+EMPLOYEE_SYNC_LOCK_KEY = 734501
+# Khóa trong bảng app_state lưu hash của danh sách nhân viên đã áp dụng lần gần nhất
+EMPLOYEE_SOURCE_HASH_KEY = "employees_source_hash"
+_EMPLOYEE_SOURCE_FIELDS = ("employee_id", "code", "name", "role", "branch", "shift", "password")
+# Các cột được ghi đè khi nhân viên đã tồn tại (mật khẩu chỉ ghi đè khi file nguồn có mật khẩu)
+_EMPLOYEE_UPDATE_COLUMNS = ("employee_code", "name", "main_branch_id", "department_id", "shift", "source_hash")
+
 
-def sync_employees_from_source(db: Session, employees_source: list[dict], force_delete: bool = False):
+def _hash_source(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _normalize_employees(employees_source: list[dict]) -> list[dict]:
+    """Chỉ giữ các trường dùng để đồng bộ; trùng employee_id thì bản ghi sau thắng."""
+    records = {}
+    for emp in employees_source:
+        employee_id = (emp.get("employee_id") or "").strip()
+        if not employee_id:
+            continue
+        records[employee_id] = {**{field: emp.get(field) for field in _EMPLOYEE_SOURCE_FIELDS}, "employee_id": employee_id}
+    return list(records.values())
+
+
+def sync_employees_from_source(
+    db: Session,
+    employees_source: list[dict],
+    force_delete: bool = False,
+    skip_if_unchanged: bool = False
+):
     """
     Đồng bộ nhân viên từ file nguồn vào DB theo kiến trúc mới.
     - Sử dụng employee_id làm khóa chính.
     - Liên kết với bảng branches và departments.
+    - Ghi hàng loạt bằng INSERT ... ON CONFLICT (employee_id) DO UPDATE.
+    - skip_if_unchanged=True (lúc khởi động): bỏ qua nếu hash của cả danh sách trùng lần đồng bộ trước,
+      chỉ ghi các nhân viên có hash bản ghi thay đổi, và worker nào không lấy được khóa thì bỏ qua.
     """
+    records = _normalize_employees(employees_source)
+    source_hash = _hash_source(records)
+
+    # Advisory lock theo transaction: tự nhả khi commit/rollback
+    if skip_if_unchanged:
+        locked = db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": EMPLOYEE_SYNC_LOCK_KEY}).scalar()
+        if not locked:
+            db.rollback()
+            logger.info("[SYNC] Worker khác đang đồng bộ nhân viên, bỏ qua.")
+            return
+        state = db.get(AppState, EMPLOYEE_SOURCE_HASH_KEY)
+        if state is not None and state.value == source_hash:
+            db.rollback()
+            logger.info("[SYNC] Danh sách nhân viên không thay đổi kể từ lần đồng bộ trước, bỏ qua.")
+            return
+    else:
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": EMPLOYEE_SYNC_LOCK_KEY})
+
     logger.info("[SYNC] Bắt đầu quá trình đồng bộ nhân viên...")
 
     # 1. Nạp dữ liệu gốc (branches, departments) vào cache để truy vấn nhanh
-    branch_map = {b.branch_code: b.id for b in db.query(Branch).all()}
-    department_map = {d.role_code: d.id for d in db.query(Department).all()}
+    branch_map = dict(db.execute(select(Branch.branch_code, Branch.id)).all())
+    department_map = dict(db.execute(select(Department.role_code, Department.id)).all())
     logger.info(f"[SYNC] Đã nạp {len(branch_map)} chi nhánh và {len(department_map)} phòng ban.")
 
-    # 2. Lấy danh sách nhân viên hiện có trong DB
-    existing_users_dict = {user.employee_id: user for user in db.query(User).all()}
-    source_ids = {emp.get("employee_id", "").strip() for emp in employees_source if emp.get("employee_id")}
+    # 2. Hash bản ghi đã áp dụng của các nhân viên hiện có (chỉ 2 cột, không nạp đối tượng User)
+    existing_hashes = dict(db.execute(select(User.employee_id, User.source_hash)).all())
+    source_ids = {record["employee_id"] for record in records}
 
     # 3. Xóa các nhân viên không còn trong file nguồn (nếu cần)
     if force_delete:
-        ids_to_delete = set(existing_users_dict.keys()) - source_ids
+        ids_to_delete = set(existing_hashes.keys()) - source_ids
         if ids_to_delete:
             db.query(User).filter(User.employee_id.in_(ids_to_delete)).delete(synchronize_session=False)
             logger.info(f"[SYNC] Đã xóa {len(ids_to_delete)} nhân viên: {', '.join(ids_to_delete)}")
 
-    # 4. Thêm mới hoặc cập nhật nhân viên
-    updated_count = 0
-    for emp in employees_source:
-        employee_id = emp.get("employee_id", "").strip()
-        if not employee_id:
-            continue
-
-        # Lấy thông tin từ file và kiểm tra với dữ liệu gốc
-        branch_code = emp.get("branch")
-        role_code = emp.get("role")
-        
+    # 4. Chọn các nhân viên cần thêm mới hoặc cập nhật
+    rows_with_password, rows_without_password = [], []
+    skipped_count = 0
+    for record in records:
+        branch_code = record["branch"]
+        role_code = record["role"]
         branch_id = branch_map.get(branch_code)
         department_id = department_map.get(role_code)
 
         if not branch_id:
-            logger.warning(f"[SYNC] Bỏ qua nhân viên '{emp.get('name')}' vì branch_code '{branch_code}' không tồn tại trong bảng branches.")
+            logger.warning(f"[SYNC] Bỏ qua nhân viên '{record['name']}' vì branch_code '{branch_code}' không tồn tại trong bảng branches.")
+            skipped_count += 1
             continue
         if not department_id:
-            logger.warning(f"[SYNC] Bỏ qua nhân viên '{emp.get('name')}' vì role_code '{role_code}' không tồn tại trong bảng departments.")
+            logger.warning(f"[SYNC] Bỏ qua nhân viên '{record['name']}' vì role_code '{role_code}' không tồn tại trong bảng departments.")
+            skipped_count += 1
             continue
 
-        existing_user = existing_users_dict.get(employee_id)
-        
-        if existing_user:
-            # Cập nhật nhân viên đã có
-            # Kiểm tra xem có sự thay đổi nào không trước khi cập nhật
-            changed = False
-            if existing_user.employee_code != emp.get("code"): existing_user.employee_code = emp.get("code"); changed = True
-            if existing_user.name != emp.get("name"): existing_user.name = emp.get("name"); changed = True
-            if existing_user.main_branch_id != branch_id: existing_user.main_branch_id = branch_id; changed = True
-            if existing_user.department_id != department_id: existing_user.department_id = department_id; changed = True
-            if existing_user.shift != emp.get("shift"): existing_user.shift = emp.get("shift"); changed = True
-            
-            # Chỉ cập nhật mật khẩu nếu có mật khẩu mới trong file nguồn
-            new_password = emp.get("password")
-            if new_password and existing_user.password != new_password:
-                existing_user.password = new_password
-                changed = True
-            
-            if changed:
-                updated_count += 1
-                logger.debug(f"[SYNC] Cập nhật thông tin cho: {employee_id} - {emp.get('name')}")
+        record_hash = _hash_source(record)
+        # Đồng bộ thủ công (skip_if_unchanged=False) ghi lại toàn bộ để sửa cả dữ liệu bị lệch trong DB
+        if skip_if_unchanged and existing_hashes.get(record["employee_id"]) == record_hash:
+            continue
+
+        row = {
+            "employee_id": record["employee_id"],
+            "employee_code": record["code"],
+            "name": record["name"],
+            "main_branch_id": branch_id,
+            "department_id": department_id,
+            "shift": record["shift"],
+            "source_hash": record_hash,
+        }
+        if record["password"]:
+            rows_with_password.append({**row, "password": record["password"]})
         else:
-            # Thêm nhân viên mới
-            new_user = User(
-                employee_id=employee_id,
-                employee_code=emp.get("code"),
-                name=emp.get("name"),
-                password=emp.get("password", "999"), # Mật khẩu mặc định
-                main_branch_id=branch_id,
-                department_id=department_id,
-                shift=emp.get("shift")
-            )
-            db.add(new_user)
-            logger.info(f"[SYNC] Thêm nhân viên mới: {employee_id} - {emp.get('name')}")
-
-    if updated_count > 0:
-        logger.info(f"[SYNC] Đã cập nhật thông tin cho {updated_count} nhân viên.")
+            rows_without_password.append({**row, "password": "999"}) # Mật khẩu mặc định, chỉ dùng khi thêm mới
+
+    # 5. Ghi hàng loạt
+    for rows, overwrite_password in ((rows_with_password, True), (rows_without_password, False)):
+        if not rows:
+            continue
+        stmt = pg_insert(User).values(rows)
+        update_columns = _EMPLOYEE_UPDATE_COLUMNS + (("password",) if overwrite_password else ())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.employee_id],
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+        db.execute(stmt)
+
+    changed_ids = [row["employee_id"] for row in rows_with_password + rows_without_password]
+    new_count = sum(1 for employee_id in changed_ids if employee_id not in existing_hashes)
+    if changed_ids:
+        logger.info(f"[SYNC] Thêm mới {new_count}, cập nhật {len(changed_ids) - new_count} nhân viên.")
+
+    # 6. Lưu hash của cả danh sách. Còn bản ghi bị bỏ qua -> không lưu, lần khởi động sau thử lại.
+    if skipped_count == 0:
+        now = datetime.now(VN_TZ)
+        stmt = pg_insert(AppState).values(key=EMPLOYEE_SOURCE_HASH_KEY, value=source_hash, updated_at=now)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[AppState.key], set_={"value": source_hash, "updated_at": now}
+        ))
 
     db.commit()
-    logger.info("[SYNC] Hoàn tất đồng bộ nhân viên.")
\ No newline at end of file
+    logger.info("[SYNC] Hoàn tất đồng bộ nhân viên.")
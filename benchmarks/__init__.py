@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Các microbenchmark / benchmark hiệu năng. Chạy từng module bằng `python -m benchmarks.<tên>`.
@@ -0,0 +1,123 @@
+# benchmarks/asgi_client.py
+"""
+Client HTTP tối giản gọi thẳng vào ứng dụng ASGI trong cùng process (không qua mạng, không cần httpx).
+Giữ cookie giữa các request (session đăng nhập), không tự theo redirect.
+
+    client = ASGIClient(app)
+    await client.request("POST", "/login", form={"username": "BENCHADMIN", "password": "bench"})
+    response = await client.request("GET", "/shift-report/api", params={"per_page": 100})
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+
+@dataclass
+class ASGIResponse:
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    elapsed: float # giây, tính từ lúc gọi app tới khi nhận hết thân response
+
+    def header(self, name: str) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.headers:
+            if key == name:
+                return value
+        return None
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def encode_body(form: Optional[dict] = None, json_body=None) -> Tuple[bytes, Optional[str]]:
+    """Thân request và content-type tương ứng (form urlencoded hoặc JSON)."""
+    if form is not None:
+        return urlencode(form).encode(), "application/x-www-form-urlencoded"
+    if json_body is not None:
+        return json.dumps(json_body).encode(), "application/json"
+    return b"", None
+
+
+def store_cookie(cookies: Dict[str, str], header_value: str):
+    """Cập nhật cookie jar từ một header Set-Cookie."""
+    name_value = header_value.split(";", 1)[0]
+    name, _, value = name_value.partition("=")
+    name = name.strip()
+    # Starlette xóa session bằng cookie "null" + expires trong quá khứ
+    if not value or value == "null":
+        cookies.pop(name, None)
+    else:
+        cookies[name] = value
+
+
+@dataclass
+class ASGIClient:
+    app: object
+    host: str = "bench.local"
+    cookies: Dict[str, str] = field(default_factory=dict)
+
+    async def request(self, method: str, path: str, params: Optional[dict] = None,
+                      form: Optional[dict] = None, json_body=None, headers: Optional[dict] = None) -> ASGIResponse:
+        body, content_type = encode_body(form, json_body)
+        request_headers = {"host": self.host, "user-agent": "bench-client"}
+        if content_type:
+            request_headers["content-type"] = content_type
+        if body:
+            request_headers["content-length"] = str(len(body))
+        if self.cookies:
+            request_headers["cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        request_headers.update({k.lower(): v for k, v in (headers or {}).items()})
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(params or {}, doseq=True).encode(),
+            "root_path": "",
+            "headers": [(k.encode(), str(v).encode()) for k, v in request_headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": (self.host, 80),
+        }
+
+        request_sent = False
+        response_complete = asyncio.Event()
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # StreamingResponse lắng nghe disconnect song song: chỉ báo ngắt kết nối khi đã nhận hết response
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        status_code = 500
+        response_headers: List[Tuple[str, str]] = []
+        chunks: List[bytes] = []
+
+        async def send(message):
+            nonlocal status_code, response_headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = [(k.decode().lower(), v.decode()) for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_complete.set()
+
+        start = time.perf_counter()
+        await self.app(scope, receive, send)
+        elapsed = time.perf_counter() - start
+
+        for key, value in response_headers:
+            if key == "set-cookie":
+                store_cookie(self.cookies, value)
+        return ASGIResponse(status_code, response_headers, b"".join(chunks), elapsed)
@@ -0,0 +1,100 @@
+# benchmarks/async_concurrency.py
+"""
+Kiểm tra tải hỗn hợp request chậm + nhanh trên một server đang chạy (uvicorn, 1 worker).
+
+Gửi liên tục `--slow-concurrency` request chậm (mặc định: API danh sách Báo cáo ca, per_page lớn)
+đồng thời đo độ trễ của request nhanh (/ping). Khi endpoint chậm chặn event loop (Session sync
+trong `async def`), /ping bị kéo dài theo; với AsyncSession, /ping gần như không đổi.
+
+Chạy:
+    python -m benchmarks.async_concurrency --base-url http://127.0.0.1:8000 \\
+        --cookie "session=<giá trị cookie sau khi đăng nhập>" --slow-concurrency 1,4,16
+"""
+import argparse
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _get(url, cookie=None, timeout=60):
+    request = urllib.request.Request(url, headers={"Cookie": cookie} if cookie else {})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        status = response.status
+    return status, time.perf_counter() - start
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_round(base_url, slow_path, fast_path, cookie, slow_concurrency, fast_requests):
+    """Chạy 1 vòng: giữ `slow_concurrency` request chậm liên tục trong lúc gửi tuần tự `fast_requests` request nhanh."""
+    stop = threading.Event()
+    slow_latencies, slow_errors = [], 0
+    lock = threading.Lock()
+
+    def slow_worker():
+        nonlocal slow_errors
+        while not stop.is_set():
+            try:
+                _, seconds = _get(base_url + slow_path, cookie)
+                with lock:
+                    slow_latencies.append(seconds)
+            except Exception:
+                with lock:
+                    slow_errors += 1
+
+    fast_latencies = []
+    with ThreadPoolExecutor(max_workers=max(1, slow_concurrency)) as pool:
+        for _ in range(slow_concurrency):
+            pool.submit(slow_worker)
+        # Cho các request chậm kịp chiếm server
+        time.sleep(0.5 if slow_concurrency else 0)
+        started = time.perf_counter()
+        for _ in range(fast_requests):
+            _, seconds = _get(base_url + fast_path)
+            fast_latencies.append(seconds)
+        elapsed = time.perf_counter() - started
+        stop.set()
+
+    return {
+        "slow_concurrency": slow_concurrency,
+        "fast_p50_ms": statistics.median(fast_latencies) * 1000,
+        "fast_p95_ms": _percentile(fast_latencies, 95) * 1000,
+        "fast_max_ms": max(fast_latencies) * 1000,
+        "slow_done": len(slow_latencies),
+        "slow_rps": len(slow_latencies) / elapsed if elapsed else 0.0,
+        "slow_p50_ms": statistics.median(slow_latencies) * 1000 if slow_latencies else float("nan"),
+        "slow_errors": slow_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tải hỗn hợp request chậm + nhanh để đo khả năng xử lý đồng thời")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--slow-path", default="/shift-report/api?per_page=500")
+    parser.add_argument("--fast-path", default="/ping")
+    parser.add_argument("--cookie", default=None, help="Cookie session đã đăng nhập (cho endpoint chậm)")
+    parser.add_argument("--slow-concurrency", default="0,1,4,16", help="Danh sách mức đồng thời, phân tách bằng dấu phẩy")
+    parser.add_argument("--fast-requests", type=int, default=50)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.slow_concurrency.split(",") if level.strip()]
+    print(f"Server: {args.base_url}  chậm: {args.slow_path}  nhanh: {args.fast_path}")
+    print(f"{'đồng thời':>9} {'nhanh p50':>10} {'nhanh p95':>10} {'nhanh max':>10} {'chậm rps':>9} {'chậm p50':>10} {'lỗi':>5}")
+    for level in levels:
+        r = run_round(args.base_url, args.slow_path, args.fast_path, args.cookie, level, args.fast_requests)
+        print(
+            f"{r['slow_concurrency']:>9} {r['fast_p50_ms']:>8.1f}ms {r['fast_p95_ms']:>8.1f}ms {r['fast_max_ms']:>8.1f}ms "
+            f"{r['slow_rps']:>9.1f} {r['slow_p50_ms']:>8.1f}ms {r['slow_errors']:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
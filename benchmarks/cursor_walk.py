@@ -0,0 +1,127 @@
+# benchmarks/cursor_walk.py
+"""
+Kiểm tra Keyset Pagination của /attendance/api/results-by-checker trên database đã sinh bằng `benchmarks.datagen`:
+đi hết các trang bằng nextCursor với các cột có nhóm NULL (so_cong, so_luong) và cột boolean (la_tang_ca),
+theo cả hai chiều. Mỗi lượt phải trả HTTP 200 ở mọi trang, không lặp/bỏ sót dòng (so với totalRecords)
+và giá trị cột sắp xếp đúng thứ tự (NULLS LAST). Thứ tự khóa phụ `type` theo collation của DB nên không so
+bằng Python (lặp/bỏ sót ở ranh giới trang đã được kiểm qua số dòng).
+Cursor sai kiểu phải bị từ chối với HTTP 400.
+
+    python -m benchmarks.cursor_walk --per-page 50
+
+Thoát với mã 1 nếu có lỗi (dùng được trong CI).
+"""
+import argparse
+import asyncio
+import sys
+from typing import List
+
+from app.core.utils import encode_cursor
+from app.main import app
+
+from .asgi_client import ASGIClient
+from .datagen import BENCH_ADMIN_CODE, BENCH_PASSWORD
+from .scenarios import load_context
+
+RESULTS_PATH = "/attendance/api/results-by-checker"
+# (sort_by, khóa trong record trả về)
+SORT_KEYS = (("so_cong", "so_cong"), ("so_luong", "so_luong"), ("la_tang_ca", "tang_ca"))
+# Lượt đi trang dừng lại nếu vượt số trang này (cursor lặp vòng)
+_MAX_PAGES = 10000
+
+
+def _is_ordered(values: list, descending: bool) -> bool:
+    """Các giá trị khác NULL đúng chiều sắp xếp và mọi NULL nằm ở cuối."""
+    non_null = [v for v in values if v is not None]
+    if values[:len(non_null)] != non_null:
+        return False
+    return non_null == sorted(non_null, reverse=descending)
+
+
+async def walk(client: ASGIClient, params: dict, sort_by: str, value_key: str, sort_order: str) -> List[str]:
+    errors = []
+    label = f"{sort_by} {sort_order}"
+    query = {**params, "sort_by": sort_by, "sort_order": sort_order}
+    records, total, cursor = [], None, None
+    for page in range(1, _MAX_PAGES + 1):
+        response = await client.request("GET", RESULTS_PATH, params={
+            **query, "include_stats": "1" if cursor is None else "0", **({"cursor": cursor} if cursor else {}),
+        })
+        if response.status_code != 200:
+            return errors + [f"{label}: trang {page} trả HTTP {response.status_code}: {response.body[:200]!r}"]
+        data = response.json()
+        if total is None:
+            total = data["totalRecords"]
+        records.extend(data["records"])
+        cursor = data["nextCursor"]
+        if not data["hasMore"]:
+            break
+        if not cursor:
+            return errors + [f"{label}: trang {page} còn dữ liệu nhưng không có nextCursor"]
+    else:
+        return errors + [f"{label}: quá {_MAX_PAGES} trang, cursor có thể lặp vòng"]
+
+    keys = [(r["type"], r["id"]) for r in records]
+    if len(set(keys)) != len(keys):
+        errors.append(f"{label}: {len(keys) - len(set(keys))} dòng bị lặp giữa các trang")
+    if len(keys) != total:
+        errors.append(f"{label}: đi hết {len(keys)} dòng, totalRecords = {total}")
+    if records and not _is_ordered([r[value_key] for r in records], sort_order == "desc"):
+        errors.append(f"{label}: giá trị cột {value_key} không đúng thứ tự (NULLS LAST)")
+    if not any(r[value_key] is None for r in records) and value_key != "tang_ca":
+        errors.append(f"{label}: bộ dữ liệu không có nhóm NULL, lượt kiểm tra không đi qua nhóm này")
+    print(f"{label:<18} {len(keys):>7} dòng, {page:>5} trang", file=sys.stderr)
+    return errors
+
+
+async def check_invalid_cursors(client: ASGIClient, params: dict) -> List[str]:
+    """Cursor đúng cột/chiều nhưng giá trị sai kiểu -> 400 (không để lỗi SQL thành 500)."""
+    cases = (
+        ("la_tang_ca", "TangCa", 1),
+        ("so_cong", "SoCong", True),
+        ("so_luong", "SoLuong", "12"),
+        ("ma_nv", "MaNV", {"x": 1}),
+    )
+    errors = []
+    for sort_by, column, bad_value in cases:
+        cursor = encode_cursor({"s": column, "o": "desc", "v": bad_value, "t": "Điểm danh", "i": 1})
+        response = await client.request("GET", RESULTS_PATH, params={
+            **params, "sort_by": sort_by, "sort_order": "desc", "cursor": cursor, "include_stats": "0",
+        })
+        if response.status_code != 400:
+            errors.append(f"cursor {sort_by}={bad_value!r}: mong đợi HTTP 400, nhận {response.status_code}")
+    return errors
+
+
+async def run(per_page: int) -> List[str]:
+    ctx = load_context()
+    client = ASGIClient(app)
+    login = await client.request("POST", "/login", form={"username": BENCH_ADMIN_CODE, "password": BENCH_PASSWORD})
+    if login.status_code != 303 or "session" not in client.cookies:
+        raise SystemExit(f"Đăng nhập {BENCH_ADMIN_CODE} thất bại (HTTP {login.status_code}).")
+
+    # Một ngày có cả điểm danh (SoLuong NULL) và dịch vụ (SoCong NULL) để lượt đi trang ngắn mà vẫn qua nhóm NULL
+    params = {"per_page": per_page, "filter_date": ctx.last_attendance.strftime("%Y-%m-%d")}
+    errors = []
+    for sort_by, value_key in SORT_KEYS:
+        for sort_order in ("desc", "asc"):
+            errors.extend(await walk(client, params, sort_by, value_key, sort_order))
+    errors.extend(await check_invalid_cursors(client, params))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra Keyset Pagination của trang kết quả điểm danh")
+    parser.add_argument("--per-page", type=int, default=50)
+    args = parser.parse_args()
+
+    errors = asyncio.run(run(max(1, args.per_page)))
+    for error in errors:
+        print(f"LỖI: {error}", file=sys.stderr)
+    if errors:
+        sys.exit(1)
+    print("OK: mọi lượt đi trang bằng cursor đều đúng.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
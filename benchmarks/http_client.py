@@ -0,0 +1,127 @@
+# benchmarks/http_client.py
+"""
+Client HTTP/1.1 tối giản trên asyncio (không cần aiohttp/httpx) để gửi tải tới một server đang chạy.
+Một client = một kết nối keep-alive + cookie jar riêng, giống một trình duyệt. Cùng giao diện với ASGIClient.
+"""
+import asyncio
+import ssl
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from .asgi_client import ASGIResponse, encode_body, store_cookie
+
+
+class HTTPClient:
+    def __init__(self, base_url: str, timeout: float = 30.0, user_agent: str = "bench-client"):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.use_ssl = parts.scheme == "https"
+        self.port = parts.port or (443 if self.use_ssl else 80)
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.cookies: Dict[str, str] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def request(self, method: str, path: str, params: Optional[dict] = None,
+                      form: Optional[dict] = None, json_body=None, headers: Optional[dict] = None) -> ASGIResponse:
+        body, content_type = encode_body(form, json_body)
+        target = path + ("?" + urlencode(params, doseq=True) if params else "")
+        request_headers = {"host": self.host_header, "user-agent": self.user_agent, "connection": "keep-alive"}
+        if content_type:
+            request_headers["content-type"] = content_type
+        if body or method.upper() in ("POST", "PUT", "PATCH"):
+            request_headers["content-length"] = str(len(body))
+        if self.cookies:
+            request_headers["cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        request_headers.update({k.lower(): v for k, v in (headers or {}).items()})
+
+        head = f"{method.upper()} {target} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in request_headers.items()) + "\r\n"
+        payload = head.encode("latin-1") + body
+
+        start = time.perf_counter()
+        # Kết nối keep-alive có thể đã bị server đóng khi rảnh -> mở lại và gửi lại 1 lần
+        reused = self._writer is not None
+        try:
+            response = await self._send_with_timeout(payload, method)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            start = time.perf_counter()
+            response = await self._send_with_timeout(payload, method)
+        status_code, response_headers, response_body = response
+        elapsed = time.perf_counter() - start
+
+        for key, value in response_headers:
+            if key == "set-cookie":
+                store_cookie(self.cookies, value)
+        return ASGIResponse(status_code, response_headers, response_body, elapsed)
+
+    async def _send_with_timeout(self, payload: bytes, method: str) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        try:
+            return await asyncio.wait_for(self._send(payload, method), self.timeout)
+        except BaseException:
+            # Kết nối ở trạng thái không xác định (đọc dở response) -> bỏ, lần sau mở kết nối mới
+            await self.close()
+            raise
+
+    async def _send(self, payload: bytes, method: str) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port, ssl=ssl.create_default_context() if self.use_ssl else None
+            )
+        self._writer.write(payload)
+        await self._writer.drain()
+        return await self._read_response(method)
+
+    async def _read_response(self, method: str) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        reader = self._reader
+        status_line = await reader.readuntil(b"\r\n")
+        if not status_line.strip():
+            raise ConnectionError("Server đóng kết nối")
+        status_code = int(status_line.split()[1])
+
+        headers: List[Tuple[str, str]] = []
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers.append((key.strip().lower(), value.strip()))
+        header_map = {key: value for key, value in headers}
+
+        if method.upper() == "HEAD" or status_code in (204, 304) or 100 <= status_code < 200:
+            body = b""
+        elif header_map.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # Bỏ qua trailer (nếu có) tới dòng trống
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in header_map:
+            body = await reader.readexactly(int(header_map["content-length"]))
+        else:
+            body = await reader.read()
+            await self.close()
+            return status_code, headers, body
+
+        if header_map.get("connection", "").lower() == "close":
+            await self.close()
+        return status_code, headers, body
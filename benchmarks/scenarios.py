@@ -0,0 +1,273 @@
+# benchmarks/scenarios.py
+"""
+Benchmark các endpoint nặng qua client ASGI trong cùng process, trên database đã sinh bằng `benchmarks.datagen`.
+
+Mỗi kịch bản chạy `--warmup` lần (không tính) rồi `--repeat` lần; ghi lại độ trễ (min/median/p95/max),
+số câu SQL, thời gian DB và kích thước response. Kết quả là JSON (khóa đã sắp xếp) để diff giữa các lần chạy:
+
+    python -m benchmarks.scenarios --output bench/before.json
+    ... sửa code ...
+    python -m benchmarks.scenarios --output bench/after.json --compare bench/before.json
+
+Với --compare: in các kịch bản chậm hơn quá --tolerance (mặc định 20%) hoặc chạy nhiều câu SQL hơn,
+và thoát với mã 1 nếu có hồi quy (dùng được trong CI).
+
+Lưu ý: không chạy sự kiện startup của app (scheduler, đồng bộ nhân viên từ employees.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.core.query_inspector import track_queries
+from app.core.utils import VN_TZ
+from app.db.models import AttendanceRecord, Branch, ShiftReportStatus, ShiftReportTransaction, TransactionType, User
+from app.db.session import SessionLocal
+from app.main import app
+
+from .asgi_client import ASGIClient
+from .datagen import BENCH_ADMIN_CODE, BENCH_PASSWORD, DATASET_TABLES
+
+
+@dataclass
+class BenchContext:
+    """Thông tin về bộ dữ liệu đang có trong DB, dùng để dựng tham số cho các kịch bản."""
+    branch_codes: List[str]
+    last_attendance: datetime
+    admin_id: int
+    table_counts: Dict[str, int]
+
+    @property
+    def branch(self) -> str:
+        return self.branch_codes[0]
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    params: Callable[[BenchContext], dict] = lambda ctx: {}
+    json_body: Optional[Callable[[BenchContext], dict]] = None
+    # Chuẩn bị dữ liệu trước MỖI lần chạy (không tính vào thời gian đo)
+    setup: Optional[Callable[[Session, BenchContext], None]] = None
+    expected_status: tuple = (200,)
+
+
+def _add_pending_transactions(db: Session, ctx: BenchContext, count: int = 20):
+    """Thêm giao dịch PENDING cho chi nhánh đầu tiên để batch-close luôn có dữ liệu để kết."""
+    branch_id = db.query(Branch.id).filter(Branch.branch_code == ctx.branch).scalar()
+    now = datetime.now(VN_TZ)
+    suffix = now.strftime("%H%M%S%f")
+    db.add_all([
+        ShiftReportTransaction(
+            transaction_code=f"{ctx.branch}-BENCH{suffix}{index:03d}", branch_id=branch_id, recorder_id=ctx.admin_id,
+            transaction_type=TransactionType.CARD, amount=100000 + index, room_number="101",
+            transaction_info="benchmark", status=ShiftReportStatus.PENDING, created_datetime=now,
+        )
+        for index in range(count)
+    ])
+    db.commit()
+
+
+def _month_params(ctx: BenchContext) -> dict:
+    return {"month": ctx.last_attendance.month, "year": ctx.last_attendance.year}
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("calendar_view_branch", "GET", "/attendance/calendar-view",
+             params=lambda ctx: {"chi_nhanh": ctx.branch, **_month_params(ctx)}),
+    Scenario("calendar_view_all", "GET", "/attendance/calendar-view", params=_month_params),
+    Scenario("results_by_checker", "GET", "/attendance/api/results-by-checker",
+             params=lambda ctx: {"page": 1, "per_page": 100}),
+    Scenario("results_by_checker_branch", "GET", "/attendance/api/results-by-checker",
+             params=lambda ctx: {"page": 1, "per_page": 100, "filter_cn_lam": ctx.branch}),
+    Scenario("tasks_page_keyset", "GET", "/api/tasks/page",
+             params=lambda ctx: {"chi_nhanh": ctx.branch, "limit": 100}),
+    Scenario("tasks_calendar_events", "GET", "/api/tasks/calendar-events", params=lambda ctx: {
+        "start": ctx.last_attendance.date().replace(day=1).isoformat(),
+        "end": (ctx.last_attendance.date().replace(day=28) + timedelta(days=7)).isoformat(),
+    }),
+    Scenario("shift_report_dashboard_summary", "GET", "/shift-report/api/dashboard-summary"),
+    Scenario("export_tasks", "GET", "/api/tasks/export-excel",
+             params=lambda ctx: {"chi_nhanh": ctx.branch}, expected_status=(200, 204)),
+    Scenario("export_attendance", "GET", "/api/attendance/export-excel",
+             params=lambda ctx: {"filter_cn_lam": ctx.branch}, expected_status=(200, 204)),
+    Scenario("export_calendar", "GET", "/attendance/calendar-export-excel", params=_month_params),
+    Scenario("shift_report_batch_close", "POST", "/shift-report/batch-close",
+             json_body=lambda ctx: {"ids": [], "branch": ctx.branch, "pms_revenue": "0"},
+             setup=_add_pending_transactions),
+]
+
+
+def load_context() -> BenchContext:
+    with SessionLocal() as db:
+        branch_codes = [
+            code for (code,) in db.query(Branch.branch_code).order_by(Branch.id)
+            if code.startswith("B") and code[1:].isdigit()
+        ]
+        admin_id = db.query(User.id).filter(User.employee_code == BENCH_ADMIN_CODE).scalar()
+        last_attendance = db.query(func.max(AttendanceRecord.attendance_datetime)).scalar()
+        table_counts = {table: db.execute(text(f"SELECT count(*) FROM {table}")).scalar() for table in DATASET_TABLES}
+    if not branch_codes or admin_id is None or last_attendance is None:
+        raise SystemExit("Chưa có dữ liệu benchmark. Chạy `python -m benchmarks.datagen` trước.")
+    return BenchContext(branch_codes, last_attendance, admin_id, table_counts)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_scenario(client: ASGIClient, scenario: Scenario, ctx: BenchContext, warmup: int, repeat: int) -> dict:
+    latencies, queries, db_ms, sizes, statuses = [], [], [], [], []
+    for iteration in range(warmup + repeat):
+        if scenario.setup:
+            with SessionLocal() as db:
+                scenario.setup(db, ctx)
+        with track_queries() as tracker:
+            response = await client.request(
+                scenario.method, scenario.path, params=scenario.params(ctx),
+                json_body=scenario.json_body(ctx) if scenario.json_body else None,
+            )
+        if iteration < warmup:
+            continue
+        statuses.append(response.status_code)
+        latencies.append(response.elapsed * 1000)
+        queries.append(tracker.count)
+        db_ms.append(tracker.total_seconds * 1000)
+        sizes.append(len(response.body))
+
+    unexpected = sorted({status for status in statuses if status not in scenario.expected_status})
+    return {
+        "method": scenario.method,
+        "path": scenario.path,
+        "runs": repeat,
+        "status": statuses[-1],
+        "errors": sum(1 for status in statuses if status not in scenario.expected_status),
+        "unexpected_status": unexpected,
+        "min_ms": round(min(latencies), 2),
+        "median_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "max_ms": round(max(latencies), 2),
+        "queries": int(statistics.median(queries)),
+        "db_median_ms": round(statistics.median(db_ms), 2),
+        "response_bytes": int(statistics.median(sizes)),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_all(selected: List[Scenario], warmup: int, repeat: int) -> dict:
+    ctx = load_context()
+    client = ASGIClient(app)
+    login = await client.request("POST", "/login", form={"username": BENCH_ADMIN_CODE, "password": BENCH_PASSWORD})
+    if login.status_code != 303 or "session" not in client.cookies:
+        raise SystemExit(f"Đăng nhập {BENCH_ADMIN_CODE} thất bại (HTTP {login.status_code}).")
+
+    results = {}
+    for scenario in selected:
+        results[scenario.name] = await run_scenario(client, scenario, ctx, warmup, repeat)
+        r = results[scenario.name]
+        print(
+            f"{scenario.name:<34} {r['median_ms']:>9.1f}ms p95 {r['p95_ms']:>9.1f}ms "
+            f"{r['queries']:>4} SQL {r['response_bytes']:>10} B  HTTP {r['status']}",
+            file=sys.stderr,
+        )
+
+    return {
+        "meta": {
+            "generated_at": datetime.now(VN_TZ).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "warmup": warmup,
+            "repeat": repeat,
+            "dataset": {
+                "branches": len(ctx.branch_codes),
+                "last_attendance": ctx.last_attendance.isoformat(),
+                "rows": ctx.table_counts,
+            },
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Danh sách hồi quy so với baseline: chậm hơn quá `tolerance` (theo median), thêm câu SQL, hoặc có lỗi mới."""
+    regressions = []
+    if baseline.get("meta", {}).get("dataset") != current["meta"]["dataset"]:
+        print("CẢNH BÁO: bộ dữ liệu khác với baseline, kết quả so sánh có thể không chính xác.", file=sys.stderr)
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if result["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: median {before['median_ms']}ms -> {result['median_ms']}ms")
+        if result["queries"] > before["queries"]:
+            regressions.append(f"{name}: số câu SQL {before['queries']} -> {result['queries']}")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name}: lỗi {before['errors']} -> {result['errors']} (HTTP {result['unexpected_status']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các endpoint nặng trên bộ dữ liệu giả lập")
+    parser.add_argument("--scenario", action="append", help="Chỉ chạy kịch bản này (lặp lại được). Mặc định: tất cả")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="-", help="File JSON kết quả ('-' = stdout)")
+    parser.add_argument("--compare", help="File JSON baseline để phát hiện hồi quy")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ngưỡng chậm hơn cho phép (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="Liệt kê các kịch bản rồi thoát")
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<34} {scenario.method} {scenario.path}")
+        return
+
+    selected = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    if not selected:
+        raise SystemExit(f"Không có kịch bản nào khớp: {args.scenario}")
+
+    report = asyncio.run(run_all(selected, args.warmup, max(1, args.repeat)))
+    output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output == "-":
+        print(output)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"HỒI QUY  {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("Không phát hiện hồi quy.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# benchmarks/shift_change_load.py
+"""
+Kiểm tra tải giờ giao ca (07:00 / 19:00): mọi chi nhánh cùng lúc đăng nhập, hiện QR, chờ điểm danh,
+điểm danh hàng loạt buồng phòng và mở danh sách công việc / báo cáo giao ca.
+
+Mỗi chi nhánh là một "luồng giao ca" với 2 client (cookie riêng), đi đúng các route thật:
+    máy tính:   POST /login -> GET /attendance/show_qr -> GET /attendance/checkin_status (poll mỗi --poll-interval giây)
+    điện thoại: GET /attendance/checkin?token=... -> POST /attendance/checkin_bulk -> POST /attendance/checkin_success
+    máy tính:   (checkin_status báo đã điểm danh) -> GET /tasks -> GET /shift-report/api
+
+Báo cáo p50/p95/p99/max và số lỗi theo từng bước, cùng thời gian hoàn tất cả luồng.
+
+Dữ liệu: dùng bộ dữ liệu của `benchmarks.datagen` (mật khẩu chung, mã lễ tân B<n>LT01 / B<n>LT02).
+Trước mỗi vòng, log điểm danh hôm nay của các lễ tân tham gia được xóa để luồng QR chạy lại từ đầu
+(ghi vào DB trong DATABASE_URL -> cùng điều kiện tên database "bench" như datagen).
+
+Chạy với server thật (khuyến nghị, đo cả uvicorn/mạng):
+    python -m benchmarks.shift_change_load --base-url http://127.0.0.1:8000 --branches 15 --rounds 3
+Chạy trong cùng process (không cần server, tương đương 1 worker):
+    python -m benchmarks.shift_change_load --branches 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from app.core.utils import VN_TZ
+from app.db.models import AttendanceLog, AttendanceRecord, Branch, Department, User
+from app.db.session import SessionLocal
+
+from .asgi_client import ASGIClient
+from .datagen import BENCH_PASSWORD, check_target_database
+from .http_client import HTTPClient
+
+_QR_TOKEN_RE = re.compile(r"checkin_status\?token=([^&\"'`]+)")
+_CSRF_TOKEN_RE = re.compile(r'const csrfToken = "([^"]+)"')
+
+STEPS = [
+    "login", "show_qr", "checkin_status", "phone_checkin_page", "checkin_bulk",
+    "checkin_success", "tasks", "shift_report_api",
+]
+
+
+@dataclass
+class BranchRoster:
+    branch_code: str
+    letan_code: str
+    letan_id: int
+    housekeeping_codes: List[str]
+
+
+class FlowAborted(Exception):
+    """Một bước của luồng giao ca lỗi -> dừng luồng của chi nhánh đó (lỗi đã được ghi nhận)."""
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {step: [] for step in STEPS}
+        self.errors: Dict[str, int] = {step: 0 for step in STEPS}
+        self.error_samples: List[str] = []
+        self.flow_seconds: List[float] = []
+        self.flows_failed = 0
+
+    def record(self, step: str, seconds: float):
+        self.latencies.setdefault(step, []).append(seconds)
+
+    def error(self, step: str, message: str):
+        self.errors[step] = self.errors.get(step, 0) + 1
+        if len(self.error_samples) < 20:
+            self.error_samples.append(f"{step}: {message}")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summary(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(_percentile(values, 50) * 1000, 2),
+        "p95_ms": round(_percentile(values, 95) * 1000, 2),
+        "p99_ms": round(_percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+async def _step(stats: LoadStats, name: str, call, expected=(200,)):
+    try:
+        response = await call
+    except Exception as e:
+        stats.error(name, f"{type(e).__name__}: {e}")
+        raise FlowAborted(name)
+    stats.record(name, response.elapsed)
+    if response.status_code not in expected:
+        stats.error(name, f"HTTP {response.status_code} {response.body[:200]!r}")
+        raise FlowAborted(name)
+    return response
+
+
+# --- DỮ LIỆU ---
+def load_rosters(branches: int, shift: str) -> List[BranchRoster]:
+    """Lễ tân của ca (CS = ca sáng, CT = ca tối) và buồng phòng của N chi nhánh đầu tiên."""
+    with SessionLocal() as db:
+        branch_codes = [
+            code for (code,) in db.query(Branch.branch_code).order_by(Branch.id)
+            if code.startswith("B") and code[1:].isdigit()
+        ][:branches]
+        users = db.query(User).join(Department).join(Branch, User.main_branch_id == Branch.id).options(
+            joinedload(User.department), joinedload(User.main_branch)
+        ).filter(Branch.branch_code.in_(branch_codes), User.is_active == True).order_by(User.employee_code).all()
+
+    rosters = []
+    for code in branch_codes:
+        staff = [u for u in users if u.main_branch.branch_code == code]
+        letans = [u for u in staff if u.department.role_code == "letan"]
+        letan = next((u for u in letans if u.shift == shift), letans[0] if letans else None)
+        if letan is None:
+            continue
+        rosters.append(BranchRoster(
+            branch_code=code, letan_code=letan.employee_code, letan_id=letan.id,
+            housekeeping_codes=[u.employee_code for u in staff if u.department.role_code == "buongphong"],
+        ))
+    if not rosters:
+        raise SystemExit("Không tìm thấy chi nhánh/lễ tân. Chạy `python -m benchmarks.datagen` trước.")
+    return rosters
+
+
+def reset_checkins(rosters: List[BranchRoster]):
+    """Xóa log QR và bản ghi điểm danh gần đây của các lễ tân tham gia để luồng giao ca chạy lại từ đầu."""
+    letan_ids = [roster.letan_id for roster in rosters]
+    since = datetime.now(VN_TZ).date() - timedelta(days=1)
+    with SessionLocal() as db:
+        db.query(AttendanceLog).filter(
+            AttendanceLog.user_id.in_(letan_ids), AttendanceLog.work_date >= since
+        ).delete(synchronize_session=False)
+        db.query(AttendanceRecord).filter(
+            or_(AttendanceRecord.checker_id.in_(letan_ids), AttendanceRecord.user_id.in_(letan_ids)),
+            AttendanceRecord.work_date >= since,
+        ).delete(synchronize_session=False)
+        db.commit()
+
+
+# --- LUỒNG GIAO CA CỦA MỘT CHI NHÁNH ---
+async def run_branch_flow(make_client: Callable, roster: BranchRoster, args, stats: LoadStats, rng: random.Random):
+    desktop, phone = make_client(), make_client()
+    started = time.perf_counter()
+    poll_task: Optional[asyncio.Task] = None
+    try:
+        login = await _step(stats, "login", desktop.request(
+            "POST", "/login", form={"username": roster.letan_code, "password": BENCH_PASSWORD}
+        ), expected=(303,))
+
+        if (login.header("location") or "").endswith("/show_qr"):
+            page = await _step(stats, "show_qr", desktop.request("GET", "/attendance/show_qr"))
+            match = _QR_TOKEN_RE.search(page.body.decode("utf-8", "replace"))
+            if not match:
+                stats.error("show_qr", "không tìm thấy token QR trong trang")
+                raise FlowAborted("show_qr")
+            token = match.group(1)
+
+            async def poll_checkin_status():
+                # Trang show_qr hỏi định kỳ cho tới khi điện thoại điểm danh xong
+                deadline = time.perf_counter() + args.max_wait
+                while time.perf_counter() < deadline:
+                    await asyncio.sleep(args.poll_interval)
+                    response = await _step(stats, "checkin_status", desktop.request(
+                        "GET", "/attendance/checkin_status", params={"token": token, "t": int(time.time() * 1000)}
+                    ))
+                    if response.json().get("checked_in"):
+                        return
+                stats.error("checkin_status", f"quá {args.max_wait}s vẫn chưa điểm danh")
+                raise FlowAborted("checkin_status")
+
+            poll_task = asyncio.create_task(poll_checkin_status())
+
+            # Thời gian lễ tân cầm điện thoại quét QR
+            await asyncio.sleep(args.scan_delay * rng.uniform(0.5, 1.5))
+            checkin_page = await _step(stats, "phone_checkin_page", phone.request(
+                "GET", "/attendance/checkin", params={"token": token}
+            ))
+            match = _CSRF_TOKEN_RE.search(checkin_page.body.decode("utf-8", "replace"))
+            if not match:
+                stats.error("phone_checkin_page", "không tìm thấy CSRF token trong trang điểm danh")
+                raise FlowAborted("phone_checkin_page")
+            await _step(stats, "checkin_bulk", phone.request(
+                "POST", "/attendance/checkin_bulk", headers={"X-CSRF-Token": match.group(1)},
+                json_body=[
+                    {"ma_nv": code, "chi_nhanh_lam": roster.branch_code, "so_cong_nv": 1.0, "la_tang_ca": False, "ghi_chu": ""}
+                    for code in roster.housekeeping_codes
+                ],
+            ))
+            await _step(stats, "checkin_success", phone.request(
+                "POST", "/attendance/checkin_success", json_body={"token": token}
+            ))
+            await poll_task
+
+        await _step(stats, "tasks", desktop.request("GET", "/tasks"))
+        await _step(stats, "shift_report_api", desktop.request(
+            "GET", "/shift-report/api", params={"page": 1, "per_page": args.per_page}
+        ))
+        stats.flow_seconds.append(time.perf_counter() - started)
+    except FlowAborted:
+        stats.flows_failed += 1
+    finally:
+        if poll_task is not None and not poll_task.done():
+            poll_task.cancel()
+        for client in (desktop, phone):
+            if isinstance(client, HTTPClient):
+                await client.close()
+
+
+async def run_load(args) -> dict:
+    rosters = load_rosters(args.branches, "CS" if args.shift == "day" else "CT")
+    if args.base_url:
+        make_client = lambda: HTTPClient(args.base_url, timeout=args.timeout)
+        target = args.base_url
+    else:
+        from app.main import app
+        make_client = lambda: ASGIClient(app)
+        target = "in-process"
+
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    for round_index in range(args.rounds):
+        if not args.no_reset:
+            reset_checkins(rosters)
+        print(f"Vòng {round_index + 1}/{args.rounds}: {len(rosters)} chi nhánh giao ca đồng thời...", file=sys.stderr)
+
+        async def delayed_flow(roster, delay):
+            await asyncio.sleep(delay)
+            await run_branch_flow(make_client, roster, args, stats, rng)
+
+        await asyncio.gather(*(
+            delayed_flow(roster, rng.uniform(0, args.ramp_up)) for roster in rosters
+        ))
+    wall_seconds = time.perf_counter() - started
+
+    total_requests = sum(len(values) for values in stats.latencies.values())
+    return {
+        "config": {
+            "target": target, "branches": len(rosters), "rounds": args.rounds, "shift": args.shift,
+            "poll_interval": args.poll_interval, "scan_delay": args.scan_delay, "ramp_up": args.ramp_up,
+        },
+        "steps": {step: {**_summary(values), "errors": stats.errors.get(step, 0)} for step, values in stats.latencies.items()},
+        "flows": {**_summary(stats.flow_seconds), "failed": stats.flows_failed},
+        "total_requests": total_requests,
+        "total_errors": sum(stats.errors.values()),
+        "requests_per_second": round(total_requests / wall_seconds, 2) if wall_seconds else 0.0,
+        "wall_seconds": round(wall_seconds, 2),
+        "error_samples": stats.error_samples,
+    }
+
+
+def _print_report(report: dict):
+    def fmt(summary, key):
+        return f"{summary[key]:>9.1f}" if key in summary else f"{'-':>9}"
+
+    print(f"\nĐích: {report['config']['target']}  chi nhánh: {report['config']['branches']}  vòng: {report['config']['rounds']}")
+    print(f"{'bước':<20} {'số req':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'lỗi':>5}")
+    for step, summary in report["steps"].items():
+        print(f"{step:<20} {summary['count']:>7} {fmt(summary, 'p50_ms')} {fmt(summary, 'p95_ms')} "
+              f"{fmt(summary, 'p99_ms')} {fmt(summary, 'max_ms')} {summary['errors']:>5}")
+    flows = report["flows"]
+    print(f"{'cả luồng giao ca':<20} {flows['count']:>7} {fmt(flows, 'p50_ms')} {fmt(flows, 'p95_ms')} "
+          f"{fmt(flows, 'p99_ms')} {fmt(flows, 'max_ms')} {flows['failed']:>5}")
+    print(f"Tổng: {report['total_requests']} request, {report['total_errors']} lỗi, "
+          f"{report['requests_per_second']} req/s trong {report['wall_seconds']}s")
+    for sample in report["error_samples"]:
+        print(f"  LỖI {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra tải giờ giao ca (đăng nhập, QR, điểm danh, công việc)")
+    parser.add_argument("--base-url", default=None, help="Server đang chạy (vd. http://127.0.0.1:8000). Bỏ trống = chạy trong process")
+    parser.add_argument("--branches", type=int, default=10, help="Số chi nhánh giao ca đồng thời")
+    parser.add_argument("--rounds", type=int, default=1, help="Số lần lặp lại đợt giao ca")
+    parser.add_argument("--shift", choices=["day", "night"], default="day", help="day = 07:00 (lễ tân CS), night = 19:00 (lễ tân CT)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Chu kỳ trang show_qr hỏi checkin_status (giây)")
+    parser.add_argument("--scan-delay", type=float, default=5.0, help="Thời gian trung bình từ lúc hiện QR tới lúc quét (giây)")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Các chi nhánh bắt đầu rải rác trong khoảng này (giây)")
+    parser.add_argument("--max-wait", type=float, default=60.0, help="Thời gian tối đa chờ điểm danh (giây)")
+    parser.add_argument("--per-page", type=int, default=50, help="per_page của /shift-report/api")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout mỗi request khi gọi server thật (giây)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Ghi kết quả JSON ra file")
+    parser.add_argument("--no-reset", action="store_true", help="Không xóa log điểm danh hôm nay trước mỗi vòng")
+    parser.add_argument("--allow-any-db", action="store_true", help="Cho phép reset trên database không có chữ 'bench' trong tên")
+    args = parser.parse_args()
+
+    if not args.no_reset:
+        check_target_database(args.allow_any_db)
+
+    report = asyncio.run(run_load(args))
+    _print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+    if report["total_errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
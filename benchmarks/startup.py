@@ -0,0 +1,156 @@
+# benchmarks/startup.py
+"""
+Đo thời gian khởi động một worker: import `app.main` trong process mới với `python -X importtime`,
+thời gian import, RSS tối đa và các package tốn thời gian import nhất.
+
+    python -m benchmarks.startup --repeat 5 --output bench/startup.json
+    python -m benchmarks.startup --run-startup          # chạy cả sự kiện startup (cần DB), báo app_startup_seconds
+    python -m benchmarks.startup --compare bench/startup.json
+
+Các thư viện chỉ dùng khi xuất file (openpyxl) không được có mặt sau khi import app.main;
+nếu có, benchmark liệt kê trong "eager_optional_imports" và thoát với mã 1.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Thư viện chỉ cần khi xuất Excel / tích hợp ngoài -> phải được import lười
+LAZY_ONLY_PACKAGES = ("openpyxl", "googleapiclient", "gspread", "pandas")
+
+# Chạy trong process con: import app.main (và tùy chọn chạy startup), in kết quả JSON ra stdout
+_CHILD_SCRIPT = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+import app.main
+import_seconds = time.perf_counter() - started
+startup = {}
+if sys.argv[1] == "1":
+    import asyncio
+    from app.core.metrics import STARTUP_DURATION
+    asyncio.run(app.main.app.router.startup())
+    startup = {labels[0]: value for labels, value in STARTUP_DURATION._values.items()}
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "loaded_roots": sorted({name.split(".")[0] for name in sys.modules}),
+    "startup": startup,
+}))
+sys.stdout.flush()
+os._exit(0) # Không chờ scheduler/luồng nền dừng
+"""
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Tổng thời gian import riêng (self, µs) theo package gốc từ output của -X importtime."""
+    per_package: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        # "import time:  <self µs> | <cumulative µs> | <tên module (thụt lề theo độ sâu)>"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line.split("|")
+        if len(parts) != 3:
+            continue
+        self_us = parts[0].replace("import time:", "").strip()
+        name = parts[2].strip()
+        if self_us.isdigit() and name:
+            per_package[name.split(".")[0]] += int(self_us)
+    return dict(per_package)
+
+
+def run_once(run_startup: bool) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD_SCRIPT, "1" if run_startup else "0"],
+        cwd=REPO_ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f"Import app.main thất bại (mã {result.returncode}).")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["packages_us"] = parse_importtime(result.stderr)
+    return report
+
+
+def summarize(runs: List[dict], top: int) -> dict:
+    package_totals: Dict[str, List[float]] = defaultdict(list)
+    for run in runs:
+        for package, micros in run["packages_us"].items():
+            package_totals[package].append(micros)
+    top_packages = sorted(
+        ((package, statistics.median(values) / 1000) for package, values in package_totals.items()),
+        key=lambda item: item[1], reverse=True,
+    )[:top]
+    startup_phases = defaultdict(list)
+    for run in runs:
+        for phase, seconds in run["startup"].items():
+            startup_phases[phase].append(seconds)
+    last = runs[-1]
+    return {
+        "runs": len(runs),
+        "import_median_ms": round(statistics.median(r["import_seconds"] for r in runs) * 1000, 1),
+        "import_min_ms": round(min(r["import_seconds"] for r in runs) * 1000, 1),
+        "max_rss_mb": round(statistics.median(r["max_rss_kb"] for r in runs) / 1024, 1),
+        "modules": last["modules"],
+        "top_packages_ms": {package: round(ms, 1) for package, ms in top_packages},
+        "eager_optional_imports": [name for name in LAZY_ONLY_PACKAGES if name in last["loaded_roots"]],
+        "startup_seconds": {phase: round(statistics.median(values), 3) for phase, values in startup_phases.items()},
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for key in ("import_median_ms", "max_rss_mb"):
+        if key in baseline and current[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]} -> {current[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian import/khởi động và RSS của một worker")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Số package tốn thời gian import nhất cần liệt kê")
+    parser.add_argument("--run-startup", action="store_true", help="Chạy cả sự kiện startup của app (cần DB)")
+    parser.add_argument("--output", default="-", help="File JSON kết quả ('-' = stdout)")
+    parser.add_argument("--compare", help="File JSON baseline để phát hiện hồi quy")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ngưỡng chậm hơn / tốn RAM hơn cho phép (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    runs = [run_once(args.run_startup) for _ in range(max(1, args.repeat))]
+    report = summarize(runs, args.top)
+
+    print(f"import app.main: median {report['import_median_ms']} ms, RSS {report['max_rss_mb']} MB, "
+          f"{report['modules']} module", file=sys.stderr)
+    for package, ms in report["top_packages_ms"].items():
+        print(f"  {package:<28} {ms:>9.1f} ms", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output == "-":
+        print(output)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    failed = False
+    if report["eager_optional_imports"]:
+        print(f"LỖI  import sẵn thư viện chỉ dùng khi xuất file: {report['eager_optional_imports']}", file=sys.stderr)
+        failed = True
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for line in compare(report, baseline, args.tolerance):
+            print(f"HỒI QUY  {line}", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# manage.py
+"""
+Lệnh quản trị chạy lúc deploy (trước khi khởi động các worker uvicorn):
+
+    python manage.py migrate      # tạo bảng, nâng cấp schema, đồng bộ sequence
+    python manage.py bootstrap    # migrate + đồng bộ nhân viên từ employees.py
+    python manage.py worker       # tiến trình tác vụ nền: scheduler + hàng đợi việc background_jobs + hạn công việc
+
+Worker khi khởi động chỉ kết nối DB, không lặp lại các bước này
+(trừ khi bật RUN_BOOTSTRAP_ON_STARTUP, tiện cho môi trường dev một process).
+Khi chạy `worker` riêng, đặt RUN_BACKGROUND_WORKERS_IN_WEB=False cho các worker web.
+"""
+import argparse
+import signal
+import sys
+import time
+
+from app.db.bootstrap import BOOTSTRAP_STEPS, MIGRATE_STEPS, run_steps
+
+
+COMMANDS = {
+    "migrate": MIGRATE_STEPS,
+    "bootstrap": BOOTSTRAP_STEPS,
+}
+
+
+def run_worker():
+    """Chạy scheduler, hàng đợi hạn công việc và xử lý hàng đợi việc ở tiền cảnh tới khi nhận SIGINT/SIGTERM."""
+    from app.services.job_queue import JobQueueWorker
+    from app.services.job_runner import build_scheduler
+    from app.services.task_due_queue import task_due_queue
+
+    worker = JobQueueWorker()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.stop())
+    scheduler = build_scheduler()
+    scheduler.start()
+    task_due_queue.start()
+    try:
+        worker.run_forever()
+    finally:
+        task_due_queue.stop()
+        scheduler.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Khởi tạo database và chạy tác vụ nền cho Bin Bin Hotel Management System")
+    parser.add_argument(
+        "command", choices=sorted(COMMANDS) + ["worker"],
+        help="migrate: schema + sequence; bootstrap: migrate + nhân viên; worker: scheduler + hàng đợi việc"
+    )
+    parser.add_argument("--no-wait", action="store_true", help="Thoát ngay nếu tiến trình khác đang giữ khóa bootstrap")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker()
+        return
+
+    started = time.perf_counter()
+    try:
+        timings = run_steps(COMMANDS[args.command], wait=not args.no_wait)
+    except Exception as e:
+        print(f"{args.command} thất bại: {e}", file=sys.stderr)
+        sys.exit(1)
+    if timings is None:
+        print("Tiến trình khác đang khởi tạo database.", file=sys.stderr)
+        sys.exit(1)
+    for name, seconds in timings.items():
+        print(f"  {name:<18} {seconds:>8.2f}s")
+    print(f"{args.command} hoàn tất sau {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()